@@ -0,0 +1,47 @@
+"""
+Bots the algo host loads from Mongo.
+
+MongoDB.get_active_bots runs its queries on an in-memory Mongo
+(mongomock) with accounts and bots in every state: only bots of an
+account which are in the active state must be returned, paused, stopped
+and bots of no account are not run by the host.
+
+Usage: python active_bots_check.py
+"""
+import os
+import sys
+import mongomock
+from bson.objectid import ObjectId
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs.mongo import MongoDB
+
+
+def main():
+    db = MongoDB.__new__(MongoDB)
+    db.logger = None
+    db.db = mongomock.MongoClient()["trading"]
+    states = ['active', 'paused', 'stopped', 'active', 'paused', 'active']
+    bot_ids = [ObjectId() for state in states]
+    db.db['bots'].insert_many([
+        {'_id': bot_id, 'state': state} for bot_id, state in zip(bot_ids, states)
+        ])
+    # the last bot is in no account
+    db.db['accounts'].insert_many([
+        {'bots': [str(bot_id) for bot_id in bot_ids[:3]]},
+        {'bots': [str(bot_id) for bot_id in bot_ids[3:5]]}
+        ])
+
+    expected = {
+        str(bot_id) for bot_id, state in zip(bot_ids[:5], states)\
+            if state == MongoDB.active_bot_state
+        }
+    res = set(db.get_active_bots())
+    ok = res == expected
+    print(f"{len(res)} of {len(bot_ids)} bots loaded, {len(expected)} active in accounts: {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+CPU and memory of N Cross_MA bots in one AlgoHost against N processes
+running one bot each, the way algo.py runs in its own container.
+
+Services are replaced by an in-memory candle source with the reader's
+semantics (closes after from_timestamp up to the current time). Bots
+are spread over pairs with windows from a small grid, so bots of a
+pair share windows as they do in practice.
+
+First hosted bots are checked against standalone Cross_MA on the same
+candles: operations must be the same, and averages of a feed with less
+history than its windows are checked against the history. A pair which
+gets no candles must not slow down polling of the others. Then the host
+runs all bots in a fresh process, and a sample of bots run one per fresh
+process. Every process reports its CPU time for start up (history and
+warm up, imports excluded) and for the candles, and its resident memory.
+Per process numbers of the sample are scaled to N. Container overhead
+(runtime, image layers) comes on top of the per process memory and is
+not measured.
+
+Usage: python algo_host_bench.py [--bots 500] [--pairs 10] [--candles 600]
+    [--processes 16]
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs.cross_ma import Cross_MA
+from libs.algo_host import AlgoHost, PairFeed
+
+PERIOD = 60000
+SHORT_WINDOWS = [5, 10, 20, 50]
+LONG_WINDOWS = [100, 200, 500, 1000]
+MODES = [1, 3]
+
+
+class Source():
+    """
+    Candles of every pair, up to the current time
+    """
+
+    last_trace = None
+
+    def __init__(self, pairs, count, seed):
+        rng = np.random.default_rng(seed)
+        self.start = 1_600_000_000_000
+        self.timestamps = self.start + np.arange(count) * PERIOD
+        self.closes = {
+            pair: 100.0 + np.cumsum(rng.normal(0, 0.05, count)) for pair in pairs
+            }
+        self.now = self.start
+        # pair -> time after which it gets no candles
+        self.halted = {}
+
+
+    def get_close(self, exchange_name, pair, period, from_timestamp):
+        mask = (self.timestamps > from_timestamp) &\
+            (self.timestamps <= min(self.now, self.halted.get(pair, self.now)))
+        return [
+            {'timestamp': float(timestamp), 'close': float(close)}\
+                for timestamp, close in zip(self.timestamps[mask], self.closes[pair][mask])
+            ]
+
+
+class SourceExchange():
+    """
+    Exchange parameters and clock of the source
+    """
+
+    periods = {'1m': PERIOD}
+    exchange_name = 'sim'
+
+    def __init__(self, source):
+        self.source = source
+
+
+    def set_periods_params(self, history_period, cleanup_period):
+        self.history_period = int(history_period)
+
+
+    def calc_from_timestamp(self):
+        return self.source.now - PERIOD * self.history_period
+
+
+    def get_current_exchange_timestamp(self):
+        return self.source.now + PERIOD
+
+
+class SourceBot():
+
+    def __init__(self, exchange, pair):
+        self.exchange_id = 'sim'
+        self.exchange = exchange
+        self.pair = pair
+
+
+class BenchBot(Cross_MA):
+    """
+    Cross_MA with the source instead of services, operations are recorded
+    """
+
+    def __init__(self, params, source, pair, host=None):
+        self.host = host
+        self.feed = None
+        self.trace = None
+        self.logger = None
+        self.operations = []
+        self.bot = SourceBot(SourceExchange(source), pair)
+        self.ohlcv_data_service_api = source if host is None else host.ohlcv_data_service_api
+        self.set_params(params)
+        self.last_read_timestamp = 0
+        self.initialize()
+
+
+    def make_operation(self, operation_type, amount=None):
+        self.operations.append((self.bot.exchange.source.now, operation_type))
+
+
+def bot_params(bots, pairs):
+    grid = list(itertools.product(SHORT_WINDOWS, LONG_WINDOWS, MODES))
+    rng = np.random.default_rng(5)
+    res = []
+    for i in range(bots):
+        short_window, long_window, mode = grid[rng.integers(len(grid))]
+        res.append((pairs[i % len(pairs)], {'short_window': short_window, 'long_window': long_window, 'mode': mode}))
+    return res
+
+
+def make_host(source, bots):
+    host = AlgoHost(None, None, None, bot_ids=[])
+    host.ohlcv_data_service_api = source
+    for i, (pair, params) in enumerate(bots):
+        host.algos[i] = BenchBot(params, source, pair, host)
+    return host
+
+
+def history_length():
+    return max(LONG_WINDOWS) + max(MODES) + 1
+
+
+def resident_memory():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024.0
+    return float('nan')
+
+
+def run_host(args, queue):
+    pairs = [f"P{i}/USDT" for i in range(args.pairs)]
+    source = Source(pairs, history_length() + args.candles, 1)
+    source.now = source.timestamps[history_length() - 1]
+    start = time.process_time()
+    host = make_host(source, bot_params(args.bots, pairs))
+    startup = time.process_time() - start
+    start = time.process_time()
+    for i in range(args.candles):
+        source.now += PERIOD
+        host.process()
+    queue.put((startup, time.process_time() - start, resident_memory()))
+
+
+def run_standalone(args, index, queue):
+    pairs = [f"P{i}/USDT" for i in range(args.pairs)]
+    pair, params = bot_params(args.bots, pairs)[index]
+    source = Source(pairs, history_length() + args.candles, 1)
+    source.now = source.timestamps[history_length() - 1]
+    start = time.process_time()
+    bot = BenchBot(params, source, pair)
+    startup = time.process_time() - start
+    start = time.process_time()
+    for i in range(args.candles):
+        source.now += PERIOD
+        bot.process()
+    queue.put((startup, time.process_time() - start, resident_memory()))
+
+
+def in_process(target, *args):
+    """
+    Run target in a fresh interpreter, return what it reports
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=target, args=args + (queue,))
+    process.start()
+    res = queue.get()
+    process.join()
+    return res
+
+
+def check(args):
+    """
+    Operations of hosted bots equal to standalone ones
+    """
+    pairs = [f"P{i}/USDT" for i in range(min(args.pairs, 3))]
+    bots = bot_params(60, pairs)
+    sources = [Source(pairs, history_length() + 3000, 2) for i in range(2)]
+    for source in sources:
+        source.now = source.timestamps[history_length() - 1]
+    host = make_host(sources[0], bots)
+    standalone = [BenchBot(params, sources[1], pair) for pair, params in bots]
+    rng = np.random.default_rng(3)
+    while sources[0].now < sources[0].timestamps[-1]:
+        # pauses make batches of candles
+        step = PERIOD * (1 if rng.random() < 0.8 else int(rng.integers(2, 40)))
+        for source in sources:
+            source.now = min(source.now + step, source.timestamps[-1])
+        host.process()
+        for bot in standalone:
+            bot.process()
+    same = sum(host.algos[i].operations == bot.operations for i, bot in enumerate(standalone))
+    operations = sum(len(bot.operations) for bot in standalone)
+    print(f"check: {same}/{len(standalone)} bots with the same operations, {operations} operations")
+    return same == len(standalone)
+
+
+def check_short_history():
+    """
+    Averages of a feed whose pair has less history than its windows,
+    against averages of the history, while candles come in batches
+    """
+    pair = "NEW/USDT"
+    source = Source([pair], history_length() + 3000, 4)
+    source.now = source.timestamps[30]
+    feed = PairFeed(source, SourceExchange(source), pair)
+    feed.load(history_length())
+    for window in SHORT_WINDOWS + LONG_WINDOWS:
+        feed.add_window(window)
+    rng = np.random.default_rng(6)
+    errors = 0
+    while source.now < source.timestamps[-1]:
+        step = PERIOD * (1 if rng.random() < 0.8 else int(rng.integers(2, 40)))
+        source.now = min(source.now + step, source.timestamps[-1])
+        if not feed.poll():
+            continue
+        closes = feed.history()
+        count = len(feed.new_ohlcv)
+        for window, averages in feed.averages.items():
+            expected = np.convolve(closes, np.ones(window), 'valid')[-count:] / window\
+                if closes.shape[0] >= window else np.zeros(0)
+            if averages.shape != expected.shape or not np.allclose(averages, expected, rtol=1e-12):
+                errors += 1
+    print(f"check: short history, {errors} feed averages off the history")
+    return errors == 0
+
+
+def check_stale_feed():
+    """
+    Delay of the host loop with one pair getting no candles for longer
+    than late_after, against the delay of the same host without it
+    """
+    pairs = [f"P{i}/USDT" for i in range(3)]
+    source = Source(pairs, history_length() + 200, 7)
+    source.now = source.timestamps[history_length() - 1]
+    host = make_host(source, bot_params(12, pairs))
+    source.halted[pairs[-1]] = source.now
+    for i in range(120):
+        source.now += PERIOD
+        host.process()
+    delay = host.delay()
+    del host.feeds[('sim', pairs[-1])]
+    expected = host.delay()
+    print(f"check: delay with a stale feed {delay:.1f} s, without it {expected:.1f} s")
+    return delay == expected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bots', type=int, default=500)
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--candles', type=int, default=600)
+    parser.add_argument('--processes', type=int, default=16)
+    args = parser.parse_args()
+
+    if not(check(args) and check_short_history() and check_stale_feed()):
+        sys.exit(1)
+
+    host = in_process(run_host, args)
+    sample = [in_process(run_standalone, args, i) for i in range(min(args.processes, args.bots))]
+    scale = args.bots / len(sample)
+    standalone = [sum(item[i] for item in sample) * scale for i in range(3)]
+
+    print(f"\n{args.bots} bots, {args.pairs} pairs, {args.candles} candles")
+    print(f"{'':<24} {'start up, s':>12} {'candles, s':>12} {'per candle, ms':>15} {'memory, MB':>12}")
+    for name, (startup, candles, memory) in [
+        ('host, 1 process', host),
+        (f"standalone, {args.bots} proc.", standalone)
+        ]:
+        print(
+            f"{name:<24} {startup:>12.2f} {candles:>12.2f} "
+            f"{candles / args.candles * 1000:>15.2f} {memory:>12.0f}"
+            )
+    print(f"(standalone scaled from {len(sample)} processes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Idle CPU and decision latency of the Algorithm loop.
+
+A Cross_MA bot runs against an in-memory reader in real time with a
+short candle period: a candle becomes available a random delay after its
+close, as it does after the writer and the reader pick it up. Requests
+to the reader cost CPU and wait like a local HTTP call. Four loops run
+for the same candles:
+
+    legacy     while True: algo.process(), as algo.py did
+    waiter     Algorithm.run_forever, sleeps until the candle is due
+    backoff    run_forever with POLL_BACKOFF_MAX=0.025, fewer requests
+    push       the same, woken by notify_candle() when the candle comes
+
+For each: requests per candle, CPU of the loop thread as % of a core,
+and latency from candle availability to process_data.
+
+Usage: python algo_loop_bench.py [--period 2000] [--candles 10]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs.cross_ma import Cross_MA
+from libs.scheduler import CandleWaiter
+
+# cost of a request: CPU spent in the client and time waiting, seconds
+REQUEST_CPU = 0.0003
+REQUEST_WAIT = 0.001
+
+
+class Source():
+    """
+    Candles opened every period, available arrival delay after close
+    """
+
+    last_trace = None
+
+    def __init__(self, period, history, count, seed):
+        rng = np.random.default_rng(seed)
+        now = time.time() * 1000.0
+        first_open = (now // period - history) * period
+        total = history + count
+        self.period = period
+        self.timestamps = first_open + np.arange(total) * period
+        self.closes = 100.0 + np.cumsum(rng.normal(0, 0.05, total))
+        self.available = self.timestamps + period + rng.uniform(0.05, 0.15, total) * period
+        self.available[:history] = 0.0
+        self.requests = 0
+
+
+    def get_close(self, exchange_name, pair, period, from_timestamp):
+        self.requests += 1
+        start = time.thread_time()
+        while time.thread_time() - start < REQUEST_CPU:
+            pass
+        time.sleep(REQUEST_WAIT)
+        mask = (self.timestamps > from_timestamp) & (self.available <= time.time() * 1000.0)
+        return [
+            {'timestamp': float(timestamp), 'close': float(close)}\
+                for timestamp, close in zip(self.timestamps[mask], self.closes[mask])
+            ]
+
+
+class SourceExchange():
+
+    exchange_name = 'sim'
+
+    def __init__(self, period):
+        self.periods = {'1m': period}
+
+
+    def set_periods_params(self, history_period, cleanup_period):
+        self.history_period = int(history_period)
+
+
+    def calc_from_timestamp(self):
+        return self.get_current_exchange_timestamp() - self.periods['1m'] * (self.history_period + 1)
+
+
+    def get_current_exchange_timestamp(self):
+        return time.time() * 1000.0
+
+
+class SourceBot():
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.pair = 'SIM/USDT'
+
+
+class LoopBot(Cross_MA):
+    """
+    Cross_MA on the source, records latency of every processed candle
+    """
+
+    def __init__(self, source, params, backoff_max=0.0):
+        self.host = None
+        self.feed = None
+        self.trace = None
+        self.logger = None
+        self.source = source
+        self.bot = SourceBot(SourceExchange(source.period))
+        self.waiter = CandleWaiter(source.period, backoff_max=backoff_max)
+        self.ohlcv_data_service_api = source
+        self.set_params(params)
+        self.last_read_timestamp = 0
+        self.latencies = []
+        self.initialize()
+
+
+    def process_data(self):
+        now = time.time() * 1000.0
+        index = np.searchsorted(self.source.timestamps, self.new_ohlcv[-1]['timestamp'])
+        self.latencies.append(now - self.source.available[index])
+        super().process_data()
+
+
+    def make_operation(self, operation_type, amount=None):
+        pass
+
+
+def legacy_loop(bot, stop):
+    while not stop.is_set():
+        bot.process()
+
+
+def pusher(source, bot, stop):
+    """
+    Notify the bot when a candle becomes available
+    """
+    for available in source.available[source.available > 0]:
+        if stop.wait(max(0.0, available / 1000.0 - time.time())):
+            return
+        bot.notify_candle()
+
+
+def run(name, args):
+    history = 200
+    source = Source(args.period, history, args.candles, 1)
+    bot = LoopBot(
+        source,
+        {'short_window': 20, 'long_window': 100, 'mode': 1},
+        0.0 if name == 'waiter' else 0.025
+        )
+    stop = threading.Event()
+    cpu = {}
+
+    def target():
+        start = time.thread_time()
+        if name == 'legacy':
+            legacy_loop(bot, stop)
+        else:
+            bot.run_forever()
+        cpu['loop'] = time.thread_time() - start
+
+    source.requests = 0
+    threads = [threading.Thread(target=target)]
+    if name == 'push':
+        threads.append(threading.Thread(target=pusher, args=(source, bot, stop)))
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    end = source.available[-1] / 1000.0 + args.period / 1000.0
+    time.sleep(max(0.0, end - time.time()))
+    stop.set()
+    bot.stop()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies = np.array(bot.latencies)
+    return {
+        'requests': source.requests / args.candles,
+        'cpu': cpu['loop'] / elapsed * 100.0,
+        'latencies': latencies,
+        'missed': args.candles - latencies.shape[0]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--period', type=int, default=2000)
+    parser.add_argument('--candles', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"period {args.period} ms, {args.candles} candles")
+    print(f"{'loop':<8} {'req/candle':>11} {'cpu, %':>8} {'p50, ms':>9} {'max, ms':>9} {'missed':>7}")
+    for name in ['legacy', 'waiter', 'backoff', 'push']:
+        res = run(name, args)
+        print(
+            f"{name:<8} {res['requests']:>11.1f} {res['cpu']:>8.1f} "
+            f"{np.percentile(res['latencies'], 50):>9.1f} {res['latencies'].max():>9.1f} "
+            f"{res['missed']:>7}"
+            )
+
+
+if __name__ == '__main__':
+    main()
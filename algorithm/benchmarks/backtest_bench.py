@@ -0,0 +1,107 @@
+"""
+Backtest engine: candle by candle run of Cross_MA against its vectorized
+path, and throughput of both.
+
+Both paths run on the same random candles (with flat stretches, which
+make equal averages and sign ties likely) for several parameter sets.
+Operations (candle, type, balances) and equity curves must be the same,
+the vectorized path starting where the candle by candle run does. A
+start without history for the long window must raise ValueError, and a
+zero balance must give zero return and drawdown.
+
+Usage: python backtest_bench.py [--check 20000] [--candles 10000000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs.backtest import Backtest
+from libs.cross_ma import Cross_MA
+
+
+def random_ohlcv(count, seed, ties=False):
+    rng = np.random.default_rng(seed)
+    closes = 100.0 + np.cumsum(rng.normal(0, 0.05, count))
+    if ties:
+        closes = np.round(closes, 1)
+        closes[rng.random(count) < 0.3] = 100.0
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    return np.stack((
+        np.arange(count, dtype=np.float64) * 60000,
+        opens,
+        np.maximum(opens, closes),
+        np.minimum(opens, closes),
+        closes,
+        np.ones(count)
+        ), axis=1)
+
+
+def same_operations(live, vectorized):
+    if len(live) != len(vectorized):
+        return False
+    return all(
+        a['index'] == b['index'] and a['type'] == b['type'] and a['balance'] == b['balance']\
+            for a, b in zip(live, vectorized)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--check', type=int, default=20000)
+    parser.add_argument('--candles', type=int, default=10000000)
+    args = parser.parse_args()
+
+    failed = 0
+    for params, ties in [
+        ({'short_window': 5, 'long_window': 30, 'mode': 3}, False),
+        ({'short_window': 5, 'long_window': 30, 'mode': 3}, True),
+        ({'short_window': 50, 'long_window': 200, 'mode': 1}, True),
+        ({'short_window': 7, 'long_window': 7, 'mode': 5}, True),
+        ({'short_window': 20, 'long_window': 1000, 'mode': 1}, False)
+        ]:
+        ohlcv = random_ohlcv(args.check, 7, ties)
+        start = time.perf_counter()
+        live = Backtest(Cross_MA, params, ohlcv).run()
+        live_time = time.perf_counter() - start
+        vectorized = Backtest(Cross_MA, params, ohlcv).run_vectorized()
+        same = vectorized['start'] == live['start'] and\
+            same_operations(live['operations'], vectorized['operations']) and\
+            np.array_equal(live['equity'], vectorized['equity'])
+        failed += not same
+        print(
+            f"{str(params):<55} ties={ties!s:<5} {len(live['operations']):>5} operations, "
+            f"same: {same}, live {args.check / live_time:,.0f} candles/s"
+            )
+
+    params = {'short_window': 5, 'long_window': 30, 'mode': 3}
+    ohlcv = random_ohlcv(1000, 7)
+    try:
+        Backtest(Cross_MA, params, ohlcv).run_vectorized(params['long_window'] - 1)
+        print("start before the long window: no error")
+        failed += 1
+    except ValueError as e:
+        print(f"start before the long window: {e}")
+    res = Backtest(Cross_MA, params, ohlcv, balance={'BTC': 0.0, 'USDT': 0.0}).run_vectorized()
+    print(f"zero balance: return {res['return']}, max drawdown {res['max_drawdown']}")
+    failed += not(res['return'] == 0.0 and res['max_drawdown'] == 0.0)
+
+    params = {'short_window': 50, 'long_window': 1000, 'mode': 3}
+    ohlcv = random_ohlcv(args.candles, 1)
+    backtest = Backtest(Cross_MA, params, ohlcv)
+    start = time.perf_counter()
+    res = backtest.run_vectorized()
+    elapsed = time.perf_counter() - start
+    print(
+        f"\nvectorized {args.candles:,} candles: {elapsed:.2f} s, "
+        f"{args.candles / elapsed:,.0f} candles/s, {len(res['operations'])} operations, "
+        f"return {res['return'] * 100.0:.1f} %, max drawdown {res['max_drawdown'] * 100.0:.1f} %"
+        )
+    sys.exit(1 if failed > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Per-candle latency of Cross_MA.process_data and equivalence with the
+previous implementation (np.concatenate and np.average per candle).
+
+Both run on the same random walk without services: history and new
+candles are given directly and operations are recorded. Crossings of
+the two implementations are compared candle by candle and for catch-up
+batches of random size.
+
+Usage: python cross_ma_tick.py [--long 100000] [--short 20000] [--mode 3]
+    [--ticks 2000] [--check 20000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs.cross_ma import Cross_MA
+
+
+class Offline():
+    """
+    Feed history and candles directly instead of data services
+    """
+
+    def __init__(self, params, history):
+        self.set_params(params)
+        # standalone: no shared pair feed, averages are kept by the algorithm
+        self.feed = None
+        self.history = history
+        self.operations = []
+        self.initialize()
+
+
+    def initialize_ohlcv_from_period(self, period):
+        self.timeseries = self.history[:, -period:].copy()
+        self.last_read_timestamp = self.timeseries[0, -1]
+
+
+    def make_operation(self, operation_type, amount=None):
+        self.operations.append(operation_type)
+
+
+    def push(self, timestamps, closes):
+        self.new_ohlcv = [
+            {'timestamp': timestamp, 'close': close}\
+                for timestamp, close in zip(timestamps, closes)
+            ]
+        self.process_data()
+        return self.prev_cross_temp
+
+
+class Current(Offline, Cross_MA):
+    pass
+
+
+class Legacy(Offline, Cross_MA):
+    """
+    Cross_MA before the ring buffer
+    """
+
+    def initialize(self):
+        self.initialize_ohlcv_from_period(
+            self.long_window + self.mode + 1
+            )
+        self.ma_long = self.moving_average(
+            self.timeseries[1,:],
+            self.long_window
+            )
+        self.ma_short = self.moving_average(
+            self.timeseries[1,:],
+            self.short_window
+            )
+        self.ma_long_len = self.ma_long.shape[0]
+        self.ma_short_len = self.ma_short.shape[0]
+        self.prev_cross_temp = self.calc_cross()
+
+
+    def calc_new_ma(self, ma_array, window_size):
+        return np.concatenate((
+            ma_array,
+            [np.average(self.timeseries[1, -window_size:])]
+            ))
+
+
+    def calc_cross(self):
+        def filter_func(item):
+            return 0 if item == 0 else item / abs(item)
+        return np.sum(np.stack(np.vectorize(filter_func)(
+            self.ma_short[-self.mode:]-self.ma_long[-self.mode:]
+            )))
+
+
+    def process_data(self):
+        for item in self.new_ohlcv:
+            self.timeseries = np.concatenate(
+                (
+                    self.timeseries,
+                    np.array([[item['timestamp']],[item['close']]])
+                    ),
+                axis=1
+                )
+            self.ma_long = self.calc_new_ma(
+                self.ma_long,
+                self.long_window
+                )
+            self.ma_short = self.calc_new_ma(
+                self.ma_short,
+                self.short_window
+                )
+        new_cross = self.calc_cross()
+
+        if (self.prev_cross_temp > 0) and (new_cross < 0):
+            self.make_operation('sell_all')
+        elif (self.prev_cross_temp < 0) and (new_cross > 0):
+            self.make_operation('buy_all')
+
+        self.prev_cross_temp = new_cross
+        self.ma_long = self.ma_long[-self.ma_long_len:]
+        self.ma_short = self.ma_short[-self.ma_short_len:]
+        self.timeseries = self.timeseries[:,-(self.long_window + self.mode + 1):]
+
+
+def random_walk(count, seed, ties=False):
+    rng = np.random.default_rng(seed)
+    closes = 100.0 + np.cumsum(rng.normal(0, 0.05, count))
+    if ties:
+        # flat stretches and round prices make equal averages likely
+        closes = np.round(closes, 1)
+        closes[rng.random(count) < 0.3] = 100.0
+    return np.stack((np.arange(count, dtype=np.float64) * 60000, closes))
+
+
+def check(params, count, seed, ties):
+    """
+    Feed the same candles in random batches, compare crossings
+    """
+    history = random_walk(params['long_window'] + params['mode'] + 1 + count, seed, ties)
+    start = params['long_window'] + params['mode'] + 1
+    current = Current(params, history[:, :start])
+    legacy = Legacy(params, history[:, :start])
+    rng = np.random.default_rng(seed + 1)
+    mismatches = 0
+    i = start
+    while i < history.shape[1]:
+        size = 1 if rng.random() < 0.7 else int(rng.integers(2, 64))
+        batch = history[:, i:i + size]
+        if current.push(*batch) != legacy.push(*batch):
+            mismatches += 1
+        i += size
+    return mismatches, current.operations == legacy.operations, len(legacy.operations)
+
+
+def tick_latency(algo, history, ticks):
+    latencies = np.zeros(ticks)
+    for i in range(ticks):
+        timestamp, close = history[0, -1] + 60000 * (i + 1), history[1, -1] + np.sin(i / 50.0)
+        start = time.perf_counter()
+        algo.push([timestamp], [close])
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--long', type=int, default=100000)
+    parser.add_argument('--short', type=int, default=20000)
+    parser.add_argument('--mode', type=int, default=3)
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--check', type=int, default=20000)
+    args = parser.parse_args()
+
+    for params, ties in [
+        ({'short_window': 5, 'long_window': 30, 'mode': 3}, False),
+        ({'short_window': 5, 'long_window': 30, 'mode': 3}, True),
+        ({'short_window': 50, 'long_window': 200, 'mode': 1}, True),
+        ({'short_window': 7, 'long_window': 7, 'mode': 5}, True)
+        ]:
+        mismatches, same_operations, operations = check(params, args.check, 7, ties)
+        print(
+            f"check {params} ties={ties}: {mismatches} crossing mismatches, "
+            f"{operations} operations, same operations: {same_operations}"
+            )
+
+    params = {'short_window': args.short, 'long_window': args.long, 'mode': args.mode}
+    history = random_walk(args.long + args.mode + 1, 1)
+    print(f"\nper candle latency, long_window={args.long}, us")
+    print(f"{'':<10} {'p50':>10} {'p99':>10} {'max':>10}")
+    for name, algo_class in [('legacy', Legacy), ('current', Current)]:
+        latencies = tick_latency(algo_class(params, history), history, args.ticks)
+        print(
+            f"{name:<10} {np.percentile(latencies, 50):>10.1f} "
+            f"{np.percentile(latencies, 99):>10.1f} {latencies.max():>10.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Per-call latency of DataServiceAPI against a local stand-in server.
+
+Compares a new connection per call (plain requests.get, the old behaviour)
+with the pooled keep-alive session of DataServiceAPI.
+
+Usage: python data_service_api_latency.py [calls]
+"""
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from libs.data_service_api import DataServiceAPI
+
+
+BODY = json.dumps(
+    [{'timestamp': 1650000000000 + i * 60000, 'close': 40000.0 + i} for i in range(10)]
+    ).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p99': samples[int(len(samples) * 0.99)]
+        }
+
+
+def measure(call, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return percentiles(samples)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    url = 'close/binance/BTC/USDT/1m/0'
+
+    api = DataServiceAPI(base_url, 'user', 'password')
+    results = {
+        'requests.get per call': measure(
+            lambda: requests.get(f"{base_url}/{url}", auth=('user', 'password')).json(),
+            calls
+            ),
+        'DataServiceAPI session': measure(
+            lambda: api.get_request(url),
+            calls
+            )
+        }
+    server.shutdown()
+
+    print(f"{calls} calls, latency in microseconds")
+    for name, res in results.items():
+        print(f"{name:<24} mean {res['mean']:9.1f}  p50 {res['p50']:9.1f}  p99 {res['p99']:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Streaming indicators (libs/indicators.py) against the TACUDA kernels.
+
+The kernels run in the CUDA simulator (NUMBA_ENABLE_CUDASIM=1 is set
+here) on a random walk of candles, in a single block: they use
+cuda.syncthreads() between passes, which synchronizes a block only, so a
+single block is the launch for which their output is defined. The result
+array is filled with NaN before, positions a kernel does not write stay
+NaN. Candles have nonzero range and volume, where the kernels divide by
+zero the indicators return 0 instead. Every indicator is compared with
+the kernel from its warmup index, once updated candle by candle and once
+warmed up from the first part of the history and updated with the rest.
+Then per update time is measured.
+
+Usage: python indicators_equivalence.py [--length 512] [--seed 3]
+    [--updates 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+os.environ.setdefault("NUMBA_ENABLE_CUDASIM", "1")
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.append(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'analysis', 'technical_analysis_cuda'
+    )))
+
+from numba import cuda
+from tacuda import TACUDA
+from libs.indicators import create_indicators
+
+# kernels known to differ, see CommodityChannelIndex
+SKIP = ['commodity_channel_index']
+
+CONFIG = {
+    "technical indicators": [
+        {"function": "moving_average", "windows": [5, 24]},
+        {"function": "exponential_moving_average", "windows": [5, 24]},
+        {"function": "momentum", "windows": [1, 24]},
+        {"function": "rate_of_change", "windows": [1, 24]},
+        {"function": "average_true_range", "windows": [5, 24]},
+        {"function": "stochastic_oscillator_k", "windows": [5, 24]},
+        {"function": "stochastic_oscillator_d_ma", "windows": [5, 24]},
+        {"function": "stochastic_oscillator_d_ema", "windows": [5, 24]},
+        {"function": "trix", "windows": [5, 24]},
+        {"function": "mass_index", "windows": [], "param": 2},
+        {"function": "vortex_indicator_plus", "windows": [5, 24]},
+        {"function": "vortex_indicator_minus", "windows": [5, 24]},
+        {"function": "relative_strength_index", "windows": [5, 24]},
+        {"function": "true_strength_index", "windows": [5, 24], "windows_2": [3, 12]},
+        {"function": "accumulation_distribution", "windows": []},
+        {"function": "chaikin_oscillator", "windows": []},
+        {"function": "chaikin_money_flow", "windows": []},
+        {"function": "money_flow_index", "windows": [5, 24]},
+        {"function": "on_balance_volume", "windows": []},
+        {"function": "force_index", "windows": [5, 24]},
+        {"function": "ease_of_movement", "windows": [5, 24]},
+        {"function": "standard_deviation", "windows": [5, 24]},
+        {"function": "commodity_channel_index", "windows": [5, 24]},
+        {"function": "keltner_channel_m", "windows": [5, 24]},
+        {"function": "keltner_channel_u", "windows": [5, 24]},
+        {"function": "keltner_channel_d", "windows": [5, 24]},
+        {"function": "ultimate_oscillator", "windows": []},
+        {"function": "donchian_channel_u", "windows": [5, 24]},
+        {"function": "donchian_channel_d", "windows": [5, 24]},
+        {"function": "donchian_channel_m", "windows": [5, 24]},
+        {"function": "bollinger_bands_m", "windows": [5, 24]},
+        {"function": "bollinger_bands_u", "windows": [5, 24]},
+        {"function": "bollinger_bands_d", "windows": [5, 24]}
+        ]
+    }
+
+
+def random_candles(count, seed):
+    """
+    timestamp, open, high, low, close, volume rows of a random walk
+    """
+    rng = np.random.default_rng(seed)
+    closes = 100.0 + np.cumsum(rng.normal(0, 0.5, count))
+    opens = np.concatenate(([100.0], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.exponential(0.3, count)
+    lows = np.minimum(opens, closes) - rng.exponential(0.3, count)
+    volumes = 0.1 + rng.exponential(10.0, count)
+    return np.stack(
+        (np.arange(count, dtype=np.float64) * 60000, opens, highs, lows, closes, volumes),
+        axis=1
+        )
+
+
+def kernel_values(ohlcv):
+    """
+    Name -> values of the TACUDA kernels, one block of ohlcv.shape[0] threads
+    """
+    config = {"technical indicators": [
+        function_i for function_i in CONFIG["technical indicators"]\
+            if not(function_i["function"] in SKIP)
+        ]}
+    ta = TACUDA(ohlcv, config, threads_per_block=ohlcv.shape[0])
+    ta.result_gpu_mem = cuda.to_device(np.full((ohlcv.shape[0], ta.tech_inds_n), np.nan))
+    names = ta.process()
+    res = ta.result_gpu_mem.copy_to_host()
+    return {name: res[:, i] for i, name in enumerate(names)}
+
+
+def compare(expected, values, warmup):
+    """
+    Max relative difference from warmup and whether NaN positions agree
+    """
+    expected = expected[warmup:]
+    values = values[warmup:]
+    nan = np.isnan(expected)
+    if not np.array_equal(nan, np.isnan(values)):
+        return np.inf
+    if np.all(nan):
+        return 0.0
+    scale = np.maximum(1.0, np.abs(expected[~nan]))
+    return float(np.max(np.abs(expected[~nan] - values[~nan]) / scale))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--length', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=3)
+    parser.add_argument('--updates', type=int, default=2000)
+    args = parser.parse_args()
+
+    ohlcv = random_candles(args.length, args.seed)
+    expected = kernel_values(ohlcv)
+    split = args.length // 3
+
+    streamed = create_indicators(CONFIG)
+    warmed = create_indicators(CONFIG)
+    failed = 0
+    print(f"{'indicator':<40} {'warmup':>6} {'update':>10} {'warm_up':>10}")
+    for name, indicator in streamed.items():
+        values = np.array([indicator.update(candle) for candle in ohlcv])
+        warm = warmed[name]
+        warm_values = np.concatenate((
+            warm.warm_up(ohlcv[:split]),
+            [warm.update(candle) for candle in ohlcv[split:]]
+            ))
+        if not(name in expected):
+            print(f"{name:<40} {indicator.warmup:>6} {'':>10} {'':>10} skip")
+            continue
+        errors = [
+            compare(expected[name], values, indicator.warmup),
+            compare(expected[name], warm_values, indicator.warmup)
+            ]
+        status = 'ok' if max(errors) < 1e-9 else 'FAIL'
+        if status == 'FAIL':
+            failed += 1
+        print(f"{name:<40} {indicator.warmup:>6} {errors[0]:>10.1e} {errors[1]:>10.1e} {status}")
+    print(f"\n{failed} failed")
+
+    history = random_candles(args.updates + 10000, args.seed + 1)
+    indicators = create_indicators(CONFIG)
+    print("\nper update time after warm up from 10000 candles, us")
+    for name, indicator in indicators.items():
+        indicator.warm_up(history[:10000])
+        start = time.perf_counter()
+        for candle in history[10000:]:
+            indicator.update(candle)
+        print(f"{name:<40} {(time.perf_counter() - start) / args.updates * 1e6:>10.1f}")
+    sys.exit(1 if failed > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Where the candle latency goes.
+
+Reads finished traces from the traces collection and prints, for every
+pipeline stage, percentiles of the time since the previous stage (since
+candle close for the first one). The breakdown below shows the mean time
+per stage among traces slower than the total p99, which tells which stage
+the tail comes from.
+
+Usage: python latency_report.py [--host mongodb:27017] [--hours 24]
+    [--service NAME]
+Mongo credentials are taken from MONGO_USERNAME and MONGO_PASSWORD.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from libs import MongoDB
+from libs.tracing import trace_stages
+
+PERCENTILES = [50, 90, 99]
+
+
+def stage_latencies(traces):
+    """
+    Stage -> array of latencies, ms, and totals from candle close
+
+    Stages a trace did not pass are NaN, so rows of all arrays
+    belong to the same trace.
+    """
+    stages = trace_stages + sorted(set(
+        stage for trace in traces for stage, _ in trace['stamps']
+        ) - set(trace_stages))
+    res = {stage: np.full(len(traces), np.nan) for stage in stages}
+    totals = np.zeros(len(traces))
+    for i, trace in enumerate(traces):
+        previous = trace['close']
+        for stage, timestamp in trace['stamps']:
+            res[stage][i] = timestamp - previous
+            previous = timestamp
+        totals[i] = previous - trace['close']
+    return res, totals
+
+
+def print_report(traces):
+    latencies, totals = stage_latencies(traces)
+    print(f"{len(traces)} traces")
+    print(f"{'stage':<16} {'count':>7}" + ''.join(f"{'p' + str(q) + ', ms':>11}" for q in PERCENTILES))
+    for stage, values in list(latencies.items()) + [('total', totals)]:
+        values = values[~np.isnan(values)]
+        if values.shape[0] == 0:
+            continue
+        print(
+            f"{stage:<16} {values.shape[0]:>7}" +\
+                ''.join(f"{value:>11.1f}" for value in np.percentile(values, PERCENTILES))
+            )
+
+    tail = totals >= np.percentile(totals, 99)
+    print(f"\nslowest 1% ({np.count_nonzero(tail)} traces), mean per stage:")
+    for stage, values in latencies.items():
+        values = values[tail]
+        values = values[~np.isnan(values)]
+        if values.shape[0] == 0:
+            continue
+        share = values.mean() / max(totals[tail].mean(), 1.0) * 100.0
+        print(f"{stage:<16} {values.mean():>11.1f} ms {share:>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='mongodb:27017')
+    parser.add_argument('--hours', type=float, default=24.0)
+    parser.add_argument('--service', default=None)
+    args = parser.parse_args()
+
+    db = MongoDB(
+        os.environ.get("MONGO_USERNAME"),
+        os.environ.get("MONGO_PASSWORD"),
+        args.host
+        )
+    traces = db.get_traces(int((time.time() - args.hours * 3600) * 1000))
+    if not(args.service is None):
+        traces = [trace for trace in traces if trace.get('service') == args.service]
+    if len(traces) == 0:
+        print("No traces")
+        return
+    print_report(traces)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Startup time of every service entry point.
+
+For each entry point a fresh interpreter runs the top-level imports of the
+entry file (import time) and then the first work which does not need the
+network: constructing its clients and touching the classes it uses
+(time to first useful work). The median of several runs is compared with
+the budget in startup_budget.json.
+
+Usage: python startup_time.py [--runs N] [--check] [--update]
+    --check   exit with code 1 if an entry point exceeds its budget
+    --update  write measured medians multiplied by --headroom as new budget
+"""
+import os
+import sys
+import ast
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'startup_budget.json')
+
+CLIENTS = (
+    "logger = Logger(log_path)\n"
+    "db = MongoDB('user', 'password', 'localhost:27017', logger)\n"
+    )
+
+API = "api = DataServiceAPI('http://localhost:5000', 'user', 'password', logger)\n"
+
+FIRST_WORK = {
+    'algo.py': CLIENTS + "Cross_MA.process_data\n",
+    'ohlcv_reader.py': CLIENTS + "Exchange(logger=logger)\n",
+    'ohlcv_writer.py': CLIENTS + API + "Exchange(logger=logger)\n",
+    'accounts.py': CLIENTS + "Account(logger=logger)\nLedger\n",
+    'accounts_writer.py': CLIENTS + API,
+    'bots_writer.py': CLIENTS + API,
+    'balances_writer.py': CLIENTS + API
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+log_path = {log_path!r}
+{first_work}
+ready = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first_work': ready - start}}))
+"""
+
+
+def entry_imports(entry_point):
+    """
+    Source of top-level import statements of the entry file
+    """
+    with open(os.path.join(SRC_PATH, entry_point)) as source_file:
+        source = source_file.read()
+    tree = ast.parse(source)
+    return '\n'.join(
+        ast.get_source_segment(source, node) for node in tree.body\
+            if isinstance(node, (ast.Import, ast.ImportFrom))
+        )
+
+
+def measure(entry_point, log_path):
+    probe = PROBE.format(
+        imports=entry_imports(entry_point),
+        log_path=log_path,
+        first_work=FIRST_WORK[entry_point]
+        )
+    res = subprocess.run(
+        [sys.executable, '-c', probe],
+        cwd=SRC_PATH,
+        capture_output=True,
+        text=True
+        )
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().splitlines()[-1])
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--update', action='store_true')
+    parser.add_argument('--headroom', type=float, default=2.0)
+    args = parser.parse_args()
+
+    budget = {}
+    if os.path.exists(BUDGET_PATH):
+        with open(BUDGET_PATH) as budget_file:
+            budget = json.load(budget_file)
+
+    failed = []
+    measured = {}
+    log_path = os.path.join(tempfile.mkdtemp(), 'logs.log')
+    print(f"{'entry point':<20} {'import, s':>10} {'first work, s':>14} {'budget, s':>10}")
+    for entry_point in FIRST_WORK.keys():
+        try:
+            runs = [measure(entry_point, log_path) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{entry_point:<20} skipped: {e}")
+            continue
+        import_time = statistics.median(run['import'] for run in runs)
+        first_work_time = statistics.median(run['first_work'] for run in runs)
+        measured[entry_point] = first_work_time
+        limit = budget.get(entry_point)
+        print(
+            f"{entry_point:<20} {import_time:>10.3f} {first_work_time:>14.3f} "
+            f"{'-' if limit is None else format(limit, '.3f'):>10}"
+            )
+        if not(limit is None) and first_work_time > limit:
+            failed.append(entry_point)
+
+    if args.update:
+        with open(BUDGET_PATH, 'w') as budget_file:
+            json.dump(
+                {
+                    entry_point: round(value * args.headroom, 3)\
+                        for entry_point, value in measured.items()
+                    },
+                budget_file,
+                indent=4
+                )
+    if args.check and failed:
+        print(f"Startup budget exceeded: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
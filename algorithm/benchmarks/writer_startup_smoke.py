@@ -0,0 +1,91 @@
+"""
+Startup smoke check of the writer services.
+
+For each writer a fresh interpreter imports the entry file and runs its
+startup up to the scheduler loop: ohlcv_writer runs initialize_exchanges()
+and initialize_scheduler(), the other writers run main() with
+CandleScheduler.run_forever() returning at once. Mongo is replaced by a
+stand-in whose methods return nothing and the logger writes to a temp file,
+so no network is needed. Every scheduled job is then bound to the
+signature of its function, the way the scheduler will call it: a job which
+would fail with TypeError on its first run fails the check.
+
+Usage: python writer_startup_smoke.py
+"""
+import os
+import sys
+import json
+import subprocess
+import tempfile
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+STARTUP = {
+    'ohlcv_writer.py': "entry.initialize_exchanges()\nentry.initialize_scheduler()\n",
+    'accounts_writer.py': "entry.main()\n",
+    'bots_writer.py': "entry.main()\n",
+    'balances_writer.py': "entry.main()\n"
+}
+
+PROBE = """
+import sys, json, inspect, importlib
+import libs
+from libs import logger as logger_module, scheduler as scheduler_module
+
+
+class OfflineMongo():
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: [] if name.startswith('get_') else None
+
+
+log_path = {log_path!r}
+libs.MongoDB = OfflineMongo
+libs.Logger = lambda *args, **kwargs: logger_module.Logger(log_path)
+scheduler_module.CandleScheduler.run_forever = lambda self: None
+
+entry = importlib.import_module({module!r})
+{startup}
+jobs = []
+for job in entry.scheduler.jobs:
+    inspect.signature(job['func']).bind(*job['args'], **job['kwargs'])
+    jobs.append(job['name'])
+print(json.dumps(jobs))
+"""
+
+
+def run(entry_point, log_path):
+    probe = PROBE.format(
+        log_path=log_path,
+        module=entry_point[:-3],
+        startup=STARTUP[entry_point]
+        )
+    res = subprocess.run(
+        [sys.executable, '-c', probe],
+        cwd=SRC_PATH,
+        capture_output=True,
+        text=True
+        )
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().splitlines()[-1])
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    failed = []
+    log_path = os.path.join(tempfile.mkdtemp(), 'logs.log')
+    for entry_point in STARTUP.keys():
+        try:
+            jobs = run(entry_point, log_path)
+            print(f"{entry_point:<20} ok: {', '.join(jobs)}")
+        except RuntimeError as e:
+            print(f"{entry_point:<20} FAIL: {e}")
+            failed.append(entry_point)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import os
 import json
-from libs import *
+import time
+import threading
+from libs import Logger, MongoDB, Account, Ledger, Tracer, tracer
 from flask import Flask, jsonify, make_response, request
 from flask.wrappers import Response
 from flask_httpauth import HTTPBasicAuth
@@ -26,6 +28,7 @@ db = MongoDB(
     "mongodb:27017",
     logger
     )
+tracer.configure('accounts', db, logger)
 
 accounts = {
     account['_id']: Account(db, account['_id'], logger)\
@@ -34,6 +37,20 @@ accounts = {
 
 bots = {}
 
+ledger = Ledger(
+    db,
+    logger,
+    os.environ.get("LEDGER_SNAPSHOT_INTERVAL") or 1000
+    )
+
+# balances versions: every change bumps state_version and stamps the
+# changed account and bot with it, so clients can ask for changes since N
+service_epoch = int(time.time() * 1000)
+state_version = 0
+accounts_versions = {}
+bots_versions = {}
+operations_lock = threading.Lock()
+
 """app.config.from_object(Flask_App_Config())
 scheduler = APScheduler()
 scheduler.init_app(app)"""
@@ -70,24 +87,75 @@ def not_found(error):
         )
 
 
+def get_since():
+    """
+    Version from the since query parameter, None for full snapshot
+    """
+    return request.args.get('since', type=int)
+
+
+def changed_accounts_balances(since=None):
+    return [
+        account.get_balance_current() for account_id, account in accounts.items()\
+            if (since is None) or (accounts_versions.get(account_id, 0) > since)
+        ]
+
+
+def changed_bots_balances(since=None):
+    return [
+        bot.get_balances() for account in accounts.values()\
+            for bot_id, bot in account.bots.items()\
+                if (since is None) or (bots_versions.get(bot_id, 0) > since)
+        ]
+
+
+def versioned_response(data, version):
+    response = Response(json.dumps(data), mimetype='application/json')
+    response.headers['X-Balances-Epoch'] = str(service_epoch)
+    response.headers['X-Balances-Version'] = str(version)
+    return response
+
+
 @app.route('/all_accounts_balances', methods=['GET'])
 @auth.login_required
 def get_all_accounts_balances():
-    return Response(
-        json.dumps([account.get_balance_current()\
-            for account in accounts.values()]),
-        mimetype='application/json'
-        )
+    """
+    Accounts balances, only changed since version N with ?since=N
+    """
+    with operations_lock:
+        version = state_version
+        res = changed_accounts_balances(get_since())
+    return versioned_response(res, version)
 
 
 @app.route('/all_bots_balances', methods=['GET'])
 @auth.login_required
 def get_all_bots_balances():
-    res = []
-    for account in accounts.values():
-        for bot in account.bots.values():
-            res.append(bot.get_balances())
-    return Response(json.dumps(res), mimetype='application/json')
+    """
+    Bots balances, only changed since version N with ?since=N
+    """
+    with operations_lock:
+        version = state_version
+        res = changed_bots_balances(get_since())
+    return versioned_response(res, version)
+
+
+@app.route('/all_balances', methods=['GET'])
+@auth.login_required
+def get_all_balances():
+    """
+    Accounts and bots balances in one snapshot, only changed since
+    version N with ?since=N
+    """
+    since = get_since()
+    with operations_lock:
+        res = {
+            'epoch': service_epoch,
+            'version': state_version,
+            'accounts': changed_accounts_balances(since),
+            'bots': changed_bots_balances(since)
+            }
+    return versioned_response(res, res['version'])
 
 
 @app.route('/account_balances/<string:account_id>', methods=['GET'])
@@ -116,27 +184,66 @@ def get_bot_balances(bot_id):
     )
 @auth.login_required
 def make_operation():
+    global state_version
     bot_id = request.form['bot_id']
+    if not(bot_id in bots.keys()):
+        return not_found(f"bot {bot_id}")
     account_id = bots[bot_id]
-    if accounts[account_id].make_operation(
-        request.form['operation_type'],
-        bot_id,
-        request.form['amount']
-        ):
-        db.write_operation(
+    amount = request.form.get('amount')
+    amount = None if amount is None else float(amount)
+    account = accounts[account_id]
+    snapshot = None
+    with operations_lock:
+        account_balances = account.balances.copy()
+        bot_balance = account.bots[bot_id].balance.copy()
+        diff = account.make_operation(
             request.form['operation_type'],
-            account_id,
             bot_id,
-            request.form['amount'],
-            accounts[account_id].bots[bot_id].pair,
-            accounts[account_id].exchange.get_current_exchange_timestamp()
+            amount
             )
+        if not(diff is None):
+            timestamp = account.exchange.get_current_exchange_timestamp()
+            if ledger.append(
+                account,
+                bot_id,
+                request.form['operation_type'],
+                amount,
+                diff,
+                timestamp
+                ):
+                state_version += 1
+                accounts_versions[account_id] = state_version
+                bots_versions[bot_id] = state_version
+                if ledger.snapshot_due():
+                    snapshot = ledger.make_snapshot(accounts, timestamp)
+            else:
+                # an operation not in the ledger would be lost on restart
+                account.balances.update(account_balances)
+                account.bots[bot_id].balance.update(bot_balance)
+                diff = None
+    if not(snapshot is None):
+        ledger.write_snapshot(snapshot)
+    tracer.finish(tracer.stamp(Tracer.from_header(request.headers), 'make_operation'))
+    return jsonify({'result': not(diff is None)})
+
+
+@app.route(
+    '/latency',
+    methods=['GET']
+    )
+@auth.login_required
+def get_latency():
+    """
+    Latency percentiles per pipeline stage, ms
+    """
+    return jsonify(tracer.summary())
 
 
 def initialize():
     for account in accounts.values():
         for bot in account.bots.keys():
             bots.update({bot: account.account_id})
+    ledger.restore(accounts, int(time.time() * 1000))
             
 
 if __name__ == '__main__':
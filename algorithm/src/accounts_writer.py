@@ -1,9 +1,7 @@
 import os
 import json
-import time
-import schedule
 
-from libs import *
+from libs import Logger, MongoDB, DataServiceAPI, DataServiceAPIError, log_exception, CandleScheduler
 
 logger = Logger("/logs/logs.log")
     
@@ -17,22 +15,36 @@ data_service_api = DataServiceAPI(
 db = MongoDB(
     os.environ.get("MONGO_USERNAME"),
     os.environ.get("MONGO_PASSWORD"),
-    "mongodb:27017"
+    "mongodb:27017",
+    logger
+    )
+db.set_balances_retention(
+    os.environ.get("BALANCES_RAW_RETENTION_DAYS") or 7,
+    os.environ.get("BALANCES_HOURLY_RETENTION_DAYS") or 90
+    )
+
+scheduler = CandleScheduler(
+    logger,
+    float(os.environ.get("SCHEDULER_SETTLE_DELAY") or 0.0)
     )
 
 
 def update_all_accounts():
-    data = data_service_api.get_all_accounts_balances()
+    try:
+        data = data_service_api.get_all_accounts_balances()
+    except DataServiceAPIError as e:
+        log_exception('accounts_writer', e, logger)
+        return
     db.write_accounts_balances(data)
 
 
 def main():
     
-    schedule.every().minute.at(":00").do(update_all_accounts)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    db.ensure_balances_indexes("account_balances", 'account_id')
+    scheduler.every('1m', update_all_accounts)
+    # rollup in the middle of the hour, away from the minute jobs
+    scheduler.every('1h', db.rollup_account_balances, settle_delay=1800)
+    scheduler.run_forever()
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 import os
 from abc import abstractmethod
-from libs import *
+from libs import Logger, MongoDB, Cross_MA, tracer
 
 logger = Logger("/logs/logs.log")
 bot_id = os.environ.get("BOT_ID")
@@ -11,15 +11,14 @@ db = MongoDB(
     "mongodb:27017",
     logger
     )
+tracer.configure(f"algo {bot_id}", db, logger)
 
 #getattr
 algo = Cross_MA(db, bot_id, logger)
 
 
 def main():
-    algo.initialize()
-    while True:
-        algo.process()
+    algo.run_forever()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
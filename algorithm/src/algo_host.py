@@ -0,0 +1,28 @@
+import os
+from libs import Logger, MongoDB, Cross_MA, AlgoHost, tracer
+
+logger = Logger("/logs/logs.log")
+
+db = MongoDB(
+    os.environ.get("MONGO_USERNAME"),
+    os.environ.get("MONGO_PASSWORD"),
+    "mongodb:27017",
+    logger
+    )
+tracer.configure("algo host", db, logger)
+
+bot_ids = os.environ.get("BOT_IDS")
+host = AlgoHost(
+    db,
+    logger,
+    Cross_MA,
+    None if not bot_ids else bot_ids.split(','),
+    float(os.environ.get("POLL_BACKOFF_MAX") or 0.0)
+    )
+
+
+def main():
+    host.run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+
+from libs import Logger, MongoDB, DataServiceAPI, DataServiceAPIError, log_exception, CandleScheduler
+
+logger = Logger("/logs/logs.log")
+    
+data_service_api = DataServiceAPI(
+    os.environ.get("ACCOUNTS_REST_API_BASE_URL"),
+    os.environ.get("REST_API_USER"),
+    os.environ.get("REST_API_PASSWORD"),
+    logger
+    )
+
+db = MongoDB(
+    os.environ.get("MONGO_USERNAME"),
+    os.environ.get("MONGO_PASSWORD"),
+    "mongodb:27017",
+    logger
+    )
+db.set_balances_retention(
+    os.environ.get("BALANCES_RAW_RETENTION_DAYS") or 7,
+    os.environ.get("BALANCES_HOURLY_RETENTION_DAYS") or 90
+    )
+
+scheduler = CandleScheduler(
+    logger,
+    float(os.environ.get("SCHEDULER_SETTLE_DELAY") or 0.0)
+    )
+
+# position in the accounts service change stream, (epoch, version)
+snapshot_state = {
+    'epoch': None,
+    'version': None
+    }
+
+
+def get_balances_delta():
+    """
+    Get balances changed since the last written snapshot. A full
+    snapshot is requested on start and after accounts service restart
+    """
+    data = data_service_api.get_all_balances(snapshot_state['version'])
+    if data['epoch'] != snapshot_state['epoch'] and\
+        not(snapshot_state['version'] is None):
+        data = data_service_api.get_all_balances()
+    return data
+
+
+def update_all_balances():
+    try:
+        data = get_balances_delta()
+    except DataServiceAPIError as e:
+        log_exception('balances_writer', e, logger)
+        return
+    accounts_written = db.write_accounts_balances(data['accounts'])
+    bots_written = db.write_bots_balances(data['bots'])
+    if accounts_written and bots_written:
+        snapshot_state.update({
+            'epoch': data['epoch'],
+            'version': data['version']
+            })
+
+
+def rollup_balances():
+    db.rollup_account_balances()
+    db.rollup_bot_balances()
+
+
+def main():
+    
+    db.ensure_balances_indexes("account_balances", 'account_id')
+    db.ensure_balances_indexes("bot_balances", 'bot_id')
+    scheduler.every('1m', update_all_balances)
+    # rollup in the middle of the hour, away from the minute jobs
+    scheduler.every('1h', rollup_balances, settle_delay=1800)
+    scheduler.run_forever()
+
+
+if __name__ == '__main__':
+    main()
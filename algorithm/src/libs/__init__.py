@@ -1,9 +1,53 @@
-from .database import *
-from .mongo import *
-from .logger import *
-from .exchange import *
-from .bot import *
-from .account import *
-from .algorithm import *
-from .ohlcv_algo import *
-from .cross_ma import *
\ No newline at end of file
+"""
+Modules are imported on first access to their names, so a service pays
+only for the dependencies it uses: ccxt, pandas and numpy are not loaded
+by services which need only HTTP and Mongo.
+"""
+import importlib
+
+_modules = {
+    'database': ['Database'],
+    'mongo': ['MongoDB'],
+    'logger': ['Logger', 'log', 'log_exception'],
+    'data_service_api': [
+        'DataServiceAPI',
+        'DataServiceAPIError',
+        'DataServiceAPITimeout',
+        'DataServiceAPIConnectionError',
+        'DataServiceAPIHTTPError',
+        'DataServiceAPIResponseError'
+    ],
+    'exchange': ['Exchange'],
+    'bot': ['Bot'],
+    'account': ['Account'],
+    'ledger': ['Ledger'],
+    'scheduler': ['CandleScheduler', 'CandleWaiter'],
+    'tracing': ['Tracer', 'tracer'],
+    'indicators': ['Indicator', 'create_indicators', 'indicator_classes'],
+    'algo_host': ['AlgoHost', 'PairFeed'],
+    'backtest': ['Backtest', 'HistorySource', 'SimExchange', 'load_ohlcv'],
+    'algorithm': ['Algorithm'],
+    'ohlcv_algo': ['OHLCV_Algorithm'],
+    'cross_ma': ['Cross_MA']
+}
+
+_names = {
+    name: module for module, names in _modules.items() for name in names
+}
+
+__all__ = list(_names.keys())
+
+
+def __getattr__(name):
+    if name in _names:
+        value = getattr(
+            importlib.import_module(f".{_names[name]}", __name__),
+            name
+            )
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
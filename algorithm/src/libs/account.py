@@ -73,20 +73,17 @@ class Account():
     
 
     def make_operation(self, operation_type, bot_id, amount=None):
-        res = False
+        """
+        Apply bot operation, return balance diff or None if not applied
+        """
+        res = None
         try:
             if bot_id in self.bots.keys():
-                self.apply_bot_operation(
-                    self.bots[bot_id].make_operation(operation_type, amount)
-                    )
-                res = True
+                res = self.bots[bot_id].make_operation(operation_type, amount)
+                self.apply_bot_operation(res)
         except Exception as e:
-            res = False
-            log(
-                f"Exception in Accounts:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            res = None
+            log_exception('Accounts', e, self.logger)
         return res
 
 
@@ -0,0 +1,325 @@
+import os
+import numpy as np
+from .logger import *
+from .data_service_api import *
+from .tracing import tracer, Tracer
+from .scheduler import candle_periods, CandleWaiter
+
+
+class PairFeed():
+    """
+    1m closes of one (exchange, pair) shared by the bots trading it
+
+    History is fetched once for the longest period any bot asks for and
+    polled once per candle for all of them. Moving averages of every
+    distinct window the bots use are updated once per candle with
+    compensated running sums, averages of the last candles are kept in
+    averages[window].
+    """
+
+    # running sums are recomputed from the history after this many candles
+    resync_interval = 65536
+    # batches shorter than this are added candle by candle
+    batch_threshold = 16
+
+    def __init__(self, ohlcv_data_service_api, exchange, pair, logger=None):
+        self.ohlcv_data_service_api = ohlcv_data_service_api
+        self.exchange = exchange
+        self.pair = pair
+        self.logger = logger
+        self.subscribers = []
+        # history is kept in a buffer twice as long as needed, the last
+        # period candles are moved to the front when it is full
+        self.period = 0
+        self.buffer = np.zeros((2, 0))
+        self.end = 0
+        self.last_read_timestamp = 0
+        # window -> [sum, compensation] of the last window closes
+        self.sums = {}
+        self.averages = {}
+        self.since_resync = 0
+        self.new_ohlcv = []
+        self.trace = None
+
+
+    def subscribe(self, algo, period):
+        """
+        Add a bot, make sure history covers period candles
+        """
+        if not(algo in self.subscribers):
+            self.subscribers.append(algo)
+        if period > self.period:
+            self.load(period)
+        return self
+
+
+    def load(self, period):
+        """
+        Fetch history of period candles, running sums are recomputed
+        """
+        self.exchange.set_periods_params(
+            period,
+            int(period / 10)
+            )
+        result = self.ohlcv_data_service_api.get_close(
+            self.exchange.exchange_name,
+            self.pair,
+            '1m',
+            self.exchange.calc_from_timestamp()
+            )
+        self.period = period
+        self.buffer = np.zeros((2, 2 * period))
+        self.end = 0
+        self.append(np.array([
+            [item['timestamp'] for item in result],
+            [item['close'] for item in result]
+            ], dtype=np.float64))
+        self.last_read_timestamp = self.buffer[0, self.end - 1]
+        for window in self.sums:
+            self.resync(window)
+
+
+    def history(self):
+        """
+        Closes in chronological order, view of the buffer
+        """
+        return self.buffer[1, :self.end]
+
+
+    def timeseries(self, period):
+        """
+        Last period timestamps and closes, copy
+        """
+        return self.buffer[:, max(0, self.end - period):self.end].copy()
+
+
+    def append(self, tohlcv):
+        count = tohlcv.shape[1]
+        if self.end + count > self.buffer.shape[1]:
+            keep = min(self.end, self.period)
+            size = max(self.buffer.shape[1], keep + count)
+            buffer = np.zeros((2, size))
+            buffer[:, :keep] = self.buffer[:, self.end - keep:self.end]
+            self.buffer = buffer
+            self.end = keep
+        self.buffer[:, self.end:self.end + count] = tohlcv
+        self.end += count
+
+
+    def add_window(self, window):
+        """
+        Keep moving average of window closes, shared by bots using it
+        """
+        if not(window in self.sums):
+            self.resync(window)
+            self.averages[window] = np.array([self.sums[window][0] / window])
+
+
+    def resync(self, window):
+        self.sums[window] = [float(np.sum(self.history()[-window:])), 0.0]
+        self.since_resync = 0
+
+
+    @staticmethod
+    def compensated_add(total, compensation, value):
+        """
+        Neumaier summation step, returns new (total, compensation)
+        """
+        res = total + value
+        if abs(total) >= abs(value):
+            compensation += (total - res) + value
+        else:
+            compensation += (value - res) + total
+        return res, compensation
+
+
+    def update_averages(self, count):
+        """
+        Averages of every window for the last count candles, O(count) per window
+        """
+        closes = self.history()
+        added = closes[-count:]
+        for window, (total, compensation) in self.sums.items():
+            if closes.shape[0] < window + count:
+                # the closes leaving the window are not all in the history
+                # yet, averages are summed from it until they are
+                self.sums[window] = [float(np.sum(closes[-window:])), 0.0]
+                self.averages[window] = self.history_averages(window, count)
+                continue
+            dropped = closes[-count - window:-window]
+            if count < self.batch_threshold:
+                averages = np.empty(count)
+                for i in range(count):
+                    total, compensation = self.compensated_add(
+                        *self.compensated_add(total, compensation, added[i]),
+                        -dropped[i]
+                        )
+                    averages[i] = (total + compensation) / window
+                self.sums[window] = [total, compensation]
+            else:
+                sums = total + compensation + np.cumsum(added - dropped)
+                averages = sums / window
+                self.sums[window] = [float(sums[-1]), 0.0]
+            self.averages[window] = averages
+        self.since_resync += count
+        if self.since_resync >= self.resync_interval:
+            for window in self.sums:
+                self.resync(window)
+
+
+    def history_averages(self, window, count):
+        """
+        Averages of window closes from the history, for those of the last
+        count candles with window closes up to them, may be empty
+        """
+        closes = self.history()
+        sums = np.concatenate(([0.0], np.cumsum(closes)))
+        ends = np.arange(max(window, closes.shape[0] - count + 1), closes.shape[0] + 1)
+        return (sums[ends] - sums[ends - window]) / window
+
+
+    def poll(self):
+        """
+        Fetch closed candles since the last one, True if there are new
+        """
+        cur_timestamp = self.exchange.get_current_exchange_timestamp()
+        if cur_timestamp - self.last_read_timestamp < self.exchange.periods['1m']:
+            return False
+        try:
+            new_ohlcv = self.ohlcv_data_service_api.get_close(
+                self.exchange.exchange_name,
+                self.pair,
+                '1m',
+                self.last_read_timestamp
+                )
+        except DataServiceAPIError as e:
+            log_exception('PairFeed', e, self.logger)
+            return False
+        if len(new_ohlcv) == 0:
+            return False
+        self.add_candles(new_ohlcv)
+        self.trace = tracer.stamp(
+            self.ohlcv_data_service_api.last_trace,
+            'algo_fetch'
+            )
+        return True
+
+
+    def add_candles(self, new_ohlcv):
+        self.new_ohlcv = new_ohlcv
+        self.append(np.array([
+            [item['timestamp'] for item in new_ohlcv],
+            [item['close'] for item in new_ohlcv]
+            ], dtype=np.float64))
+        self.last_read_timestamp = new_ohlcv[-1]['timestamp']
+        self.update_averages(len(new_ohlcv))
+
+
+class AlgoHost():
+    """
+    Runs many bots in one process: one feed per (exchange, pair), one
+    exchange connection per exchange and shared data service clients.
+    A bot failing on a candle is logged and does not stop the others.
+    The host sleeps until the next candle of the most behind feed is due.
+    """
+
+    def __init__(self, db, logger, algorithm_class, bot_ids=None, backoff_max=0.0):
+        """
+        :param algorithm_class: Algorithm subclass of the bots
+        :param bot_ids: bots to run, active bots of the database if None
+        :param backoff_max: max seconds between polls while a candle is due
+        """
+        self.db = db
+        self.logger = logger
+        self.waiter = CandleWaiter(candle_periods['1m'], backoff_max=backoff_max)
+        self.exchanges = {}
+        self.feeds = {}
+        self.ohlcv_data_service_api = DataServiceAPI(
+            os.environ.get("OHLCV_REST_API_BASE_URL"),
+            os.environ.get("REST_API_USER"),
+            os.environ.get("REST_API_PASSWORD"),
+            logger
+            )
+        self.account_data_service_api = DataServiceAPI(
+            os.environ.get("ACCOUNTS_REST_API_BASE_URL"),
+            os.environ.get("REST_API_USER"),
+            os.environ.get("REST_API_PASSWORD"),
+            logger
+            )
+        self.algos = {}
+        for bot_id in db.get_active_bots() if bot_ids is None else bot_ids:
+            try:
+                self.algos[bot_id] = algorithm_class(db, bot_id, logger, self)
+            except Exception as e:
+                log_exception('AlgoHost', e, logger)
+
+
+    def subscribe(self, algo, period):
+        """
+        Feed of the bot's pair with history of period candles
+        """
+        key = (algo.bot.exchange_id, algo.bot.pair)
+        if not(key in self.feeds):
+            self.feeds[key] = PairFeed(
+                self.ohlcv_data_service_api,
+                algo.bot.exchange,
+                algo.bot.pair,
+                self.logger
+                )
+        return self.feeds[key].subscribe(algo, period)
+
+
+    def dispatch(self, feed):
+        """
+        New candles of the feed to every bot subscribed to it
+        """
+        for algo in feed.subscribers:
+            algo.new_ohlcv = feed.new_ohlcv
+            algo.last_read_timestamp = feed.last_read_timestamp
+            algo.trace = Tracer.copy(feed.trace)
+            try:
+                algo.process_new_data()
+            except Exception as e:
+                log_exception('AlgoHost', e, self.logger)
+
+
+    def process(self):
+        """
+        Poll every feed, True if any had new candles
+        """
+        res = False
+        for feed in self.feeds.values():
+            if feed.poll():
+                self.dispatch(feed)
+                res = True
+        return res
+
+
+    def run_forever(self):
+        while not self.waiter.stopped:
+            if self.process():
+                self.waiter.received()
+            if len(self.feeds) == 0:
+                self.waiter.wait(self.waiter.late_backoff_max)
+                continue
+            self.waiter.wait(self.delay())
+
+
+    def delay(self):
+        """
+        Seconds to the next poll, for the most behind feed which is not
+        late: a pair without candles, e.g. halted, does not slow down
+        polling of the others, it is polled along with them
+        """
+        now = min(feed.exchange.get_current_exchange_timestamp() for feed in self.feeds.values())
+        last = [feed.last_read_timestamp for feed in self.feeds.values()]
+        on_time = [timestamp for timestamp in last if not self.waiter.late(timestamp, now)]
+        return self.waiter.delay(min(on_time or last), now)
+
+
+    def notify_candle(self):
+        self.waiter.notify()
+
+
+    def stop(self):
+        self.waiter.stop()
@@ -4,35 +4,92 @@ from .logger import *
 from .bot import *
 from .mongo import *
 from .data_service_api import *
+from .tracing import tracer
+from .scheduler import CandleWaiter
 
 class Algorithm():
     
-    def __init__(self, db, bot_id, logger):
-        self.bot= Bot(db, bot_id)
-        self.account_data_service_api = DataServiceAPI(
-            os.environ.get("ACCOUNTS_REST_API_BASE_URL"),
-            os.environ.get("REST_API_USER"),
-            os.environ.get("REST_API_PASSWORD"),
-            logger
-            )
+    def __init__(self, db, bot_id, logger, host=None):
+        """
+        :param host: AlgoHost running the bot with others, shares
+            exchanges, data service clients and candle feeds
+        """
+        self.host = host
+        if host is None:
+            self.bot = Bot(db, bot_id)
+            self.account_data_service_api = DataServiceAPI(
+                os.environ.get("ACCOUNTS_REST_API_BASE_URL"),
+                os.environ.get("REST_API_USER"),
+                os.environ.get("REST_API_PASSWORD"),
+                logger
+                )
+        else:
+            self.bot = Bot(db, bot_id, host.exchanges)
+            self.account_data_service_api = host.account_data_service_api
         self.logger = logger
+        self.waiter = CandleWaiter(
+            self.bot.exchange.periods['1m'],
+            backoff_max=float(os.environ.get("POLL_BACKOFF_MAX") or 0.0)
+            )
         self.algorithm_id = self.bot.algorithm_id
         self.set_params(db.get_algorithm(self.algorithm_id))
         self.last_read_timestamp = 0
+        # trace of the candle being processed
+        self.trace = None
         self.initialize()
 
 
     def process(self):
         if self.get_data_from_exchange():
-            self.process_data()
+            self.process_new_data()
+
+
+    def run_forever(self):
+        """
+        Process candles as they come, sleeping until the next one is due
+        """
+        while not self.waiter.stopped:
+            if self.get_data_from_exchange():
+                self.process_new_data()
+                self.waiter.received()
+            self.waiter.wait(self.waiter.delay(
+                self.last_read_timestamp,
+                self.bot.exchange.get_current_exchange_timestamp()
+                ))
+
+
+    def notify_candle(self):
+        """
+        A new candle is available, wake run_forever up to fetch it
+        """
+        self.waiter.notify()
+
+
+    def stop(self):
+        self.waiter.stop()
+
+
+    def process_new_data(self):
+        self.process_data()
+        # without operation the trace ends here, otherwise
+        # the accounts service finishes it
+        if not(self.trace is None):
+            tracer.finish(tracer.stamp(self.trace, 'process_data'))
+            self.trace = None
 
 
     def make_operation(self, operation_type, amount=None):
-        self.account_data_service_api.post_operation(
-            operation_type,
-            self.bot.bot_id,
-            amount
-            )
+        trace = tracer.stamp(self.trace, 'process_data')
+        self.trace = None
+        try:
+            self.account_data_service_api.post_operation(
+                operation_type,
+                self.bot.bot_id,
+                amount,
+                trace
+                )
+        except DataServiceAPIError as e:
+            log_exception('Algorithm', e, self.logger)
 
 
     @abstractmethod
@@ -0,0 +1,127 @@
+import asyncio
+import aiohttp
+from .logger import *
+from .data_service_api import *
+
+
+class AsyncDataServiceAPI(DataServiceAPI):
+    """
+    asyncio counterpart of DataServiceAPI
+
+    Has the same methods, each returns an awaitable. At most concurrency
+    requests are in flight at once. Use as async context manager or call
+    close() to release connections.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        user_name,
+        password,
+        logger=None,
+        timeout=(3.05, 10.0),
+        retries=3,
+        backoff=0.25,
+        backoff_max=5.0,
+        concurrency=10
+    ):
+        self.base_url = base_url
+        self.auth = aiohttp.BasicAuth(user_name or '', password or '')
+        self.logger = logger
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=timeout[0],
+            sock_read=timeout[1]
+            )
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.concurrency = concurrency
+        self.session = None
+        self.semaphore = None
+        self.last_trace = None
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+    def get_session(self):
+        # session and semaphore are bound to the running loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                auth=self.auth,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.concurrency)
+                )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.session
+
+
+    async def close(self):
+        if not(self.session is None):
+            await self.session.close()
+            self.session = None
+
+
+    async def request(self, method, url, idempotent=True, **kwargs):
+        """
+        Send request with retries and return decoded json
+
+        :param method: GET, POST...
+        :param url: url relative to base url
+        :param idempotent: allow retries after the request was sent
+        """
+        full_url = f"{self.base_url}/{url}"
+        session = self.get_session()
+        for attempt in range(self.retries + 1):
+            async with self.semaphore:
+                try:
+                    async with session.request(method, full_url, **kwargs) as response:
+                        if response.status == 200:
+                            self.last_trace = Tracer.from_header(response.headers)
+                            try:
+                                return await response.json(content_type=None)
+                            except ValueError as e:
+                                raise DataServiceAPIResponseError(
+                                    str(e),
+                                    full_url,
+                                    response.status
+                                    )
+                        error = DataServiceAPIHTTPError(
+                            f"{method} {full_url} returned {response.status}",
+                            full_url,
+                            response.status
+                            )
+                        if not(response.status in self.retry_statuses):
+                            raise error
+                except aiohttp.ClientConnectorError as e:
+                    error = DataServiceAPIConnectionError(str(e), full_url)
+                except asyncio.TimeoutError as e:
+                    error = DataServiceAPITimeout(str(e) or 'timeout', full_url)
+                    if not idempotent:
+                        raise error
+                except aiohttp.ClientError as e:
+                    error = DataServiceAPIConnectionError(str(e), full_url)
+                    if not idempotent:
+                        raise error
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff_delay(attempt))
+        raise error
+
+
+    async def get_request(self, url):
+        return await self.request('GET', url)
+
+
+    async def post_request(self, url, data={}, trace=None):
+        return await self.request(
+            'POST',
+            url,
+            idempotent=False,
+            data=data,
+            headers=Tracer.to_header(trace)
+            )
@@ -0,0 +1,296 @@
+"""
+Backtests of live algorithms on historical candles
+
+Backtest runs an unmodified Algorithm subclass on history as an
+AlgoHost does live: the candles come through a PairFeed, one per step,
+and operations go through the account API to a Bot. Services are
+simulated: HistorySource answers like the OHLCV reader up to the
+simulated clock, SimExchange quotes prices from history and SimAccountAPI
+applies operations to the Bot, so fills follow Bot semantics (fee,
+buy_all, sell_all). An operation decided on a candle is filled at the
+open of the next one.
+
+Algorithms with a vectorized_signals classmethod also have a batch
+path: signals of all candles are computed at once, fills are applied
+per operation and the equity curve is vectorized.
+"""
+import numpy as np
+from .logger import *
+from .database import *
+from .exchange import *
+from .bot import *
+from .algo_host import AlgoHost
+
+
+OHLCV_TIMESTAMP = 0
+OHLCV_OPEN = 1
+OHLCV_HIGH = 2
+OHLCV_LOW = 3
+OHLCV_CLOSE = 4
+OHLCV_VOLUME = 5
+
+
+def load_ohlcv(db, exchange_id, pair, period='1m', from_timestamp=None):
+    """
+    Candles of Database.get_ohlcv as an array of timestamp, open, high,
+    low, close, volume rows, ascending
+    """
+    res = db.get_ohlcv(exchange_id, pair, period, from_timestamp)
+    if res is None or len(res) == 0:
+        return np.zeros((0, len(Exchange.tohlcv_columns)))
+    res = res[Exchange.tohlcv_columns].to_numpy(dtype=np.float64)
+    return res[res[:, OHLCV_TIMESTAMP].argsort()]
+
+
+class HistorySource():
+    """
+    Candles up to the simulated clock, as the OHLCV reader returns them
+
+    clock is the index of the last closed candle. The clock is moved
+    forward when an algorithm asks for more history than has closed.
+    """
+
+    last_trace = None
+
+    def __init__(self, ohlcv, period='1m'):
+        self.ohlcv = ohlcv
+        self.timestamps = ohlcv[:, OHLCV_TIMESTAMP]
+        self.period = period
+        self.period_ms = Exchange.periods[period]
+        self.clock = -1
+
+
+    def require(self, candles):
+        """
+        Move the clock so that candles candles have closed
+        """
+        self.clock = max(self.clock, min(candles, self.ohlcv.shape[0]) - 1)
+
+
+    def now(self):
+        """
+        Close time of the last closed candle, ms
+        """
+        return self.timestamps[self.clock] + self.period_ms
+
+
+    def get_close(self, exchange, pair, period, from_timestamp):
+        first = np.searchsorted(self.timestamps, from_timestamp, side='right')
+        return [
+            {'timestamp': self.timestamps[i], 'close': self.ohlcv[i, OHLCV_CLOSE]}\
+                for i in range(first, self.clock + 1)
+            ]
+
+
+class SimExchange(Exchange):
+    """
+    Exchange of a backtest: clock and prices from history
+
+    Operations are filled at the open of the candle after the clock,
+    at the close of the last candle at the end of history. ask and bid
+    are spread / 2 above and below.
+    """
+
+    def __init__(self, source, exchange_name='backtest', pairs=None, fee=0.002, spread=0.0):
+        super().__init__()
+        self.source = source
+        self.exchange_id = exchange_name
+        self.exchange_name = exchange_name
+        self.pairs = [] if pairs is None else pairs
+        self.fee = fee
+        self.spread = spread
+
+
+    def get_current_exchange_timestamp(self):
+        return self.source.now()
+
+
+    def calc_from_timestamp(self):
+        self.source.require(self.history_period)
+        return self.source.now() - self.periods[self.source.period] * (self.history_period + 1)
+
+
+    def fill_price(self):
+        if self.source.clock + 1 < self.source.ohlcv.shape[0]:
+            return self.source.ohlcv[self.source.clock + 1, OHLCV_OPEN]
+        return self.source.ohlcv[self.source.clock, OHLCV_CLOSE]
+
+
+    def get_ticker(self):
+        price = self.fill_price()
+        return {
+            'ask': price * (1.0 + self.spread / 2.0),
+            'bid': price * (1.0 - self.spread / 2.0)
+            }
+
+
+    def get_price(self, amount):
+        return self.get_ticker()
+
+
+class SimDatabase(Database):
+    """
+    Bot and algorithm documents of a backtest
+    """
+
+    def __init__(self, exchange_id, pair, params, balance, logger=None):
+        super().__init__(logger)
+        self.exchange_id = exchange_id
+        self.pair = pair
+        self.params = params
+        self.balance = balance
+
+
+    def get_bot(self, bot_id):
+        return self.exchange_id, self.pair, 'backtest', 'backtest', 'active'
+
+
+    def get_algorithm(self, algorithm_id):
+        return self.params
+
+
+    def get_bot_last_balance(self, bot_id):
+        return dict(self.balance)
+
+
+class SimAccountAPI():
+    """
+    Account API of a backtest: operations are applied to the bots
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.bots = {}
+        self.operations = []
+
+
+    def post_operation(self, operation_type, bot_id, amount, trace=None):
+        bot = self.bots[bot_id]
+        price = bot.exchange.get_ticker()
+        diff = bot.make_operation(operation_type, amount)
+        self.operations.append({
+            'index': self.source.clock,
+            'timestamp': self.source.timestamps[self.source.clock],
+            'type': operation_type,
+            'ask': price['ask'],
+            'bid': price['bid'],
+            'diff': diff,
+            'balance': dict(bot.balance)
+            })
+        return diff
+
+
+class Backtest(AlgoHost):
+    """
+    Run an algorithm on history
+
+    run() feeds candles one by one to the algorithm, run_vectorized()
+    uses its vectorized_signals. Both return the same result: operations
+    and equity curve in quote currency after every candle from the
+    first decision on.
+    """
+
+    bot_id = 'backtest'
+
+    def __init__(
+        self,
+        algorithm_class,
+        params,
+        ohlcv,
+        pair='BTC/USDT',
+        fee=0.002,
+        spread=0.0,
+        balance=None,
+        logger=None
+    ):
+        """
+        :param algorithm_class: Algorithm subclass
+        :param params: algorithm params
+        :param ohlcv: array of timestamp, open, high, low, close, volume rows
+        :param pair: traded pair, base/quote
+        :param fee: exchange fee
+        :param spread: relative difference of ask and bid
+        :param balance: initial balance, 1 of base currency by default
+        """
+        self.logger = logger
+        self.algorithm_class = algorithm_class
+        self.params = params
+        self.ohlcv = np.ascontiguousarray(ohlcv, dtype=np.float64)
+        self.pair = pair
+        symbols = pair.split('/')
+        self.balance = {symbols[0]: 1.0, symbols[1]: 0.0} if balance is None else balance
+        self.source = HistorySource(self.ohlcv)
+        self.exchange = SimExchange(self.source, pairs=[pair], fee=fee, spread=spread)
+        self.exchanges = {self.exchange.exchange_id: self.exchange}
+        self.feeds = {}
+        self.algos = {}
+        self.ohlcv_data_service_api = self.source
+        self.account_data_service_api = SimAccountAPI(self.source)
+        self.db = SimDatabase(self.exchange.exchange_id, pair, params, self.balance, logger)
+
+
+    def run(self):
+        algo = self.algorithm_class(self.db, self.bot_id, self.logger, self)
+        self.algos[self.bot_id] = algo
+        self.account_data_service_api.bots[self.bot_id] = algo.bot
+        start = self.source.clock + 1
+        symbols = algo.bot.symbols
+        equity = np.empty(max(0, self.ohlcv.shape[0] - start))
+        for i in range(equity.shape[0]):
+            self.source.clock = start + i
+            self.process()
+            equity[i] = algo.bot.balance[symbols[0]] * self.ohlcv[start + i, OHLCV_CLOSE] +\
+                algo.bot.balance[symbols[1]]
+        return self.result(start, self.account_data_service_api.operations, equity, algo.bot.balance)
+
+
+    def run_vectorized(self, start=None):
+        """
+        :param start: candles of history the algorithm takes, the first
+            decision is made on candle start. As run() does by default:
+            history_candles of the algorithm, or all candles if fewer
+        """
+        if start is None:
+            start = min(
+                self.algorithm_class.history_candles(self.params),
+                self.ohlcv.shape[0]
+                )
+        signals = self.algorithm_class.vectorized_signals(
+            self.params,
+            self.ohlcv[:, OHLCV_CLOSE],
+            start
+            )
+        bot = Bot()
+        bot.bot_id = self.bot_id
+        bot.pair = self.pair
+        bot.symbols = self.pair.split('/')
+        bot.balance = dict(self.balance)
+        bot.exchange = self.exchange
+        api = SimAccountAPI(self.source)
+        api.bots[self.bot_id] = bot
+        for i in np.flatnonzero(signals):
+            self.source.clock = i
+            api.post_operation('buy_all' if signals[i] > 0 else 'sell_all', self.bot_id, None)
+
+        # balances after every operation hold until the next one
+        indices = np.array([operation['index'] for operation in api.operations], dtype=np.int64)
+        steps = np.searchsorted(indices, np.arange(start, self.ohlcv.shape[0]), side='right')
+        base = np.array([self.balance[bot.symbols[0]]] + [operation['balance'][bot.symbols[0]] for operation in api.operations])
+        quote = np.array([self.balance[bot.symbols[1]]] + [operation['balance'][bot.symbols[1]] for operation in api.operations])
+        equity = base[steps] * self.ohlcv[start:, OHLCV_CLOSE] + quote[steps]
+        return self.result(start, api.operations, equity, bot.balance)
+
+
+    def result(self, start, operations, equity, balance):
+        peak = np.maximum.accumulate(equity) if equity.shape[0] > 0 else equity
+        # without balance there is nothing to return on or draw down from
+        funded = equity.shape[0] > 0 and equity[0] > 0
+        return {
+            'start': start,
+            'timestamps': self.ohlcv[start:, OHLCV_TIMESTAMP],
+            'equity': equity,
+            'operations': operations,
+            'balance': dict(balance),
+            'return': equity[-1] / equity[0] - 1.0 if funded else 0.0,
+            'max_drawdown': float(np.max(1.0 - equity / peak)) if funded else 0.0
+            }
@@ -7,16 +7,25 @@ class Bot():
     symbols = []
     order_types = ['buy', 'sell', 'buy_all', 'sell_all']
 
-    def __init__(self, db=None, bot_id=None):
+    def __init__(self, db=None, bot_id=None, exchanges=None):
         if not(db is None):
-            self.init_from_db(db, bot_id)
+            self.init_from_db(db, bot_id, exchanges)
 
 
-    def init_from_db(self, db, bot_id):
+    def init_from_db(self, db, bot_id, exchanges=None):
+        """
+        :param exchanges: exchange_id -> Exchange shared between bots,
+            filled with exchanges it does not have yet
+        """
         self.bot_id = bot_id
         self.exchange_id, self.pair, self.algorithm_id, self.type, self.state = db.get_bot(bot_id)
         self.symbols = self.pair.split('/')
-        self.exchange = Exchange(db, self.exchange_id)
+        if exchanges is None:
+            self.exchange = Exchange(db, self.exchange_id)
+        else:
+            if not(self.exchange_id in exchanges):
+                exchanges[self.exchange_id] = Exchange(db, self.exchange_id)
+            self.exchange = exchanges[self.exchange_id]
         self.balance = {symbol: 0.0 for symbol in self.symbols}
         self.init_balances_from_db(db)
 
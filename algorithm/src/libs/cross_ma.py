@@ -3,32 +3,78 @@ from .algorithm import *
 from .ohlcv_algo import *
 
 class Cross_MA(OHLCV_Algorithm):
-    
-    def __init__(self, db, bot_id, logger):
-        super().__init__(db, bot_id, logger)
+    """
+    Moving averages crossing
+
+    Last long_window closes are kept in a ring buffer, sums of the short
+    and the long windows are updated per candle with compensated
+    summation, so a candle costs O(1). Batches of candles after a pause
+    are applied vectorized. When the averages are too close for the
+    running sums to tell the sign, both are recomputed with np.average
+    over the window, so crossings are the same as of plain averages.
+
+    Run by an AlgoHost, the averages come from the pair feed, which
+    computes every distinct window once for all bots of the pair.
+    """
+
+    # running sums are recomputed from the window after this many candles
+    resync_interval = 65536
+    # relative difference of averages treated as a possible tie
+    tie_tolerance = 1e-9
+    # batches shorter than this are applied candle by candle
+    batch_threshold = 16
+    # possible ties of vectorized averages, wider than tie_tolerance to
+    # cover rounding of prefix sums, rechecked the same way
+    vectorized_tie_tolerance = 1e-7
+
+    def __init__(self, db, bot_id, logger, host=None):
+        super().__init__(db, bot_id, logger, host)
+
 
-    
     def set_params(self, params):
         self.short_window = params['short_window']
         self.long_window = params['long_window']
         self.mode = params['mode']
 
-    
+
+    @staticmethod
+    def history_candles(params):
+        """
+        Candles of history initialize takes
+        """
+        return params['long_window'] + params['mode'] + 1
+
+
     def initialize(self):
         self.initialize_ohlcv_from_period(
-            self.long_window + self.mode + 1
+            self.history_candles({'long_window': self.long_window, 'mode': self.mode})
             )
-        self.ma_long = self.moving_average(
-            self.timeseries[1,:],
+        closes = self.timeseries[1,:].astype(np.float64)
+        ma_long = self.moving_average(
+            closes,
             self.long_window
             )
-        self.ma_short = self.moving_average(
-            self.timeseries[1,:],
+        ma_short = self.moving_average(
+            closes,
             self.short_window
             )
-        self.ma_long_len = self.ma_long.shape[0]
-        self.ma_short_len = self.ma_short.shape[0]
+        # history is kept in the ring buffer or the feed from now on
+        self.timeseries = None
+
+        if self.feed is None:
+            self.closes = np.ascontiguousarray(closes[-self.long_window:])
+            self.closes_pos = 0
+            self.resync()
+        else:
+            self.feed.add_window(self.short_window)
+            self.feed.add_window(self.long_window)
+
+        self.signs = [float(item) for item in np.sign(
+            ma_short[-self.mode:] - ma_long[-self.mode:]
+            )]
+        self.signs_pos = 0
         self.prev_cross_temp = self.calc_cross()
+        self.cross = self.prev_cross_temp
 
 
     def moving_average(self, np_array, window_size):
@@ -37,40 +83,230 @@ class Cross_MA(OHLCV_Algorithm):
             np.ones(window_size), 'valid') / window_size
 
 
-    def calc_new_ma(self, ma_array, window_size):
+    @staticmethod
+    def compensated_add(total, compensation, value):
+        """
+        Neumaier summation step, returns new (total, compensation)
+        """
+        res = total + value
+        if abs(total) >= abs(value):
+            compensation += (total - res) + value
+        else:
+            compensation += (value - res) + total
+        return res, compensation
+
+
+    def window(self, size):
+        """
+        Last size closes in chronological order
+        """
         return np.concatenate((
-            ma_array,
-            [np.average(self.timeseries[1, -window_size:])]
+            self.closes[self.closes_pos:],
+            self.closes[:self.closes_pos]
+            ))[-size:]
+
+
+    def resync(self):
+        self.long_sum = float(np.sum(self.closes))
+        self.long_compensation = 0.0
+        self.short_sum = float(np.sum(self.window(self.short_window)))
+        self.short_compensation = 0.0
+        self.since_resync = 0
+
+
+    def calc_sign(self, ma_short, ma_long, history, end):
+        """
+        Sign of ma_short - ma_long, recomputed from the window if they are close
+
+        :param history: closes in chronological order
+        :param end: index in history after the last close of the windows
+        """
+        diff = ma_short - ma_long
+        if abs(diff) <= self.tie_tolerance * max(abs(ma_long), abs(ma_short)):
+            history = history()
+            diff = np.average(history[end - self.short_window:end]) -\
+                np.average(history[end - self.long_window:end])
+        return 0.0 if diff == 0 else float(np.sign(diff))
+
+
+    def push_sign(self, sign):
+        self.cross += sign - self.signs[self.signs_pos]
+        self.signs[self.signs_pos] = sign
+        self.signs_pos = (self.signs_pos + 1) % self.mode
+
+
+    def push_close(self, close):
+        """
+        Add a candle close, O(1)
+        """
+        short_drop = float(self.closes[(self.closes_pos - self.short_window) % self.long_window])
+        long_drop = float(self.closes[self.closes_pos])
+        self.closes[self.closes_pos] = close
+        self.closes_pos = (self.closes_pos + 1) % self.long_window
+
+        self.long_sum, self.long_compensation = self.compensated_add(
+            *self.compensated_add(self.long_sum, self.long_compensation, close),
+            -long_drop
+            )
+        self.short_sum, self.short_compensation = self.compensated_add(
+            *self.compensated_add(self.short_sum, self.short_compensation, close),
+            -short_drop
+            )
+        self.since_resync += 1
+        if self.since_resync >= self.resync_interval:
+            self.resync()
+
+        self.ma_long = (self.long_sum + self.long_compensation) / self.long_window
+        self.ma_short = (self.short_sum + self.short_compensation) / self.short_window
+        self.push_sign(self.calc_sign(
+            self.ma_short,
+            self.ma_long,
+            lambda: self.window(self.long_window),
+            self.long_window
             ))
-    
+
+
+    def push_closes(self, closes):
+        """
+        Add a batch of candle closes vectorized, only the last mode
+        averages are computed, earlier ones do not affect the crossing
+        """
+        count = closes.shape[0]
+        steps = np.arange(count)
+        # values leaving the windows at every step
+        long_drop = np.where(
+            steps < self.long_window,
+            self.closes[(self.closes_pos + steps) % self.long_window],
+            closes[np.maximum(steps - self.long_window, 0)]
+            )
+        short_drop = np.where(
+            steps < self.short_window,
+            self.closes[(self.closes_pos - self.short_window + steps) % self.long_window],
+            closes[np.maximum(steps - self.short_window, 0)]
+            )
+        long_sums = self.long_sum + self.long_compensation + np.cumsum(closes - long_drop)
+        short_sums = self.short_sum + self.short_compensation + np.cumsum(closes - short_drop)
+
+        last = min(count, self.mode)
+        ma_long = long_sums[-last:] / self.long_window
+        ma_short = short_sums[-last:] / self.short_window
+        previous = self.window(self.long_window)
+        history = lambda: np.concatenate((previous, closes))
+        for i in range(last):
+            self.push_sign(self.calc_sign(
+                ma_short[i],
+                ma_long[i],
+                history,
+                self.long_window + count - last + i + 1
+                ))
+
+        tail = min(count, self.long_window)
+        self.closes[(self.closes_pos + steps[-tail:]) % self.long_window] = closes[-tail:]
+        self.closes_pos = (self.closes_pos + count) % self.long_window
+        self.ma_long = ma_long[-1]
+        self.ma_short = ma_short[-1]
+        self.since_resync += count
+        if self.since_resync >= self.resync_interval:
+            self.resync()
+        else:
+            self.long_sum, self.long_compensation = float(long_sums[-1]), 0.0
+            self.short_sum, self.short_compensation = float(short_sums[-1]), 0.0
+
+
+    def push_feed_averages(self):
+        """
+        Take averages of the new candles from the feed
+        """
+        ma_long = self.feed.averages[self.long_window]
+        ma_short = self.feed.averages[self.short_window]
+        last = min(ma_long.shape[0], self.mode)
+        if last == 0:
+            # history of the feed is shorter than the long window yet
+            return
+        end = self.feed.end - last + 1
+        for i in range(last):
+            self.push_sign(self.calc_sign(
+                ma_short[i - last],
+                ma_long[i - last],
+                self.feed.history,
+                end + i
+                ))
+        self.ma_long = ma_long[-1]
+        self.ma_short = ma_short[-1]
+
 
     def calc_cross(self):
-        def filter_func(item):
-            return 0 if item == 0 else item / abs(item)
-        return np.sum(np.stack(np.vectorize(filter_func)(
-            self.ma_short[-self.mode:]-self.ma_long[-self.mode:]
-            )))
-    
+        return sum(self.signs)
 
-    def process_data(self):
-        for item in self.new_ohlcv:
-            self.timeseries = np.concatenate(
-                (
-                    self.timeseries,
-                    np.array([[item['timestamp']],[item['close']]])
-                    ),
-                axis=1
-                )
 
-            self.ma_long = self.calc_new_ma(
-                self.ma_long,
-                self.long_window
-                )
-            self.ma_short = self.calc_new_ma(
-                self.ma_short,
-                self.short_window
+    @classmethod
+    def vectorized_signals(cls, params, closes, start):
+        """
+        Operations the algorithm makes fed closes one candle at a time
+        after start candles of history: 1 buy_all, -1 sell_all, 0 none
+
+        :param params: algorithm params
+        :param closes: closes of all candles
+        :param start: candles of history given to initialize, at least
+            long_window + mode - 1 for mode averages of the long window,
+            see history_candles
+        """
+        short_window = params['short_window']
+        long_window = params['long_window']
+        mode = params['mode']
+        closes = np.asarray(closes, dtype=np.float64)
+        count = closes.shape[0]
+        if start < long_window + mode - 1 or start > count:
+            raise ValueError(
+                f"start {start} must be from long_window + mode - 1 = {long_window + mode - 1} "
+                f"to the number of candles {count}"
                 )
-        new_cross = self.calc_cross()
+        signs = np.zeros(count)
+
+        # history as initialize computes it
+        history = closes[:start]
+        ma_long = np.convolve(history, np.ones(long_window), 'valid') / long_window
+        ma_short = np.convolve(history, np.ones(short_window), 'valid') / short_window
+        signs[start - mode:start] = np.sign(ma_short[-mode:] - ma_long[-mode:])
+
+        # prefix sums around the first close keep rounding small
+        prefix = np.concatenate(([0.0], np.cumsum(closes - closes[0])))
+        ends = np.arange(start + 1, count + 1)
+        ma_long = (prefix[ends] - prefix[ends - long_window]) / long_window + closes[0]
+        ma_short = (prefix[ends] - prefix[ends - short_window]) / short_window + closes[0]
+        diff = ma_short - ma_long
+        signs[start:] = np.sign(diff)
+        ties = np.flatnonzero(
+            np.abs(diff) <= cls.vectorized_tie_tolerance * np.maximum(np.abs(ma_long), np.abs(ma_short))
+            )
+        for i in ties:
+            end = ends[i]
+            diff_i = np.average(closes[end - short_window:end]) -\
+                np.average(closes[end - long_window:end])
+            signs[start + i] = 0.0 if diff_i == 0 else np.sign(diff_i)
+
+        cross = np.convolve(signs, np.ones(mode))[:count]
+        res = np.zeros(count, dtype=np.int8)
+        previous = cross[start - 1:count - 1]
+        current = cross[start:]
+        res[start:][(previous < 0) & (current > 0)] = 1
+        res[start:][(previous > 0) & (current < 0)] = -1
+        return res
+
+
+    def process_data(self):
+        if not(self.feed is None):
+            self.push_feed_averages()
+        elif len(self.new_ohlcv) < self.batch_threshold:
+            for item in self.new_ohlcv:
+                self.push_close(float(item['close']))
+        else:
+            self.push_closes(np.fromiter(
+                (item['close'] for item in self.new_ohlcv),
+                dtype=np.float64,
+                count=len(self.new_ohlcv)
+                ))
+        new_cross = self.cross
 
         if (self.prev_cross_temp > 0) and (new_cross < 0):
             self.make_operation('sell_all')
@@ -78,9 +314,3 @@ class Cross_MA(OHLCV_Algorithm):
             self.make_operation('buy_all')
 
         self.prev_cross_temp = new_cross
-        self.ma_long = self.ma_long[-self.ma_long_len:]
-        self.ma_short = self.ma_short[-self.ma_short_len:]
-        self.timeseries = self.timeseries[:,-(self.long_window + self.mode + 1):]
-
-
-    
\ No newline at end of file
@@ -1,66 +1,191 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import time
+import random
 from .logger import *
-import inspect
+from .tracing import Tracer
+
+
+class DataServiceAPIError(Exception):
+    """
+    Base error of requests to data services
+    """
+
+    def __init__(self, message, url=None, status_code=None):
+        super().__init__(message)
+        self.url = url
+        self.status_code = status_code
+
+
+class DataServiceAPITimeout(DataServiceAPIError):
+    pass
+
+
+class DataServiceAPIConnectionError(DataServiceAPIError):
+    pass
+
+
+class DataServiceAPIHTTPError(DataServiceAPIError):
+    pass
+
+
+class DataServiceAPIResponseError(DataServiceAPIError):
+    pass
+
 
 class DataServiceAPI():
-    
-    def __init__(self, base_url, user_name, password, logger=None):
+
+    # statuses worth retrying: the service is overloaded or restarting
+    retry_statuses = [429, 502, 503, 504]
+
+    def __init__(
+        self,
+        base_url,
+        user_name,
+        password,
+        logger=None,
+        timeout=(3.05, 10.0),
+        retries=3,
+        backoff=0.25,
+        backoff_max=5.0,
+        pool_size=10
+    ):
+        """
+        :param base_url: base url of the service
+        :param user_name: REST API user
+        :param password: REST API password
+        :param logger: logger
+        :param timeout: (connect, read) timeouts, seconds
+        :param retries: number of retries after the first attempt
+        :param backoff: base delay of exponential backoff, seconds
+        :param backoff_max: max delay of exponential backoff, seconds
+        :param pool_size: number of keep-alive connections
+        """
         self.base_url = base_url
         self.auth = (user_name, password)
         self.logger = logger
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # trace of the candle of the last response, if the service sent one
+        self.last_trace = None
+
+
+    def backoff_delay(self, attempt):
+        """
+        Exponential backoff with full jitter
+
+        :param attempt: number of the failed attempt, from 0
+        """
+        return random.uniform(
+            0.0,
+            min(self.backoff_max, self.backoff * (2 ** attempt))
+            )
+
+
+    @staticmethod
+    def not_sent(error):
+        """
+        True if a connection error happened before the request was sent:
+        connection refused, host not resolved
+        """
+        reason = error.args[0] if len(error.args) > 0 else None
+        return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        """
+        Send request with retries and return decoded json
+
+        Non idempotent requests are retried only if connection was not
+        established, so an operation is never applied twice.
+
+        :param method: GET, POST...
+        :param url: url relative to base url
+        :param idempotent: allow retries after the request was sent
+        """
+        full_url = f"{self.base_url}/{url}"
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(
+                    method,
+                    full_url,
+                    timeout=self.timeout,
+                    **kwargs
+                    )
+            except requests.exceptions.ConnectTimeout as e:
+                error = DataServiceAPITimeout(str(e), full_url)
+            except requests.exceptions.Timeout as e:
+                error = DataServiceAPITimeout(str(e), full_url)
+                if not idempotent:
+                    raise error
+            except requests.exceptions.ConnectionError as e:
+                error = DataServiceAPIConnectionError(str(e), full_url)
+                if not(idempotent or self.not_sent(e)):
+                    raise error
+            except requests.exceptions.RequestException as e:
+                error = DataServiceAPIConnectionError(str(e), full_url)
+                if not idempotent:
+                    raise error
+            else:
+                if response.status_code == 200:
+                    self.last_trace = Tracer.from_header(response.headers)
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        raise DataServiceAPIResponseError(
+                            str(e),
+                            full_url,
+                            response.status_code
+                            )
+                error = DataServiceAPIHTTPError(
+                    f"{method} {full_url} returned {response.status_code}",
+                    full_url,
+                    response.status_code
+                    )
+                if not(response.status_code in self.retry_statuses):
+                    raise error
+            if attempt < self.retries:
+                time.sleep(self.backoff_delay(attempt))
+        raise error
 
 
     def get_request(self, url):
-        result = []
-        try:
-            response = requests.get(
-                f"{self.base_url}/{url}",
-                auth=self.auth
-                )
-            if response.status_code == 200:
-                result = response.json()
-        except Exception as e:
-            log(
-                f"Exception in DataServiceAPI:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
-        return result
-
-    
-    def post_request(self, url, data={}):
-        result = []
-        try:
-            response = requests.post(
-                f"{self.base_url}/{url}",
-                data=json.dumps(data),
-                auth=self.auth
-                )
-            if response.status_code == 200:
-                result = response.json()
-        except Exception as e:
-            log(
-                f"Exception in DataServiceAPI:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
-        return result
-
-
-    def get_ohlcv_request(self, type, exchange, pair, period, from_timestamp):
+        return self.request('GET', url)
+
+
+    def post_request(self, url, data={}, trace=None):
+        return self.request(
+            'POST',
+            url,
+            idempotent=False,
+            data=data,
+            headers=Tracer.to_header(trace)
+            )
+
+
+    def get_ohlcv_request(self, type, exchange, pair, period, from_timestamp, limit=None):
         return self.get_request(
-            f"{type}/{exchange}/{pair}/{period}/{from_timestamp}"
+            f"{type}/{exchange}/{pair}/{period}/{from_timestamp}" +\
+                ("" if limit is None else f"?limit={limit}")
             )
 
 
-    def get_ohlcv(self, exchange, pair, period, from_timestamp):
+    def get_ohlcv(self, exchange, pair, period, from_timestamp, limit=None):
         return self.get_ohlcv_request(
             'ohlcv',
             exchange,
             pair,
             period,
-            from_timestamp
+            from_timestamp,
+            limit
             )
 
 
@@ -73,24 +198,33 @@ class DataServiceAPI():
             from_timestamp
             )
 
-    
+
     def get_account_balances(self, account_id):
         return self.get_request(f"account_balances/{account_id}")
 
-    
-    def get_all_accounts_balances(self):
-        return self.get_request(f"all_accounts_balances")
 
-    
-    def get_all_bots_balances(self):
-        return self.get_request(f"all_bots_balances")
+    @staticmethod
+    def since_query(since):
+        return "" if since is None else f"?since={since}"
+
+
+    def get_all_accounts_balances(self, since=None):
+        return self.get_request(f"all_accounts_balances{self.since_query(since)}")
+
+
+    def get_all_bots_balances(self, since=None):
+        return self.get_request(f"all_bots_balances{self.since_query(since)}")
+
+
+    def get_all_balances(self, since=None):
+        return self.get_request(f"all_balances{self.since_query(since)}")
 
 
-    def post_operation(self, operation_type, bot_id, amount):
-        return self.post_request(
-            f"make_operation/{operation_type}/{bot_id}/{amount}",
-            {
-                'operation_type': operation_type,
-                'bot_id': bot_id,
-                'amount': amount
-                })
+    def post_operation(self, operation_type, bot_id, amount, trace=None):
+        data = {
+            'operation_type': operation_type,
+            'bot_id': bot_id
+            }
+        if not(amount is None):
+            data['amount'] = amount
+        return self.post_request("make_operation", data, trace)
@@ -1,13 +1,45 @@
 from abc import abstractmethod
-from ccxt import Exchange as ccxtExchange
 import time
-from .data_service_api import *
 from bson.objectid import ObjectId
 
 class Database():
 
+    # rollup tiers of balances collections: suffix -> bucket size, ms
+    balances_tiers = {
+        '1h': 3600000,
+        '1d': 86400000
+    }
+
+    # how long a tier keeps its own resolution before rollup, ms
+    balances_retention = {
+        '1m': 7 * 86400000,
+        '1h': 90 * 86400000
+    }
+
+    balances_not_currency_fields = [
+        '_id',
+        'account_id',
+        'bot_id',
+        'timestamp',
+        'rolled_up_at'
+    ]
+
     def __init__(self, logger=None):
         self.logger = logger
+        self.last_written_balances = {}
+
+
+    def set_balances_retention(self, raw_retention_days, hourly_retention_days):
+        """
+        Set how long balances keep 1m and 1h resolution
+
+        :param raw_retention_days: days to keep 1m balances before rollup to 1h
+        :param hourly_retention_days: days to keep 1h balances before rollup to 1d
+        """
+        self.balances_retention = {
+            '1m': int(float(raw_retention_days) * self.balances_tiers['1d']),
+            '1h': int(float(hourly_retention_days) * self.balances_tiers['1d'])
+        }
 
 
     @abstractmethod
@@ -20,6 +52,11 @@ class Database():
         return None
 
     
+    @abstractmethod
+    def get_last_timestamps(self):
+        return {}
+
+
     @abstractmethod
     def write_single_ohlcv(self, exchange_id, pair, period, tohlcv):
         pass
@@ -53,39 +90,98 @@ class Database():
     def write_operation(self, operation_type, account_id, bot_id, amount, pair):
         pass
 
+
+    @abstractmethod
+    def write_traces(self, traces):
+        pass
+
     
     def write_ohlcv(self, exchange, pair, period, tohlcv_list):
         list_len = len(tohlcv_list)
+        res = True
         if list_len > 1:
-            self.write_multiple_ohlcv(
+            res = self.write_multiple_ohlcv(
                 exchange,
                 pair,
                 period,
                 tohlcv_list
                 )
         elif list_len == 1:
-            self.write_single_ohlcv(
+            res = self.write_single_ohlcv(
                 exchange,
                 pair,
                 period,
                 tohlcv_list[0]
                 )
+        return res
 
 
     def write_accounts_balances(self, data):
-        data_len = len(data)
+        changed = self.filter_changed_balances(
+            data,
+            'account_id',
+            self.get_account_last_balance
+            )
+        data_len = len(changed)
+        res = True
         if data_len > 1:
-            self.write_multiple_account_balances(data)
+            res = self.write_multiple_account_balances(changed)
         elif data_len == 1:
-            self.write_single_account_balance(data[0])
+            res = self.write_single_account_balance(changed[0])
+        if res:
+            self.commit_written_balances(changed, 'account_id')
+        return res
     
 
     def write_bots_balances(self, data):
-        data_len = len(data)
+        changed = self.filter_changed_balances(
+            data,
+            'bot_id',
+            self.get_bot_last_balance
+            )
+        data_len = len(changed)
+        res = True
         if data_len > 1:
-            self.write_multiple_bots_balances(data)
+            res = self.write_multiple_bots_balances(changed)
         elif data_len == 1:
-            self.write_single_bot_balance(data[0])
+            res = self.write_single_bot_balance(changed[0])
+        if res:
+            self.commit_written_balances(changed, 'bot_id')
+        return res
+
+
+    def currency_fields(self, balance):
+        return {
+            symbol: value for symbol, value in balance.items()\
+                if not(symbol in self.balances_not_currency_fields)
+            }
+
+
+    def filter_changed_balances(self, data, id_field, get_last_balance):
+        """
+        Keep only balances which differ from the last written ones
+
+        :param data: list of balances
+        :param id_field: account_id or bot_id
+        :param get_last_balance: loader of the last balance from db,
+            used once per id after start
+        """
+        res = []
+        for balance in data:
+            key = (id_field, str(balance[id_field]))
+            if not(key in self.last_written_balances):
+                self.last_written_balances[key] = get_last_balance(
+                    balance[id_field]
+                    )
+            if self.currency_fields(balance) != self.last_written_balances[key]:
+                res.append(balance)
+        return res
+
+
+    def commit_written_balances(self, data, id_field):
+        for balance in data:
+            self.last_written_balances[(id_field, str(balance[id_field]))] =\
+                self.currency_fields(balance)
 
 
     def get_last_timestamp(self, exchange_id, pair, period):
@@ -123,6 +219,8 @@ class Database():
 
 
     def preprocess_ohlcv(self, exchange_id, pair, period, tohlcv):
+        # ccxt is heavy to import and is needed only by OHLCV writers
+        from ccxt import Exchange as ccxtExchange
         return {
             "exchange_id": exchange_id,
             "pair": pair,
@@ -4,14 +4,12 @@ import ccxt
 from .logger import *
 from .database import *
 from .mongo import *
+from .scheduler import candle_periods
+from .tracing import tracer
 
 class Exchange():
     
-    periods = {
-        '1m': 60000,
-        '1h': 3600000,
-        '1d': 86400000
-    }
+    periods = candle_periods
 
     tohlcv_columns = [
         "timestamp",
@@ -35,6 +33,8 @@ class Exchange():
         if not(db is None):
             self.init_from_db(db, exchange_id)
         self.logger = logger
+        # trace of the last fetched candle: (pair, period) -> trace
+        self.traces = {}
         
 
     def init_from_db(self, db, exchange_id):
@@ -78,7 +78,11 @@ class Exchange():
         
         while prev_from_timestamp != from_timestamp:
             try:
-                print(f"Loading OHLCVs starting from {from_timestamp}")
+                log(
+                    f"Loading OHLCVs {pair} {period} starting from {from_timestamp}",
+                    'debug',
+                    self.logger
+                    )
                 tohlcv_list_temp = self.exchange.fetch_ohlcv(
                     pair,
                     period,
@@ -94,11 +98,7 @@ class Exchange():
                 if len(tohlcv_list) > 0:
                     from_timestamp = tohlcv_list[-1][0] + 1
             except Exception as e:
-                log(
-                    f"Exception in Exchange:{inspect.stack()[0][3]}\n{e}",
-                    'exception',
-                    self.logger
-                    )
+                log_exception('Exchange', e, self.logger)
 
         cur_timestamp = self.exchange.milliseconds()
         cur_timestamp_cut = cur_timestamp - (cur_timestamp % self.periods[period])
@@ -125,7 +125,11 @@ class Exchange():
                         period,
                         from_timestamp
                         )
-                    print(temp)
+                    log(
+                        f"Loaded {temp.shape[0]} OHLCVs {pair} {period} from db",
+                        'debug',
+                        self.logger
+                        )
                     if temp.shape[0] > 0:
                         self.tohlcv[pair][period] = temp[self.tohlcv_columns]
                         self.update_tohlcv(pair, period)
@@ -136,11 +140,7 @@ class Exchange():
                             from_timestamp
                             )
                 except Exception as e:
-                    log(
-                        f"Exception in Exchange:{inspect.stack()[0][3]}\n{e}",
-                        'exception',
-                        self.logger
-                        )
+                    log_exception('Exchange', e, self.logger)
                     self.tohlcv[pair][period] = self.load_ohlcv_from_exchange(
                         pair,
                         period,
@@ -180,11 +180,33 @@ class Exchange():
                 last_timestamp + 1
                 )
             if tohlcv_new.shape[0] > 0:
+                self.traces[(pair, period)] = tracer.stamp(
+                    tracer.start(
+                        self.exchange_name,
+                        pair,
+                        period,
+                        tohlcv_new['timestamp'].iloc[-1],
+                        self.periods[period]
+                        ),
+                    'exchange_fetch'
+                    )
                 self.tohlcv[pair][period] = pd.concat(
                     [self.tohlcv[pair][period], tohlcv_new],
                     ignore_index=True)
                 self.tohlcv_cleanup(pair, period)
 
+
+    def get_trace(self, pair, period, candle_timestamp):
+        """
+        Copy of the trace of the candle if it is the last fetched one
+
+        :param candle_timestamp: open time of the candle
+        """
+        trace = self.traces.get((pair, period))
+        if (trace is None) or (trace['close'] != int(candle_timestamp) + self.periods[period]):
+            return None
+        return tracer.copy(trace)
+
         
     @staticmethod
     def timestamp_to_str(timestamp):
@@ -229,18 +251,24 @@ class Exchange():
         return self.tohlcv[pair][period]['timestamp'].iat[-1]
                     
 
-    def get_ohlcv_from_timestamp(self, pair, period, from_timestamp):
+    def get_ohlcv_from_timestamp(self, pair, period, from_timestamp, limit=None):
         """
         Get last timestamp in self.tohlcv for period
 
         :param period: timeframe - 1m, 1h, 1d...
         :param from_timestamp: timestamp of the first OHLCV to return
+        :param limit: max number of OHLCVs to return
         """
-        print(f"Get OHLCV {period} from API starting from {from_timestamp}")
+        log(
+            f"Get OHLCV {period} from API starting from {from_timestamp}",
+            'debug',
+            self.logger
+            )
         if self.state_run and (pair in self.pairs) and (period in self.periods):
-            return self.tohlcv[pair][period].loc[
+            res = self.tohlcv[pair][period].loc[
                 self.tohlcv[pair][period]['timestamp'] > from_timestamp
                 ]
+            return res if limit is None else res.head(limit)
         else:
             return pd.DataFrame([])
     
@@ -252,7 +280,11 @@ class Exchange():
         :param period: timeframe - 1m, 1h, 1d...
         :param from_timestamp: timestamp of the first close to return
         """
-        print(f"Get close {period} from API starting from {from_timestamp}")
+        log(
+            f"Get close {period} from API starting from {from_timestamp}",
+            'debug',
+            self.logger
+            )
         if self.state_run and (pair in self.pairs) and (period in self.periods):
             return self.tohlcv[pair][period][['timestamp', 'close']].loc[
                 self.tohlcv[pair][period]['timestamp'] > from_timestamp
@@ -281,11 +313,7 @@ class Exchange():
             temp_ticker = self.exchange.fetch_ticker('BTC/USD')
             ticker = {'ask': temp_ticker['ask'], 'bid': temp_ticker['bid']}
         except Exception as e:
-            log(
-                f"Exception in Exchange:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('Exchange', e, self.logger)
         return ticker
 
     def calc_price_by_order_book(self, order_book, amount=1.0):
@@ -310,11 +338,7 @@ class Exchange():
             order_book = self.exchange.fetch_order_book("BTC/USD")
             ticker = self.calc_price_by_order_book(order_book, amount)
         except Exception as e:
-            log(
-                f"Exception in Exchange:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('Exchange', e, self.logger)
         return ticker
 
     
@@ -0,0 +1,1264 @@
+"""
+Streaming technical indicators for live algorithms
+
+Every indicator of TACUDA (technical_analysis_cuda) has a CPU counterpart
+with the same name and parameters. An indicator is updated with one
+closed candle at a time in O(1) (amortized for channels, O(window) for
+commodity_channel_index) and can be warmed up from a history array in one
+vectorized pass, after which updates continue from its last candle.
+
+Values follow the batch kernels, including their window at the start of
+the series (min(window, pos) candles) and their choice of inputs. Where
+a kernel leaves a value undefined it is NaN here. Candles whose value
+depends on memory the kernel does not initialize are counted by the
+warmup attribute. Candles with zero range or volume contribute zero where
+the kernels would divide by zero.
+
+Candle layout is the same as of TACUDA and Exchange.tohlcv_columns:
+timestamp, open, high, low, close, volume.
+"""
+import math
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+OHLCV_TIMESTAMP = 0
+OHLCV_OPEN = 1
+OHLCV_HIGH = 2
+OHLCV_LOW = 3
+OHLCV_CLOSE = 4
+OHLCV_VOLUME = 5
+
+
+def divide(numerator, denominator, default=np.nan):
+    """
+    numerator / denominator, default where denominator is 0; scalars or arrays
+    """
+    if np.ndim(numerator) == 0 and np.ndim(denominator) == 0:
+        return numerator / denominator if denominator != 0 else default
+    numerator, denominator = np.broadcast_arrays(
+        np.asarray(numerator, dtype=np.float64),
+        np.asarray(denominator, dtype=np.float64)
+        )
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.full(numerator.shape, default, dtype=np.float64),
+        where=denominator != 0
+        )
+
+
+def window_sums(values, size):
+    """
+    Sum of the last min(size, i + 1) values at every position i
+    """
+    head = np.cumsum(values[:size - 1])
+    if values.shape[0] < size:
+        return head
+    return np.concatenate((head, sliding_window_view(values, size).sum(axis=1)))
+
+
+##################################
+# Window primitives
+##################################
+
+
+class WindowSum():
+    """
+    Sum of the last size values, compensated and resynced from the window,
+    exactly 0 for a window of zeros
+    """
+
+    resync_interval = 4096
+
+    def __init__(self, size):
+        self.size = size
+        self.load([])
+
+
+    def load(self, values):
+        self.values = deque((float(value) for value in values), maxlen=self.size)
+        self.resync()
+
+
+    def resync(self):
+        self.total = math.fsum(self.values)
+        self.compensation = 0.0
+        self.nonzero = sum(1 for value in self.values if value != 0.0)
+        self.since_resync = 0
+
+
+    def add(self, value):
+        res = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - res) + value
+        else:
+            self.compensation += (value - res) + self.total
+        self.total = res
+
+
+    def push(self, value):
+        if len(self.values) == self.size:
+            self.add(-self.values[0])
+            self.nonzero -= self.values[0] != 0.0
+        self.values.append(value)
+        self.add(value)
+        self.nonzero += value != 0.0
+        self.since_resync += 1
+        if self.nonzero == 0:
+            self.total = self.compensation = 0.0
+        elif self.since_resync >= self.resync_interval:
+            self.resync()
+        return self.total + self.compensation
+
+
+    def batch(self, values):
+        self.load(values[-self.size:])
+        return window_sums(values, self.size)
+
+
+class WindowMoments():
+    """
+    Mean and population standard deviation of the last size values.
+    Sums are kept around a reference close to the mean, so the variance
+    does not lose precision to the price level.
+    """
+
+    resync_interval = 1024
+
+    def __init__(self, size):
+        self.size = size
+        self.load([])
+
+
+    def load(self, values):
+        self.values = deque((float(value) for value in values), maxlen=self.size)
+        self.resync()
+
+
+    def resync(self):
+        self.reference = math.fsum(self.values) / len(self.values) if len(self.values) > 0 else None
+        self.sum = math.fsum(value - self.reference for value in self.values)
+        self.sum_squares = math.fsum((value - self.reference) ** 2 for value in self.values)
+        self.since_resync = 0
+
+
+    def push(self, value):
+        if self.reference is None:
+            self.reference = value
+        if len(self.values) == self.size:
+            deviation = self.values[0] - self.reference
+            self.sum -= deviation
+            self.sum_squares -= deviation * deviation
+        self.values.append(value)
+        deviation = value - self.reference
+        self.sum += deviation
+        self.sum_squares += deviation * deviation
+        self.since_resync += 1
+        if self.since_resync >= self.resync_interval:
+            self.resync()
+        n = len(self.values)
+        mean = self.sum / n
+        return self.reference + mean, math.sqrt(max(0.0, self.sum_squares / n - mean * mean))
+
+
+    def batch(self, values):
+        count = values.shape[0]
+        means = np.empty(count)
+        stds = np.empty(count)
+        for i in range(min(self.size - 1, count)):
+            means[i] = np.mean(values[:i + 1])
+            stds[i] = np.std(values[:i + 1])
+        if count >= self.size:
+            windows = sliding_window_view(values, self.size)
+            means[self.size - 1:] = windows.mean(axis=1)
+            stds[self.size - 1:] = windows.std(axis=1)
+        self.load(values[-self.size:])
+        return means, stds
+
+
+class KernelWindow():
+    """
+    Window of the last min(window, pos) values as the batch kernels take
+    it: the value at pos 0 never enters, nothing is defined at pos 0
+    """
+
+    def __init__(self, window, moments=False):
+        self.window = window
+        self.moments = moments
+        self.state = WindowMoments(window) if moments else WindowSum(window)
+        self.pos = -1
+
+
+    def push(self, value):
+        """
+        Sum of the window, or (mean, std) if moments
+        """
+        self.pos += 1
+        if self.pos == 0:
+            return (np.nan, np.nan) if self.moments else np.nan
+        return self.state.push(value)
+
+
+    def batch(self, values):
+        count = values.shape[0]
+        self.pos = count - 1
+        if self.moments:
+            means = np.full(count, np.nan)
+            stds = np.full(count, np.nan)
+            if count > 1:
+                means[1:], stds[1:] = self.state.batch(values[1:])
+            return means, stds
+        res = np.full(count, np.nan)
+        if count > 1:
+            res[1:] = self.state.batch(values[1:])
+        return res
+
+
+    def size(self):
+        return min(self.window, self.pos)
+
+
+    def sizes(self, count):
+        return np.minimum(self.window, np.arange(count))
+
+
+class KernelEMA():
+    """
+    Exponential moving average as the batch kernels compute it: at pos p
+    it starts from value p - n and runs over the next n values with
+    k = 2 / (n + 1), n = min(window, p). With a full window the sum of
+    weighted values is updated in O(1), earlier values decay, so rounding
+    errors do not accumulate. A window of zeros gives exactly 0.
+    """
+
+    resync_interval = 4096
+
+    def __init__(self, window):
+        self.window = window
+        self.k = 2.0 / (window + 1.0)
+        self.a = 1.0 - self.k
+        self.a_window = self.a ** window
+        self.weights = self.a ** np.arange(window)
+        self.values = deque(maxlen=window + 1)
+        self.nonzero = 0
+        self.pos = -1
+        self.weighted_sum = None
+
+
+    @staticmethod
+    def direct(values):
+        """
+        Kernel loop over values: the first one is the seed
+        """
+        k = 2.0 / len(values)
+        res = values[0]
+        for value in values[1:]:
+            res = value * k + res * (1.0 - k)
+        return res
+
+
+    def resync(self):
+        self.weighted_sum = float(np.dot(self.weights, np.array(self.values)[:0:-1]))
+        self.since_resync = 0
+
+
+    def push(self, value):
+        self.pos += 1
+        if len(self.values) == self.window + 1:
+            self.nonzero -= self.values[0] != 0.0
+        self.values.append(value)
+        self.nonzero += value != 0.0
+        if self.pos < self.window:
+            return self.direct(list(self.values))
+        if self.weighted_sum is None or self.nonzero == 0:
+            self.resync()
+        else:
+            self.weighted_sum = value + self.a * self.weighted_sum - self.a_window * self.values[0]
+            self.since_resync += 1
+            if self.since_resync >= self.resync_interval:
+                self.resync()
+        return self.a_window * self.values[0] + self.k * self.weighted_sum
+
+
+    def batch(self, values):
+        count = values.shape[0]
+        res = np.empty(count)
+        for i in range(min(self.window, count)):
+            # n = i values after the seed, k = 2 / (i + 1)
+            k = 2.0 / (i + 1.0)
+            res[i] = (1.0 - k) ** i * values[0] +\
+                k * np.dot((1.0 - k) ** np.arange(i), values[i:0:-1])
+        if count > self.window:
+            res[self.window:] = self.a_window * values[:count - self.window] +\
+                self.k * np.convolve(values, self.weights)[self.window:count]
+        self.values = deque((float(value) for value in values[-(self.window + 1):]), maxlen=self.window + 1)
+        self.nonzero = sum(1 for value in self.values if value != 0.0)
+        self.pos = count - 1
+        self.weighted_sum = None
+        return res
+
+
+class RollingExtreme():
+    """
+    Max or min of the last max(1, min(window, pos)) values, monotonic queue
+    """
+
+    def __init__(self, window, maximum=True):
+        self.window = window
+        self.maximum = maximum
+        self.queue = deque()
+        self.pos = -1
+
+
+    def push(self, value):
+        self.pos += 1
+        if self.maximum:
+            while len(self.queue) > 0 and self.queue[-1][1] <= value:
+                self.queue.pop()
+        else:
+            while len(self.queue) > 0 and self.queue[-1][1] >= value:
+                self.queue.pop()
+        self.queue.append((self.pos, value))
+        left = self.pos - max(1, min(self.window, self.pos)) + 1
+        while self.queue[0][0] < left:
+            self.queue.popleft()
+        return self.queue[0][1]
+
+
+    def batch(self, values):
+        count = values.shape[0]
+        res = np.empty(count)
+        res[0] = values[0]
+        head = min(self.window, count)
+        accumulate = np.maximum.accumulate if self.maximum else np.minimum.accumulate
+        if head > 1:
+            res[1:head] = accumulate(values[1:head])
+        if count > self.window:
+            windows = sliding_window_view(values, self.window)[1:]
+            res[self.window:] = windows.max(axis=1) if self.maximum else windows.min(axis=1)
+        tail = min(count, self.window)
+        self.queue = deque()
+        self.pos = count - tail - 1
+        for value in values[count - tail:]:
+            self.push(float(value))
+        return res
+
+
+##################################
+# Candle series
+##################################
+
+
+def true_range(candle, previous):
+    return np.maximum(candle[..., OHLCV_HIGH], previous[..., OHLCV_CLOSE]) -\
+        np.minimum(candle[..., OHLCV_LOW], previous[..., OHLCV_CLOSE])
+
+
+def money_flow_volume(candle):
+    return divide(
+        2.0 * candle[..., OHLCV_CLOSE] - candle[..., OHLCV_HIGH] - candle[..., OHLCV_LOW],
+        candle[..., OHLCV_HIGH] - candle[..., OHLCV_LOW],
+        0.0
+        ) * candle[..., OHLCV_VOLUME]
+
+
+def stochastic(close, high, low):
+    return divide(close - low, high - low, 0.0) * 100.0
+
+
+##################################
+# Indicators
+##################################
+
+
+class Indicator():
+    """
+    Base of streaming indicators: update() takes one closed candle,
+    warm_up() takes a history array of a fresh indicator
+    """
+
+    name = None
+    # first candles whose value depends on memory the batch kernel
+    # does not initialize
+    warmup = 0
+
+    def __init__(self):
+        self.pos = -1
+        self.previous = None
+        self.value = np.nan
+
+
+    def update(self, candle):
+        """
+        Add a closed candle and return the value
+
+        :param candle: timestamp, open, high, low, close, volume
+        """
+        candle = np.asarray(candle, dtype=np.float64)
+        self.pos += 1
+        self.value = self.step(
+            candle,
+            candle if self.previous is None else self.previous
+            )
+        self.previous = candle
+        return self.value
+
+
+    def warm_up(self, ohlcv):
+        """
+        Values for every candle of history, vectorized
+
+        :param ohlcv: array of timestamp, open, high, low, close, volume rows
+        """
+        ohlcv = np.asarray(ohlcv, dtype=np.float64)
+        values = self.batch(ohlcv, np.concatenate((ohlcv[:1], ohlcv[:-1])))
+        self.pos = ohlcv.shape[0] - 1
+        self.previous = ohlcv[-1]
+        self.value = values[-1]
+        return values
+
+
+    def step(self, candle, previous):
+        raise NotImplementedError
+
+
+    def batch(self, ohlcv, previous):
+        raise NotImplementedError
+
+
+class MovingAverage(Indicator):
+
+    name = 'moving_average'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.mean = KernelWindow(window)
+
+
+    def step(self, candle, previous):
+        return self.mean.push(candle[OHLCV_CLOSE]) / max(1, self.mean.size())
+
+
+    def batch(self, ohlcv, previous):
+        return self.mean.batch(ohlcv[:, OHLCV_CLOSE]) /\
+            np.maximum(1, self.mean.sizes(ohlcv.shape[0]))
+
+
+class ExponentialMovingAverage(Indicator):
+
+    name = 'exponential_moving_average'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.ema = KernelEMA(window)
+
+
+    def step(self, candle, previous):
+        return self.ema.push(candle[OHLCV_CLOSE])
+
+
+    def batch(self, ohlcv, previous):
+        return self.ema.batch(ohlcv[:, OHLCV_CLOSE])
+
+
+class Momentum(Indicator):
+
+    name = 'momentum'
+
+    def __init__(self, step):
+        super().__init__()
+        self.step_size = step
+        self.closes = deque(maxlen=step + 1)
+
+
+    def step(self, candle, previous):
+        self.closes.append(candle[OHLCV_CLOSE])
+        return self.closes[-1] - self.closes[0] if self.pos >= self.step_size else np.nan
+
+
+    def batch(self, ohlcv, previous):
+        closes = ohlcv[:, OHLCV_CLOSE]
+        count = closes.shape[0]
+        res = np.full(count, np.nan)
+        res[self.step_size:] = closes[self.step_size:] - closes[:count - self.step_size]
+        self.closes.extend(closes[-(self.step_size + 1):])
+        return res
+
+
+class RateOfChange(Indicator):
+
+    name = 'rate_of_change'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.closes = deque(maxlen=window)
+
+
+    def step(self, candle, previous):
+        self.closes.append(candle[OHLCV_CLOSE])
+        if self.pos < self.window:
+            return np.nan
+        return (self.closes[-1] - self.closes[0]) / self.closes[0]
+
+
+    def batch(self, ohlcv, previous):
+        closes = ohlcv[:, OHLCV_CLOSE]
+        count = closes.shape[0]
+        res = np.full(count, np.nan)
+        if count > self.window:
+            base = closes[1:count - self.window + 1]
+            res[self.window:] = (closes[self.window:] - base) / base
+        self.closes.extend(closes[-self.window:])
+        return res
+
+
+class AverageTrueRange(Indicator):
+
+    name = 'average_true_range'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.warmup = window + 1
+        self.ema = KernelEMA(window)
+
+
+    def step(self, candle, previous):
+        return self.ema.push(float(true_range(candle, previous)))
+
+
+    def batch(self, ohlcv, previous):
+        return self.ema.batch(true_range(ohlcv, previous))
+
+
+class StochasticOscillatorK(Indicator):
+
+    name = 'stochastic_oscillator_k'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.high = RollingExtreme(window, True)
+        self.low = RollingExtreme(window, False)
+
+
+    def step(self, candle, previous):
+        return stochastic(
+            candle[OHLCV_CLOSE],
+            self.high.push(candle[OHLCV_HIGH]),
+            self.low.push(candle[OHLCV_LOW])
+            )
+
+
+    def batch(self, ohlcv, previous):
+        return stochastic(
+            ohlcv[:, OHLCV_CLOSE],
+            self.high.batch(ohlcv[:, OHLCV_HIGH]),
+            self.low.batch(ohlcv[:, OHLCV_LOW])
+            )
+
+
+class StochasticOscillatorDMA(StochasticOscillatorK):
+
+    name = 'stochastic_oscillator_d_ma'
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.mean = KernelWindow(window)
+
+
+    def step(self, candle, previous):
+        return self.mean.push(super().step(candle, previous)) / max(1, self.mean.size())
+
+
+    def batch(self, ohlcv, previous):
+        return self.mean.batch(super().batch(ohlcv, previous)) /\
+            np.maximum(1, self.mean.sizes(ohlcv.shape[0]))
+
+
+class StochasticOscillatorDEMA(StochasticOscillatorK):
+
+    name = 'stochastic_oscillator_d_ema'
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.warmup = window + 1
+        self.ema = KernelEMA(window)
+
+
+    def step(self, candle, previous):
+        return self.ema.push(super().step(candle, previous))
+
+
+    def batch(self, ohlcv, previous):
+        return self.ema.batch(super().batch(ohlcv, previous))
+
+
+class Trix(Indicator):
+
+    name = 'trix'
+    warmup = 1
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.emas = [KernelEMA(window) for i in range(3)]
+        self.last = np.nan
+
+
+    def step(self, candle, previous):
+        value = candle[OHLCV_CLOSE]
+        for ema in self.emas:
+            value = ema.push(value)
+        res = np.nan if self.pos == 0 else divide(value - self.last, self.last, 0.0)
+        self.last = value
+        return res
+
+
+    def batch(self, ohlcv, previous):
+        values = ohlcv[:, OHLCV_CLOSE]
+        for ema in self.emas:
+            values = ema.batch(values)
+        res = np.full(values.shape[0], np.nan)
+        res[1:] = divide(values[1:] - values[:-1], values[:-1], 0.0)
+        self.last = values[-1]
+        return res
+
+
+class MassIndex(Indicator):
+    """
+    :param param: periods per day, EMAs of 9 days over 25 days
+    """
+
+    name = 'mass_index'
+
+    def __init__(self, param):
+        super().__init__()
+        self.param = param
+        self.single = KernelEMA(9 * param)
+        self.double = KernelEMA(9 * param)
+        self.ratios = WindowSum(24 * param + 1)
+
+
+    def step(self, candle, previous):
+        single = self.single.push(candle[OHLCV_HIGH] - candle[OHLCV_LOW])
+        total = self.ratios.push(divide(single, self.double.push(single), 0.0))
+        return total / self.param if self.pos > 24 * self.param else np.nan
+
+
+    def batch(self, ohlcv, previous):
+        single = self.single.batch(ohlcv[:, OHLCV_HIGH] - ohlcv[:, OHLCV_LOW])
+        res = self.ratios.batch(divide(single, self.double.batch(single), 0.0)) / self.param
+        res[:24 * self.param + 1] = np.nan
+        return res
+
+
+class VortexIndicatorPlus(Indicator):
+
+    name = 'vortex_indicator_plus'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.movement = WindowSum(window + 1)
+        self.true_range = WindowSum(window + 1)
+
+
+    @staticmethod
+    def vortex_movement(candle, previous):
+        return np.abs(candle[..., OHLCV_HIGH] - previous[..., OHLCV_LOW])
+
+
+    @staticmethod
+    def vortex_true_range(candle, previous):
+        return np.maximum(
+            candle[..., OHLCV_HIGH] - candle[..., OHLCV_LOW],
+            np.maximum(
+                np.abs(candle[..., OHLCV_LOW] - previous[..., OHLCV_CLOSE]),
+                np.abs(candle[..., OHLCV_HIGH] - previous[..., OHLCV_CLOSE])
+                ))
+
+
+    def step(self, candle, previous):
+        movement = self.movement.push(float(self.vortex_movement(candle, previous)))
+        true_range = self.true_range.push(float(self.vortex_true_range(candle, previous)))
+        return divide(movement, true_range) if self.pos > self.window + 1 else np.nan
+
+
+    def batch(self, ohlcv, previous):
+        res = divide(
+            self.movement.batch(self.vortex_movement(ohlcv, previous)),
+            self.true_range.batch(self.vortex_true_range(ohlcv, previous))
+            )
+        res[:self.window + 2] = np.nan
+        return res
+
+
+class VortexIndicatorMinus(VortexIndicatorPlus):
+
+    name = 'vortex_indicator_minus'
+
+    @staticmethod
+    def vortex_movement(candle, previous):
+        return np.abs(candle[..., OHLCV_LOW] - previous[..., OHLCV_HIGH])
+
+
+class RelativeStrengthIndex(Indicator):
+
+    name = 'relative_strength_index'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.up = KernelEMA(window)
+        self.down = KernelEMA(window)
+
+
+    @staticmethod
+    def index(up, down):
+        return 100.0 - divide(100.0, 1.0 + divide(up, down), np.nan)
+
+
+    def step(self, candle, previous):
+        delta = candle[OHLCV_CLOSE] - previous[OHLCV_CLOSE]
+        up = self.up.push(max(delta, 0.0))
+        down = self.down.push(max(-delta, 0.0))
+        return np.nan if self.pos == 0 else float(self.index(up, down))
+
+
+    def batch(self, ohlcv, previous):
+        delta = ohlcv[:, OHLCV_CLOSE] - previous[:, OHLCV_CLOSE]
+        res = self.index(
+            self.up.batch(np.maximum(delta, 0.0)),
+            self.down.batch(np.maximum(-delta, 0.0))
+            )
+        res[0] = np.nan
+        return res
+
+
+class TrueStrengthIndex(Indicator):
+    """
+    As the batch kernel, only the first smoothing (window) is applied,
+    window_2 is kept for the name and parameters
+    """
+
+    name = 'true_strength_index'
+
+    def __init__(self, window, window_2):
+        super().__init__()
+        self.window = window
+        self.window_2 = window_2
+        self.warmup = window + 1
+        self.momentum = KernelEMA(window)
+        self.absolute = KernelEMA(window)
+
+
+    def step(self, candle, previous):
+        delta = candle[OHLCV_CLOSE] - previous[OHLCV_CLOSE]
+        res = 100.0 * divide(self.momentum.push(delta), self.absolute.push(abs(delta)))
+        return np.nan if self.pos == 0 else res
+
+
+    def batch(self, ohlcv, previous):
+        delta = ohlcv[:, OHLCV_CLOSE] - previous[:, OHLCV_CLOSE]
+        res = 100.0 * divide(self.momentum.batch(delta), self.absolute.batch(np.abs(delta)))
+        res[0] = np.nan
+        return res
+
+
+class AccumulationDistribution(Indicator):
+
+    name = 'accumulation_distribution'
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0.0
+
+
+    def step(self, candle, previous):
+        if self.pos > 0:
+            self.total += float(money_flow_volume(candle))
+        return self.total
+
+
+    def batch(self, ohlcv, previous):
+        flow = money_flow_volume(ohlcv)
+        flow[0] = 0.0
+        res = np.cumsum(flow)
+        self.total = float(res[-1])
+        return res
+
+
+class ChaikinOscillator(Indicator):
+
+    name = 'chaikin_oscillator'
+
+    def __init__(self):
+        super().__init__()
+        self.fast = KernelEMA(3)
+        self.slow = KernelEMA(10)
+
+
+    def step(self, candle, previous):
+        flow = float(money_flow_volume(candle))
+        return self.fast.push(flow) - self.slow.push(flow)
+
+
+    def batch(self, ohlcv, previous):
+        flow = money_flow_volume(ohlcv)
+        return self.fast.batch(flow) - self.slow.batch(flow)
+
+
+class ChaikinMoneyFlow(Indicator):
+
+    name = 'chaikin_money_flow'
+
+    def __init__(self):
+        super().__init__()
+        self.flow = WindowSum(20)
+        self.volume = WindowSum(20)
+
+
+    def step(self, candle, previous):
+        flow = self.flow.push(float(money_flow_volume(candle)))
+        volume = self.volume.push(candle[OHLCV_VOLUME])
+        return divide(flow, volume, 0.0) if self.pos > 20 else 0.0
+
+
+    def batch(self, ohlcv, previous):
+        res = divide(
+            self.flow.batch(money_flow_volume(ohlcv)),
+            self.volume.batch(ohlcv[:, OHLCV_VOLUME]),
+            0.0
+            )
+        res[:21] = 0.0
+        return res
+
+
+class MoneyFlowIndex(Indicator):
+
+    name = 'money_flow_index'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.positive = KernelWindow(window)
+        self.negative = KernelWindow(window)
+
+
+    @staticmethod
+    def flows(candle, previous):
+        typical_price = candle[..., OHLCV_HIGH] + candle[..., OHLCV_LOW] + candle[..., OHLCV_CLOSE]
+        previous_price = previous[..., OHLCV_HIGH] + previous[..., OHLCV_LOW] + previous[..., OHLCV_CLOSE]
+        flow = typical_price * candle[..., OHLCV_VOLUME] / 3.0
+        rising = typical_price > previous_price
+        return np.where(rising, flow, 0.0), np.where(rising, 0.0, flow)
+
+
+    @staticmethod
+    def index(positive, negative):
+        return 100.0 - divide(100.0, 1.0 + divide(positive, negative, -1.0), 100.0)
+
+
+    def step(self, candle, previous):
+        positive, negative = self.flows(candle, previous)
+        positive = self.positive.push(float(positive))
+        negative = self.negative.push(float(negative))
+        return np.nan if self.pos == 0 else float(self.index(positive, negative))
+
+
+    def batch(self, ohlcv, previous):
+        positive, negative = self.flows(ohlcv, previous)
+        res = self.index(self.positive.batch(positive), self.negative.batch(negative))
+        res[0] = np.nan
+        return res
+
+
+class OnBalanceVolume(Indicator):
+    """
+    As the batch kernel, the value at a candle sums volumes of the
+    previous candles only
+    """
+
+    name = 'on_balance_volume'
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0.0
+
+
+    @staticmethod
+    def signed_volume(candle, previous):
+        return candle[..., OHLCV_VOLUME] * np.sign(candle[..., OHLCV_CLOSE] - previous[..., OHLCV_CLOSE])
+
+
+    def step(self, candle, previous):
+        res = np.nan if self.pos == 0 else self.total
+        if self.pos > 0:
+            self.total += float(self.signed_volume(candle, previous))
+        return res
+
+
+    def batch(self, ohlcv, previous):
+        volumes = self.signed_volume(ohlcv, previous)
+        volumes[0] = 0.0
+        totals = np.cumsum(volumes)
+        res = np.full(ohlcv.shape[0], np.nan)
+        res[1:] = totals[:-1]
+        self.total = float(totals[-1])
+        return res
+
+
+class ForceIndex(Indicator):
+
+    name = 'force_index'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.warmup = window + 1
+        self.ema = KernelEMA(window)
+
+
+    @staticmethod
+    def force(candle, previous):
+        return (candle[..., OHLCV_CLOSE] - previous[..., OHLCV_CLOSE]) * candle[..., OHLCV_VOLUME]
+
+
+    def step(self, candle, previous):
+        res = self.ema.push(float(self.force(candle, previous)))
+        return np.nan if self.pos == 0 else res
+
+
+    def batch(self, ohlcv, previous):
+        res = self.ema.batch(self.force(ohlcv, previous))
+        res[0] = np.nan
+        return res
+
+
+class EaseOfMovement(Indicator):
+
+    name = 'ease_of_movement'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.mean = KernelWindow(window)
+
+
+    @staticmethod
+    def movement(candle, previous):
+        return divide(
+            (candle[..., OHLCV_HIGH] - previous[..., OHLCV_HIGH] + candle[..., OHLCV_LOW] - previous[..., OHLCV_LOW]) *\
+                (candle[..., OHLCV_HIGH] - candle[..., OHLCV_LOW]),
+            2.0 * candle[..., OHLCV_VOLUME],
+            0.0
+            )
+
+
+    def step(self, candle, previous):
+        return self.mean.push(float(self.movement(candle, previous))) / max(1, self.mean.size())
+
+
+    def batch(self, ohlcv, previous):
+        return self.mean.batch(self.movement(ohlcv, previous)) /\
+            np.maximum(1, self.mean.sizes(ohlcv.shape[0]))
+
+
+class StandardDeviation(Indicator):
+
+    name = 'standard_deviation'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.moments = KernelWindow(window, moments=True)
+
+
+    def step(self, candle, previous):
+        return self.moments.push(candle[OHLCV_CLOSE])[1]
+
+
+    def batch(self, ohlcv, previous):
+        return self.moments.batch(ohlcv[:, OHLCV_CLOSE])[1]
+
+
+class CommodityChannelIndex(Indicator):
+    """
+    Uses mean absolute deviation of the typical price, O(window) per
+    update. The batch kernel sums deviations without abs(), which is
+    zero up to rounding, so its values are not comparable. A window
+    without deviation beyond rounding gives 0.
+    """
+
+    # deviation relative to the mean treated as none
+    tolerance = 1e-12
+
+    name = 'commodity_channel_index'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.mean = KernelWindow(window)
+
+
+    @staticmethod
+    def typical_price(candle):
+        return (candle[..., OHLCV_HIGH] + candle[..., OHLCV_LOW] + candle[..., OHLCV_CLOSE]) / 3.0
+
+
+    def index(self, price, mean, deviation):
+        deviation = np.where(deviation > self.tolerance * np.abs(mean), deviation, 0.0)
+        return divide(price - mean, deviation * 0.015, 0.0)
+
+
+    def step(self, candle, previous):
+        price = float(self.typical_price(candle))
+        total = self.mean.push(price)
+        if self.pos == 0:
+            return np.nan
+        values = self.mean.state.values
+        mean = total / len(values)
+        deviation = math.fsum(abs(value - mean) for value in values) / len(values)
+        return self.index(price, mean, deviation)
+
+
+    def batch(self, ohlcv, previous):
+        prices = self.typical_price(ohlcv)
+        count = prices.shape[0]
+        res = np.full(count, np.nan)
+        for i in range(1, min(self.window, count)):
+            window = prices[1:i + 1]
+            mean = window.mean()
+            res[i] = self.index(prices[i], mean, np.abs(window - mean).mean())
+        if count > self.window:
+            windows = sliding_window_view(prices, self.window)[1:]
+            means = windows.mean(axis=1)
+            deviations = np.abs(windows - means[:, None]).mean(axis=1)
+            res[self.window:] = self.index(prices[self.window:], means, deviations)
+        self.mean.batch(prices)
+        return res
+
+
+class KeltnerChannelM(ExponentialMovingAverage):
+
+    name = 'keltner_channel_m'
+
+
+class KeltnerChannelU(ExponentialMovingAverage):
+    """
+    As the batch kernel, the band is 2 true ranges of the candle
+    """
+
+    name = 'keltner_channel_u'
+    band = 2.0
+
+    @staticmethod
+    def candle_range(candle, previous):
+        return np.maximum(
+            candle[..., OHLCV_HIGH] - candle[..., OHLCV_LOW],
+            np.maximum(
+                candle[..., OHLCV_HIGH] - previous[..., OHLCV_CLOSE],
+                previous[..., OHLCV_CLOSE] - candle[..., OHLCV_LOW]
+                ))
+
+
+    def step(self, candle, previous):
+        return super().step(candle, previous) + self.band * float(self.candle_range(candle, previous))
+
+
+    def batch(self, ohlcv, previous):
+        return super().batch(ohlcv, previous) + self.band * self.candle_range(ohlcv, previous)
+
+
+class KeltnerChannelD(KeltnerChannelU):
+
+    name = 'keltner_channel_d'
+    band = -2.0
+
+
+class UltimateOscillator(Indicator):
+
+    name = 'ultimate_oscillator'
+    windows = [7, 14, 28]
+
+    def __init__(self):
+        super().__init__()
+        self.buying_pressure = [WindowSum(window) for window in self.windows]
+        self.true_range = [WindowSum(window) for window in self.windows]
+
+
+    @staticmethod
+    def index(buying_pressure, true_range):
+        res = 100.0 * (
+            divide(buying_pressure[0], true_range[0], 0.0) * 4.0 +\
+                divide(buying_pressure[1], true_range[1], 0.0) * 2.0 +\
+                divide(buying_pressure[2], true_range[2], 0.0)
+            ) / 7.0
+        defined = (true_range[0] != 0.0) & (true_range[1] != 0.0) & (true_range[2] != 0.0)
+        return np.where(defined, res, 0.0)
+
+
+    def step(self, candle, previous):
+        pressure = candle[OHLCV_CLOSE] - min(candle[OHLCV_LOW], previous[OHLCV_CLOSE])
+        candle_range = float(true_range(candle, previous))
+        buying_pressure = [total.push(pressure) for total in self.buying_pressure]
+        ranges = [total.push(candle_range) for total in self.true_range]
+        if self.pos == 0:
+            return np.nan
+        return float(self.index(buying_pressure, ranges)) if self.pos >= 28 else 0.0
+
+
+    def batch(self, ohlcv, previous):
+        pressure = ohlcv[:, OHLCV_CLOSE] - np.minimum(ohlcv[:, OHLCV_LOW], previous[:, OHLCV_CLOSE])
+        candle_range = true_range(ohlcv, previous)
+        res = self.index(
+            [total.batch(pressure) for total in self.buying_pressure],
+            [total.batch(candle_range) for total in self.true_range]
+            )
+        res[:28] = 0.0
+        res[0] = np.nan
+        return res
+
+
+class DonchianChannelU(Indicator):
+
+    name = 'donchian_channel_u'
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.high = RollingExtreme(window, True)
+        self.low = RollingExtreme(window, False)
+
+
+    def channel(self, high, low):
+        return high
+
+
+    def step(self, candle, previous):
+        res = self.channel(
+            self.high.push(candle[OHLCV_HIGH]),
+            self.low.push(candle[OHLCV_LOW])
+            )
+        return np.nan if self.pos == 0 else res
+
+
+    def batch(self, ohlcv, previous):
+        res = self.channel(
+            self.high.batch(ohlcv[:, OHLCV_HIGH]),
+            self.low.batch(ohlcv[:, OHLCV_LOW])
+            )
+        res[0] = np.nan
+        return res
+
+
+class DonchianChannelD(DonchianChannelU):
+
+    name = 'donchian_channel_d'
+
+    def channel(self, high, low):
+        return low
+
+
+class DonchianChannelM(DonchianChannelU):
+
+    name = 'donchian_channel_m'
+
+    def channel(self, high, low):
+        return (low + high) / 2.0
+
+
+class BollingerBandsM(StandardDeviation):
+
+    name = 'bollinger_bands_m'
+    band = 0.0
+
+    def step(self, candle, previous):
+        mean, std = self.moments.push(candle[OHLCV_CLOSE])
+        return mean + self.band * std
+
+
+    def batch(self, ohlcv, previous):
+        means, stds = self.moments.batch(ohlcv[:, OHLCV_CLOSE])
+        return means + self.band * stds
+
+
+class BollingerBandsU(BollingerBandsM):
+
+    name = 'bollinger_bands_u'
+    band = 2.0
+
+
+class BollingerBandsD(BollingerBandsM):
+
+    name = 'bollinger_bands_d'
+    band = -2.0
+
+
+indicator_classes = {
+    indicator_class.name: indicator_class for indicator_class in [
+        MovingAverage,
+        ExponentialMovingAverage,
+        Momentum,
+        RateOfChange,
+        AverageTrueRange,
+        StochasticOscillatorK,
+        StochasticOscillatorDMA,
+        StochasticOscillatorDEMA,
+        Trix,
+        MassIndex,
+        VortexIndicatorPlus,
+        VortexIndicatorMinus,
+        RelativeStrengthIndex,
+        TrueStrengthIndex,
+        AccumulationDistribution,
+        ChaikinOscillator,
+        ChaikinMoneyFlow,
+        MoneyFlowIndex,
+        OnBalanceVolume,
+        ForceIndex,
+        EaseOfMovement,
+        StandardDeviation,
+        CommodityChannelIndex,
+        KeltnerChannelM,
+        KeltnerChannelU,
+        KeltnerChannelD,
+        UltimateOscillator,
+        DonchianChannelU,
+        DonchianChannelD,
+        DonchianChannelM,
+        BollingerBandsM,
+        BollingerBandsU,
+        BollingerBandsD
+        ]
+    }
+
+
+def create_indicators(json_data):
+    """
+    Indicators of a technical analysis config in TACUDA format, keyed by
+    the names TACUDA.process returns for them
+
+    :param json_data: config with "technical indicators" list
+    """
+    res = {}
+    for function_i in json_data["technical indicators"]:
+        name = function_i["function"]
+        indicator_class = indicator_classes[name]
+        if name == 'true_strength_index':
+            for window_1, window_2 in zip(function_i["windows"], function_i["windows_2"]):
+                res[f"{name}.{window_1}.{window_2}"] = indicator_class(window_1, window_2)
+        elif name == 'mass_index':
+            res[f"{name}.{function_i['param']}"] = indicator_class(function_i["param"])
+        elif len(function_i.get("windows", [])) > 0:
+            for window_i in function_i["windows"]:
+                res[f"{name}.{window_i}"] = indicator_class(window_i)
+        else:
+            res[name] = indicator_class()
+    return res
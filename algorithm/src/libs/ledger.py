@@ -0,0 +1,154 @@
+import pandas as pd
+from .logger import *
+
+
+class Ledger():
+    """
+    Append-only ledger of operations with periodic compact snapshots
+
+    Every operation is written to operations collection with sequence
+    number, balance diff and balances of the account and the bot after it.
+    Every snapshot_interval operations a snapshot of all balances is
+    written, so a restart replays at most snapshot_interval operations.
+    """
+
+    def __init__(self, db, logger=None, snapshot_interval=1000):
+        self.db = db
+        self.logger = logger
+        self.snapshot_interval = int(snapshot_interval)
+        self.db.ensure_ledger_indexes()
+        self.seq = self.db.get_last_operation_seq()
+        if self.seq is None:
+            # with a wrong sequence number every operation would be refused
+            # by the unique index of the ledger
+            raise RuntimeError("Ledger sequence number can not be read")
+        self.snapshot_seq = 0
+
+
+    def append(self, account, bot_id, operation_type, amount, diff, timestamp):
+        """
+        Write applied operation to the ledger, the sequence number moves
+        only if it is written. Returns True if written
+
+        :param account: account the operation was applied to
+        :param bot_id: bot id
+        :param operation_type: buy, sell, buy_all, sell_all
+        :param amount: amount of the operation
+        :param diff: balance diff returned by Bot.make_operation
+        :param timestamp: exchange timestamp of the operation
+        """
+        seq = self.seq + 1
+        res = self.db.write_operation(
+            operation_type,
+            account.account_id,
+            bot_id,
+            amount,
+            account.bots[bot_id].pair,
+            timestamp,
+            {
+                "seq": seq,
+                "diff": diff,
+                "bot_balance": account.bots[bot_id].balance.copy(),
+                "account_balance": account.balances.copy()
+                }
+            )
+        if res:
+            self.seq = seq
+        return res
+
+
+    def snapshot_due(self):
+        return self.seq - self.snapshot_seq >= self.snapshot_interval
+
+
+    def make_snapshot(self, accounts, timestamp):
+        """
+        Copy balances of all accounts and bots at the current sequence number
+
+        :param accounts: dict of accounts
+        :param timestamp: exchange timestamp
+        """
+        return {
+            "seq": self.seq,
+            "timestamp": timestamp,
+            "accounts": {
+                str(account_id): account.balances.copy()\
+                    for account_id, account in accounts.items()
+                },
+            "bots": {
+                str(bot_id): bot.balance.copy()\
+                    for account in accounts.values()\
+                        for bot_id, bot in account.bots.items()
+                }
+            }
+
+
+    def write_snapshot(self, snapshot):
+        if self.db.write_ledger_snapshot(snapshot):
+            self.snapshot_seq = snapshot["seq"]
+
+
+    @staticmethod
+    def last_balances(tail, id_field, balance_field):
+        """
+        Balance after the last operation of every account or bot in the tail
+        """
+        last = tail.drop_duplicates(subset=id_field, keep='last')
+        return dict(zip(last[id_field].astype(str), last[balance_field]))
+
+
+    def restore(self, accounts, timestamp):
+        """
+        Restore balances from the newest snapshot and the ledger tail after it.
+        Without snapshot the current balances are kept and become the first one
+        if the ledger is empty; with operations in the ledger a missing
+        snapshot is a failed read and nothing is written
+
+        :param accounts: dict of accounts
+        :param timestamp: exchange timestamp
+        """
+        snapshot = self.db.get_last_ledger_snapshot()
+        if snapshot is None:
+            if self.seq > 0:
+                log(
+                    f"Ledger snapshot not found with {self.seq} operations in the ledger, balances are not restored",
+                    'error',
+                    self.logger
+                    )
+                return 0
+            self.write_snapshot(self.make_snapshot(accounts, timestamp))
+            return 0
+
+        account_balances = dict(snapshot["accounts"])
+        bot_balances = dict(snapshot["bots"])
+
+        tail = pd.DataFrame(self.db.get_operations_from_seq(snapshot["seq"]))
+        last_seq = tail["seq"].iat[-1] if tail.shape[0] > 0 else snapshot["seq"]
+        if last_seq < self.seq:
+            log(
+                f"Ledger tail ends at {last_seq} of {self.seq} operations, balances may be stale",
+                'error',
+                self.logger
+                )
+        if tail.shape[0] > 0:
+            account_balances.update(
+                self.last_balances(tail, "account_id", "account_balance")
+                )
+            bot_balances.update(
+                self.last_balances(tail, "bot_id", "bot_balance")
+                )
+
+        for account_id, account in accounts.items():
+            if str(account_id) in account_balances:
+                account.balances.update(account_balances[str(account_id)])
+            for bot_id, bot in account.bots.items():
+                if str(bot_id) in bot_balances:
+                    bot.balance.update(bot_balances[str(bot_id)])
+
+        self.snapshot_seq = snapshot["seq"]
+        log(
+            f"Ledger restored from snapshot {snapshot['seq']} and {tail.shape[0]} operations",
+            'info',
+            self.logger
+            )
+        return tail.shape[0]
@@ -1,32 +1,117 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import atexit
 import logging
+import logging.handlers
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Compact JSON line: time, level, message and traceback if any
+    """
+
+    def format(self, record):
+        res = {
+            't': self.formatTime(record),
+            'level': record.levelname,
+            'msg': record.getMessage()
+            }
+        if record.exc_info:
+            res['exc'] = self.formatException(record.exc_info)
+        return json.dumps(res, separators=(',', ':'))
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler for in-process queue: records are put as they are,
+    so message and traceback formatting happen in the listener thread
+    """
+
+    def prepare(self, record):
+        return record
+
 
 class Logger():
 
-    def __init__(self, in_filename="logs.log"):
+    # handlers are set up once per process and shared by all instances:
+    # calling threads only put records to the queue, the listener thread
+    # writes them to console and file
+    listener = None
+
+    def __init__(self, in_filename="logs.log", json_format=None, level=None):
+        """
+        :param in_filename: log file
+        :param json_format: write JSON lines, LOG_FORMAT=json by default
+        :param level: root level, name in any case or number, LOG_LEVEL
+            or INFO by default
+        """
         self.logger = logging.getLogger()
-        self.logger.setLevel(logging.INFO)
+        if Logger.listener is None:
+            self.setup(
+                in_filename,
+                os.environ.get("LOG_FORMAT") == "json" if json_format is None else json_format,
+                level or os.environ.get("LOG_LEVEL") or logging.INFO
+                )
+
+
+    @staticmethod
+    def parse_level(level):
+        """
+        Level number of a level name in any case or of a number, None if
+        the name is unknown
+        """
+        if isinstance(level, int):
+            return level
+        name = str(level).strip().upper()
+        if name.isdigit():
+            return int(name)
+        res = logging.getLevelName(name)
+        return res if isinstance(res, int) else None
+
+
+    def setup(self, in_filename, json_format, level):
+        level_number = self.parse_level(level)
+        self.logger.setLevel(logging.INFO if level_number is None else level_number)
 
         # Create console handler and set level to debug
-        self.ch = logging.StreamHandler()
-        self.ch.setLevel(logging.INFO)
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.DEBUG)
         # Create file handler and set level to debug
-        self.fh = logging.FileHandler(
+        fh = logging.FileHandler(
             in_filename,
             mode='a',
             encoding=None,
             delay=False
             )
-        self.fh.setLevel(logging.WARNING)
+        fh.setLevel(logging.WARNING)
         # Create formatter
-        self.formatter = logging.Formatter(
+        formatter = JsonFormatter() if json_format else logging.Formatter(
             '%(asctime)s - %(levelname)s - %(message)s'
             )
         # Add formatter to handlers
-        self.ch.setFormatter(self.formatter)
-        self.fh.setFormatter(self.formatter)
-        # Add handlers to logger
-        self.logger.addHandler(self.ch)
-        self.logger.addHandler(self.fh)
+        ch.setFormatter(formatter)
+        fh.setFormatter(formatter)
+        # Route records through the queue to the listener thread
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(LocalQueueHandler(log_queue))
+        Logger.listener = logging.handlers.QueueListener(
+            log_queue,
+            ch,
+            fh,
+            respect_handler_level=True
+            )
+        Logger.listener.start()
+        atexit.register(Logger.listener.stop)
+        if level_number is None:
+            self.logger.warning(f"Unknown log level {level!r}, INFO is used")
+
+
+    def debug(self, in_text):
+        self.logger.debug(in_text)
 
 
     def info(self, in_text):
@@ -44,7 +129,7 @@ class Logger():
     def warning(self, in_text="Warning occurred"):
         self.logger.warning(in_text)
 
-    
+
     def log(self, type, in_text):
         getattr(self, type)(in_text)
 
@@ -55,4 +140,62 @@ def log(message, type="info", logger=None):
     if not(logger is None):
         logger.log(type, message)
     else:
-        print(f"{type}:\n{message}")
\ No newline at end of file
+        getattr(logging.getLogger(), type)(message)
+
+
+
+class ErrorRateLimiter():
+    """
+    Let through the first error per key within a time window and count
+    the rest, so a storm of identical errors costs one log record
+    """
+
+    def __init__(self, window=60.0):
+        """
+        :param window: dedup window, seconds
+        """
+        self.window = window
+        self.state = {}
+        self.lock = threading.Lock()
+
+
+    def check(self, key):
+        """
+        Return (allowed, suppressed): whether to log this error and how many
+        errors with this key were suppressed in the previous window
+        """
+        now = time.monotonic()
+        with self.lock:
+            state = self.state.get(key)
+            if (state is None) or (now - state[0] >= self.window):
+                self.state[key] = [now, 0]
+                return True, 0 if state is None else state[1]
+            state[1] += 1
+            return False, 0
+
+
+error_limiter = ErrorRateLimiter(float(os.environ.get("LOG_ERRORS_WINDOW") or 60.0))
+
+
+def log_exception(source, e, logger=None, key=None):
+    """
+    Log exception with the name of the calling function. The name is taken
+    from the caller frame, without walking the stack or reading sources.
+    Repeated errors with the same key are logged once per window
+
+    :param source: class or service name
+    :param e: exception
+    :param logger: logger
+    :param key: dedup key, (source, function, exception type) by default
+    """
+    function_name = sys._getframe(1).f_code.co_name
+    allowed, suppressed = error_limiter.check(
+        key or (source, function_name, type(e).__name__)
+        )
+    if allowed:
+        suffix = f" ({suppressed} similar suppressed)" if suppressed > 0 else ""
+        log(
+            f"Exception in {source}:{function_name}{suffix}\n{e}",
+            'exception',
+            logger
+            )
@@ -2,11 +2,16 @@ from .database import *
 from .logger import *
 import pymongo
 #from bson.objectid import ObjectId
-import pandas as pd
-import inspect
+import time
+from datetime import datetime
 
 class MongoDB(Database):
 
+    # seconds to keep rolled up balances before TTL removal
+    balances_rolled_up_ttl = 3600
+    # state of bots which trade, paused and stopped bots are not run
+    active_bot_state = "active"
+
     def __init__(
         self,
         username,
@@ -41,6 +46,29 @@ class MongoDB(Database):
         return res['exchange_id'], res['symbol'], res['algorithm_id'], res['type'], res['state']
 
     
+    def get_active_bots(self):
+        """
+        Ids of active bots of all accounts
+        """
+        res = []
+        try:
+            bot_ids = [
+                bot_id for account in self.db['accounts'].find({}, {'bots': 1})\
+                    for bot_id in account.get('bots', [])
+                ]
+            res = [
+                str(bot['_id']) for bot in self.db['bots'].find(
+                    {
+                        "_id": {"$in": [ObjectId(bot_id) for bot_id in bot_ids]},
+                        "state": self.active_bot_state
+                        },
+                    {'_id': 1}
+                    )]
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
     def get_algorithm(self, algorithm_id):
         res = dict(
             self.db['algorithms'].find_one(
@@ -85,14 +113,36 @@ class MongoDB(Database):
                     {'period': period}
                     ]}, sort=[("timestamp", pymongo.DESCENDING)])
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
         return result
     
 
+    def get_last_timestamps(self):
+        """
+        Get last timestamps of all (exchange, pair, period) in one aggregation
+        """
+        result = {}
+        try:
+            for item in self.db['ohlcvs'].aggregate([
+                {'$group': {
+                    '_id': {
+                        'exchange_id': '$exchange_id',
+                        'pair': '$pair',
+                        'period': '$period'
+                        },
+                    'timestamp': {'$max': '$timestamp'}
+                    }}
+                ]):
+                result[(
+                    str(item['_id']['exchange_id']),
+                    item['_id']['pair'],
+                    item['_id']['period']
+                    )] = item['timestamp']
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return result
+
+
     """def get_ohlcv(self, exchange, pair, period, from_timestamp=None):
         try:
             res = self.db[exchange][pair][period]["ohlcv"].find().sort(
@@ -105,14 +155,11 @@ class MongoDB(Database):
                             )
             return pd.DataFrame(list(res))
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
             return pd.DataFrame([])"""
     
     def get_ohlcv(self, exchange_id, pair, period, from_timestamp=None):
+        import pandas as pd
         try:
             res = self.db['ohlcvs'].find(
                 {"$and": 
@@ -133,46 +180,155 @@ class MongoDB(Database):
                                     [("timestamp", pymongo.ASCENDING)])
             return pd.DataFrame(list(res))
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
             return pd.DataFrame([])
     
     
-    def write_operation(self, operation_type, account_id, bot_id, amount, pair, timestamp):
+    def write_operation(
+        self,
+        operation_type,
+        account_id,
+        bot_id,
+        amount,
+        pair,
+        timestamp,
+        ledger_fields=None
+    ):
+        """
+        Append operation to operations collection
+
+        :param ledger_fields: seq, diff and balances after the operation
+            when operations collection is used as ledger
+        """
+        res = False
         try:
-            self.db["operations"].insert_one({
+            operation = {
                 "timestamp": timestamp,
                 "type": operation_type,
                 "account_id": ObjectId(account_id),
                 "bot_id": ObjectId(bot_id),
                 "amount": amount,
                 "pair": pair
-            })
+            }
+            if not(ledger_fields is None):
+                operation.update(ledger_fields)
+            self.db["operations"].insert_one(operation)
+            res = True
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def ensure_ledger_indexes(self):
+        try:
+            self.db["operations"].create_index(
+                "seq",
+                unique=True,
+                partialFilterExpression={"seq": {"$exists": True}}
+                )
+            self.db["ledger_snapshots"].create_index("seq", unique=True)
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+
+
+    def get_last_operation_seq(self):
+        """
+        Sequence number of the last ledger operation, 0 if there are none,
+        None if it can not be read
+        """
+        res = None
+        try:
+            temp = self.db["operations"].find_one(
+                {"seq": {"$exists": True}},
+                sort=[("seq", pymongo.DESCENDING)]
+                )
+            res = temp["seq"] if temp else 0
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def get_operations_from_seq(self, seq):
+        """
+        Ledger tail: operations with sequence number greater than seq
+        """
+        res = []
+        try:
+            res = list(
+                self.db["operations"].find(
+                    {"seq": {"$gt": seq}}
+                    ).sort([("seq", pymongo.ASCENDING)])
+                )
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def write_ledger_snapshot(self, snapshot):
+        res = False
+        try:
+            self.db["ledger_snapshots"].insert_one(snapshot)
+            res = True
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def get_last_ledger_snapshot(self):
+        res = None
+        try:
+            res = self.db["ledger_snapshots"].find_one(
+                sort=[("seq", pymongo.DESCENDING)]
+                )
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def write_traces(self, traces):
+        """
+        Append finished latency traces of candles
+        """
+        res = False
+        try:
+            self.db["traces"].insert_many(traces, ordered=False)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
+            log_exception('MongoDB', e, self.logger)
+        return res
+
+
+    def get_traces(self, from_close=None):
+        """
+        Latency traces of candles closed after from_close
+        """
+        res = []
+        try:
+            res = list(
+                self.db["traces"].find(
+                    {} if from_close is None else {"close": {"$gt": from_close}},
+                    {"_id": 0}
+                    )
                 )
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
+        return res
 
 
     def write_single_ohlcv(self, exchange_id, pair, period, tohlcv):
+        res = False
         try:
             thohlcv_db = self.preprocess_ohlcv(ObjectId(exchange_id), pair, period, tohlcv)
             #self.db[exchange][pair][period]["ohlcv"].insert_one(thohlcv_db)
             self.db['ohlcvs'].insert_one(thohlcv_db)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
 
     def write_multiple_ohlcv(self, exchange_id, pair, period, tohlcv_list):
+        res = False
         try:
             # prepare ohlcvs for db
             #tohlcv_db_list = list(map(self.preprocess_ohlcv, tohlcv_list))
@@ -182,159 +338,259 @@ class MongoDB(Database):
             # write ohlcvs to db
             #self.db[exchange][pair][period]["ohlcv"].insert_many(tohlcv_db_list)
             self.db['ohlcvs'].insert_many(tohlcv_db_list)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
     
     def write_single_account_balance(self, balance):
+        res = False
         try:
             balance_db = self.preprocess_account_balance(balance)
             self.db["account_balances"].insert_one(balance_db)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
 
     def write_multiple_account_balances(self, balances):
+        res = False
         try:
             # prepare ohlcvs for db
             balance_db_list = list(map(self.preprocess_account_balance, balances))
             # write ohlcvs to db
             self.db["account_balances"].insert_many(balance_db_list)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
 
     def write_single_bot_balance(self, balance):
+        res = False
         try:
             balance_db = self.preprocess_bot_balance(balance)
             self.db["bot_balances"].insert_one(balance_db)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
 
     def write_multiple_bots_balances(self, balances):
+        res = False
         try:
             # prepare ohlcvs for db
             balance_db_list = list(map(self.preprocess_bot_balance, balances))
             # write ohlcvs to db
             self.db["bot_balances"].insert_many(balance_db_list)
+            res = True
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
+        return res
 
-    def get_account_balances(self, account_id, from_timestamp=None):
-        res = []
-        try:
-            if from_timestamp is None:
-                res = list(
-                    self.db["account_balances"].find(
-                        {'account_id': ObjectId(account_id)}
-                        ).sort(
-                            [("timestamp", pymongo.ASCENDING)])
-                            )
-            else:
-                res = list(
-                    self.db["account_balances"].find(
-                        {"$and":[
-                            {'account_id': ObjectId(account_id)},
-                            {'timestamp': {'$gte': from_timestamp}}]}
-                        ).sort(
-                            [("timestamp", pymongo.ASCENDING)])
-                            )
-        except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
-        return pd.DataFrame(res)
 
-    
-    def get_account_last_balance(self, account_id):
-        res = {}
-        not_currency_fields = ['_id', 'account_id', 'timestamp']
+    def balances_collections(self, collection_name):
+        """
+        Balances collections from the oldest tier to the raw one
+
+        :param collection_name: account_balances or bot_balances
+        """
+        return [
+            self.db[f"{collection_name}_{tier}"]\
+                for tier in reversed(list(self.balances_tiers.keys()))
+            ] + [self.db[collection_name]]
+
+
+    def ensure_balances_indexes(self, collection_name, id_field):
+        """
+        Create indexes used by tiered balances: lookups by id and time,
+        unique keys for rollup merge and TTL removal of rolled up rows
+
+        :param collection_name: account_balances or bot_balances
+        :param id_field: account_id or bot_id
+        """
         try:
-            temp = self.db["account_balances"].find_one(
-                    {'account_id': ObjectId(account_id)},
-                    sort=[("timestamp", pymongo.DESCENDING)]
+            self.db[collection_name].create_index(
+                [(id_field, pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)]
+                )
+            for tier in self.balances_tiers.keys():
+                self.db[f"{collection_name}_{tier}"].create_index(
+                    [(id_field, pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)],
+                    unique=True
+                    )
+            for collection in self.balances_collections(collection_name)[1:]:
+                collection.create_index(
+                    "rolled_up_at",
+                    expireAfterSeconds=self.balances_rolled_up_ttl
                     )
-            if temp:
-                res = {
-                    key: temp[key] for key in temp.keys()\
-                        if not(key in not_currency_fields)
-                    }
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
+            log_exception('MongoDB', e, self.logger)
+
+
+    def rollup_balances(self, source, target, id_field, bucket, retention):
+        """
+        Roll balances older than retention up to last values per bucket
+        and mark the source rows for TTL removal
+
+        :param source: source collection name
+        :param target: target collection name
+        :param id_field: account_id or bot_id
+        :param bucket: target bucket size, ms
+        :param retention: how long source keeps its own resolution, ms
+        """
+        cutoff = int(time.time() * 1000) - retention
+        cutoff -= cutoff % bucket
+        source_filter = {
+            'timestamp': {'$lt': cutoff},
+            'rolled_up_at': {'$exists': False}
+            }
+        try:
+            self.db[source].aggregate([
+                {'$match': source_filter},
+                {'$sort': {'timestamp': pymongo.ASCENDING}},
+                {'$group': {
+                    '_id': {
+                        id_field: f"${id_field}",
+                        'bucket': {'$subtract': [
+                            '$timestamp',
+                            {'$mod': ['$timestamp', bucket]}
+                            ]}
+                        },
+                    'last': {'$last': '$$ROOT'}
+                    }},
+                {'$replaceRoot': {'newRoot': '$last'}},
+                {'$project': {'_id': 0, 'rolled_up_at': 0}},
+                {'$merge': {
+                    'into': target,
+                    'on': [id_field, 'timestamp'],
+                    'whenMatched': 'replace',
+                    'whenNotMatched': 'insert'
+                    }}
+                ])
+            self.db[source].update_many(
+                source_filter,
+                {'$set': {'rolled_up_at': datetime.utcnow()}}
                 )
-        return res
+        except Exception as e:
+            log_exception('MongoDB', e, self.logger)
 
-    def get_bot_balances(self, bot_id, from_timestamp=None):
+
+    def rollup_tiered_balances(self, collection_name, id_field):
+        """
+        Roll 1m balances up to 1h and 1h balances up to 1d
+
+        :param collection_name: account_balances or bot_balances
+        :param id_field: account_id or bot_id
+        """
+        self.rollup_balances(
+            collection_name,
+            f"{collection_name}_1h",
+            id_field,
+            self.balances_tiers['1h'],
+            self.balances_retention['1m']
+            )
+        self.rollup_balances(
+            f"{collection_name}_1h",
+            f"{collection_name}_1d",
+            id_field,
+            self.balances_tiers['1d'],
+            self.balances_retention['1h']
+            )
+
+
+    def rollup_account_balances(self):
+        self.rollup_tiered_balances("account_balances", 'account_id')
+
+
+    def rollup_bot_balances(self):
+        self.rollup_tiered_balances("bot_balances", 'bot_id')
+
+
+    def get_tiered_balances(self, collection_name, id_field, owner_id, from_timestamp=None):
+        """
+        Read balances across all tiers. Rows already rolled up are skipped,
+        so every moment is served by exactly one tier
+
+        :param collection_name: account_balances or bot_balances
+        :param id_field: account_id or bot_id
+        :param owner_id: account or bot id
+        :param from_timestamp: timestamp of the first balance to return
+        """
         res = []
+        query = [
+            {id_field: ObjectId(owner_id)},
+            {'rolled_up_at': {'$exists': False}}
+            ]
+        if not(from_timestamp is None):
+            query.append({'timestamp': {'$gte': from_timestamp}})
         try:
-            if from_timestamp is None:
-                res = list(
-                    self.db["bot_balances"].find(
-                        {'bot_id': ObjectId(bot_id)}
-                        ).sort(
-                            [("timestamp", pymongo.ASCENDING)])
-                            )
-            else:
-                res = list(
-                    self.db["bot_balances"].find(
-                        {"$and":[
-                            {'bot_id': ObjectId(bot_id)},
-                            {'timestamp': {'$gte': from_timestamp}}]}
-                        ).sort(
-                            [("timestamp", pymongo.ASCENDING)])
-                            )
+            for collection in self.balances_collections(collection_name):
+                res += list(
+                    collection.find({"$and": query}).sort(
+                        [("timestamp", pymongo.ASCENDING)])
+                        )
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
-        return pd.DataFrame(res)
+            log_exception('MongoDB', e, self.logger)
+        return sorted(res, key=lambda item: item['timestamp'])
 
-    
-    def get_bot_last_balance(self, bot_id):
+
+    def get_tiered_last_balance(self, collection_name, id_field, owner_id):
+        """
+        Read the newest balance across all tiers
+
+        :param collection_name: account_balances or bot_balances
+        :param id_field: account_id or bot_id
+        :param owner_id: account or bot id
+        """
         res = {}
-        not_currency_fields = ['_id', 'bot_id', 'timestamp']
         try:
-            temp = self.db["bot_balances"].find_one(
-                    {'bot_id': ObjectId(bot_id)},
+            for collection in reversed(self.balances_collections(collection_name)):
+                temp = collection.find_one(
+                    {id_field: ObjectId(owner_id)},
                     sort=[("timestamp", pymongo.DESCENDING)]
                     )
-            if temp:
-                res = {
-                    key: temp[key] for key in temp.keys()\
-                        if not(key in not_currency_fields)
-                    }
+                if temp:
+                    res = self.currency_fields(temp)
+                    break
         except Exception as e:
-            log(
-                f"Exception in MongoDB:{inspect.stack()[0][3]}\n{e}",
-                'exception',
-                self.logger
-                )
+            log_exception('MongoDB', e, self.logger)
         return res
+
+
+    def get_account_balances(self, account_id, from_timestamp=None):
+        import pandas as pd
+        return pd.DataFrame(self.get_tiered_balances(
+            "account_balances",
+            'account_id',
+            account_id,
+            from_timestamp
+            ))
+
+    
+    def get_account_last_balance(self, account_id):
+        return self.get_tiered_last_balance(
+            "account_balances",
+            'account_id',
+            account_id
+            )
+
+
+    def get_bot_balances(self, bot_id, from_timestamp=None):
+        import pandas as pd
+        return pd.DataFrame(self.get_tiered_balances(
+            "bot_balances",
+            'bot_id',
+            bot_id,
+            from_timestamp
+            ))
+
+    
+    def get_bot_last_balance(self, bot_id):
+        return self.get_tiered_last_balance(
+            "bot_balances",
+            'bot_id',
+            bot_id
+            )
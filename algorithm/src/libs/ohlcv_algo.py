@@ -4,15 +4,19 @@ from .data_service_api import *
 
 class OHLCV_Algorithm(Algorithm):
 
-    def __init__(self, db, bot_id, logger):
-        self.ohlcv_data_service_api = DataServiceAPI(
-            os.environ.get("OHLCV_REST_API_BASE_URL"),
-            os.environ.get("REST_API_USER"),
-            os.environ.get("REST_API_PASSWORD"),
-            logger
-            )
-        super().__init__(db, bot_id, logger)
-        
+    def __init__(self, db, bot_id, logger, host=None):
+        if host is None:
+            self.ohlcv_data_service_api = DataServiceAPI(
+                os.environ.get("OHLCV_REST_API_BASE_URL"),
+                os.environ.get("REST_API_USER"),
+                os.environ.get("REST_API_PASSWORD"),
+                logger
+                )
+        else:
+            self.ohlcv_data_service_api = host.ohlcv_data_service_api
+        # PairFeed of the host, closes come from it instead of own requests
+        self.feed = None
+        super().__init__(db, bot_id, logger, host)
 
 
     def np_from_response(self, response):
@@ -26,6 +30,11 @@ class OHLCV_Algorithm(Algorithm):
 
 
     def initialize_ohlcv_from_period(self, period):
+        if not(self.host is None):
+            self.feed = self.host.subscribe(self, period)
+            self.timeseries = self.feed.timeseries(period)
+            self.last_read_timestamp = self.timeseries[0, -1]
+            return
         self.bot.exchange.set_periods_params(
             period,
             int(period / 10)
@@ -43,14 +52,22 @@ class OHLCV_Algorithm(Algorithm):
     def get_data_from_exchange(self):
         cur_timestamp = self.bot.exchange.get_current_exchange_timestamp()
         if cur_timestamp - self.last_read_timestamp >= self.bot.exchange.periods['1m']:
-            self.new_ohlcv = self.ohlcv_data_service_api.get_close(
-                self.bot.exchange.exchange_name,
-                self.bot.pair,
-                '1m',
-                self.last_read_timestamp
-                )
+            try:
+                self.new_ohlcv = self.ohlcv_data_service_api.get_close(
+                    self.bot.exchange.exchange_name,
+                    self.bot.pair,
+                    '1m',
+                    self.last_read_timestamp
+                    )
+            except DataServiceAPIError as e:
+                log_exception('OHLCV_Algorithm', e, self.logger)
+                return False
             if len(self.new_ohlcv) > 0:
                 self.last_read_timestamp = self.new_ohlcv[-1]['timestamp']
+                self.trace = tracer.stamp(
+                    self.ohlcv_data_service_api.last_trace,
+                    'algo_fetch'
+                    )
                 return True
         return False
 
@@ -0,0 +1,274 @@
+import time
+import threading
+from .logger import *
+
+
+# candle periods, ms; Exchange.periods refers to this dict, it lives here
+# so services which only schedule work do not import ccxt
+candle_periods = {
+    '1m': 60000,
+    '1h': 3600000,
+    '1d': 86400000
+}
+
+
+class CandleScheduler():
+    """
+    Run jobs right after candle close of their period
+
+    Candle boundaries are taken from the wall clock once and then followed
+    on the monotonic clock: the next deadline is the previous one plus the
+    period, so runs do not drift. The anchor is re-read if the wall clock
+    is stepped. Each job runs in its own thread, a boundary is skipped if
+    the previous run of the job is still in flight.
+    """
+
+    # re-anchor to the wall clock if it moved by more than this, seconds
+    clock_step_tolerance = 1.0
+
+    def __init__(self, logger=None, settle_delay=0.0):
+        """
+        :param logger: logger
+        :param settle_delay: default delay after candle close, seconds
+        """
+        self.logger = logger
+        self.settle_delay = float(settle_delay)
+        self.jobs = []
+        self.stop_event = threading.Event()
+        self.anchor()
+
+
+    def anchor(self):
+        self.wall_offset = time.time() - time.monotonic()
+
+
+    def next_boundary(self, period_ms, after):
+        """
+        Monotonic time of the first candle close of period after the moment
+
+        :param period_ms: candle period, ms
+        :param after: monotonic time, seconds
+        """
+        after_ms = (after + self.wall_offset) * 1000.0
+        boundary_ms = (after_ms // period_ms + 1) * period_ms
+        return boundary_ms / 1000.0 - self.wall_offset
+
+
+    def every(self, timeframe, func, *args, settle_delay=None, **kwargs):
+        """
+        Run func(*args, **kwargs) after every close of timeframe candle
+
+        :param timeframe: 1m, 1h, 1d...
+        :param func: job, its args and kwargs may use any name, period too
+        :param settle_delay: delay after candle close, seconds
+        """
+        period_ms = candle_periods[timeframe]
+        delay = self.settle_delay if settle_delay is None else float(settle_delay)
+        job = {
+            'name': f"{getattr(func, '__name__', 'job')} {timeframe}",
+            'period_ms': period_ms,
+            'settle_delay': delay,
+            'func': func,
+            'args': args,
+            'kwargs': kwargs,
+            'deadline': self.next_boundary(period_ms, time.monotonic()) + delay,
+            'thread': None,
+            'runs': 0,
+            'skipped': 0,
+            'last_lag': 0.0,
+            'max_lag': 0.0,
+            'total_lag': 0.0
+            }
+        self.jobs.append(job)
+        return job
+
+
+    def run_job(self, job):
+        try:
+            job['func'](*job['args'], **job['kwargs'])
+        except Exception as e:
+            log_exception('CandleScheduler', e, self.logger, ('CandleScheduler', job['name']))
+
+
+    def start_job(self, job, now):
+        lag = now - job['deadline']
+        if not(job['thread'] is None) and job['thread'].is_alive():
+            job['skipped'] += 1
+            log(
+                f"Scheduler: {job['name']} skipped, previous run is in flight",
+                'warning',
+                self.logger
+                )
+        else:
+            job['runs'] += 1
+            job['last_lag'] = lag
+            job['max_lag'] = max(job['max_lag'], lag)
+            job['total_lag'] += lag
+            job['thread'] = threading.Thread(
+                target=self.run_job,
+                args=(job,),
+                name=job['name'],
+                daemon=True
+                )
+            job['thread'].start()
+            log(
+                f"Scheduler: {job['name']} started, lag {lag * 1000.0:.1f} ms",
+                'debug',
+                self.logger
+                )
+        # advance on the boundary grid, missed boundaries are skipped
+        job['deadline'] += job['period_ms'] / 1000.0
+        if job['deadline'] <= now:
+            job['deadline'] = self.next_boundary(
+                job['period_ms'],
+                now - job['settle_delay']
+                ) + job['settle_delay']
+
+
+    def check_clock(self):
+        wall_offset = time.time() - time.monotonic()
+        if abs(wall_offset - self.wall_offset) > self.clock_step_tolerance:
+            log(
+                f"Scheduler: wall clock moved by {wall_offset - self.wall_offset:.3f} s",
+                'warning',
+                self.logger
+                )
+            self.anchor()
+            now = time.monotonic()
+            for job in self.jobs:
+                job['deadline'] = self.next_boundary(job['period_ms'], now) + job['settle_delay']
+
+
+    def run_pending(self):
+        """
+        Start jobs whose deadline has come, return seconds to the next deadline
+        """
+        self.check_clock()
+        now = time.monotonic()
+        for job in self.jobs:
+            if job['deadline'] <= now:
+                self.start_job(job, now)
+        return max(0.0, min(job['deadline'] for job in self.jobs) - time.monotonic())
+
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            # wake up at least once a minute to notice wall clock steps
+            self.stop_event.wait(min(self.run_pending(), 60.0))
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+    def stats(self):
+        """
+        Runs, skipped boundaries and lag after the deadline per job, seconds
+        """
+        return {
+            job['name']: {
+                'runs': job['runs'],
+                'skipped': job['skipped'],
+                'last_lag': job['last_lag'],
+                'max_lag': job['max_lag'],
+                'mean_lag': job['total_lag'] / job['runs'] if job['runs'] > 0 else 0.0
+                } for job in self.jobs
+            }
+
+
+class CandleWaiter():
+    """
+    Wait for the next candle of a consumer of closed candles
+
+    Sleeps until the candle after the last received one closes, then
+    polls until it arrives: back to back by default, as often as the
+    busy loop did, so the latency is the same with a fraction of its
+    requests. A backoff_max above 0 polls with growing delays up to it
+    instead, fewer requests for more latency. Once the candle is overdue
+    by more than late_after, polling slows down to late_backoff_max,
+    e.g. while the data service is down. notify() wakes the waiter at
+    once, for a push of a new candle.
+    """
+
+    def __init__(
+        self,
+        period_ms,
+        backoff=0.005,
+        backoff_max=0.0,
+        late_after=30.0,
+        late_backoff_max=5.0
+    ):
+        """
+        :param period_ms: candle period, ms
+        :param backoff: first delay after the expected close, seconds
+        :param backoff_max: max delay while the candle is due, seconds,
+            0 polls back to back
+        :param late_after: seconds after the expected close when polling slows down
+        :param late_backoff_max: max delay of an overdue candle, seconds
+        """
+        self.period_ms = period_ms
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.late_after = late_after
+        self.late_backoff_max = late_backoff_max
+        self.attempt = 0
+        self.event = threading.Event()
+        self.stopped = False
+
+
+    def expected_close(self, last_timestamp):
+        """
+        Close time of the candle after the one opened at last_timestamp, ms
+        """
+        return last_timestamp + 2 * self.period_ms
+
+
+    def delay(self, last_timestamp, now):
+        """
+        Seconds to wait before the next poll
+
+        :param last_timestamp: open time of the last received candle, ms
+        :param now: current time, ms
+        """
+        overdue = (now - self.expected_close(last_timestamp)) / 1000.0
+        if overdue < 0.0:
+            self.attempt = 0
+            return -overdue
+        if self.late(last_timestamp, now):
+            return self.late_backoff_max
+        # the exponent is capped, a candle due for long polls many times
+        delay = min(
+            self.backoff * 2.0 ** min(self.attempt, 32),
+            self.backoff_max
+            )
+        self.attempt += 1
+        return delay
+
+
+    def late(self, last_timestamp, now):
+        """
+        True if the candle after last_timestamp is overdue by late_after
+        """
+        return now - self.expected_close(last_timestamp) >= self.late_after * 1000.0
+
+
+    def received(self):
+        self.attempt = 0
+
+
+    def wait(self, seconds):
+        """
+        Sleep for seconds or until notify(), True if notified
+        """
+        res = self.event.wait(seconds)
+        self.event.clear()
+        return res
+
+
+    def notify(self):
+        self.event.set()
+
+
+    def stop(self):
+        self.stopped = True
+        self.event.set()
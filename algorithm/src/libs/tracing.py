@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import bisect
+import atexit
+import threading
+from .logger import *
+
+
+# header carrying the trace between services
+trace_header = "X-Candle-Trace"
+
+# pipeline stages in the order a candle passes them
+trace_stages = [
+    'exchange_fetch',
+    'reader',
+    'algo_fetch',
+    'process_data',
+    'make_operation'
+]
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class LatencyHistogram():
+    """
+    Histogram with log-spaced buckets: 4 buckets per power of two from 1 ms,
+    so a percentile is exact to ~19%. Adding a value is a binary search.
+    """
+
+    bounds = [2 ** (i / 4.0) for i in range(4 * 26)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile, ms
+
+        :param q: percentile, 0 - 100
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(self.max, self.bounds[i]) if i < len(self.bounds) else self.max
+        return self.max
+
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count > 0 else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+            }
+
+
+class Tracer():
+    """
+    Trace stamps of candles moving through the pipeline
+
+    A trace is a dict with close time of the candle and a list of
+    [stage, wall clock ms] stamps. Every stamp adds the time since the
+    previous stamp (since candle close for the first one) to the histogram
+    of its stage. Finished traces are written to db in batches.
+    Stamps of different services are compared by wall clock, so hosts
+    are expected to be NTP synced.
+    """
+
+    def __init__(self, service=None, db=None, logger=None, enabled=True, batch_size=50, flush_interval=60.0):
+        """
+        :param service: service name written with finished traces
+        :param db: database for finished traces, they are not kept if None
+        :param logger: logger
+        :param enabled: stamp traces
+        :param batch_size: finished traces written at once
+        :param flush_interval: max seconds a finished trace waits in buffer
+        """
+        self.configure(service, db, logger)
+        self.enabled = enabled
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.histograms = {}
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def configure(self, service=None, db=None, logger=None):
+        self.service = service
+        self.db = db
+        self.logger = logger
+        if not(db is None):
+            atexit.register(self.flush)
+
+
+    def start(self, exchange_name, pair, period, candle_timestamp, period_ms):
+        """
+        New trace of the candle
+
+        :param candle_timestamp: open time of the candle, ms
+        :param period_ms: candle period, ms
+        """
+        if not self.enabled:
+            return None
+        return {
+            'exchange': exchange_name,
+            'pair': pair,
+            'period': period,
+            'close': int(candle_timestamp) + int(period_ms),
+            'stamps': []
+            }
+
+
+    def stamp(self, trace, stage, timestamp=None):
+        """
+        Add stage stamp to the trace and its latency to the stage histogram
+        """
+        if (trace is None) or not self.enabled:
+            return trace
+        timestamp = now_ms() if timestamp is None else timestamp
+        previous = trace['stamps'][-1][1] if len(trace['stamps']) > 0 else trace['close']
+        with self.lock:
+            if not(stage in self.histograms):
+                self.histograms[stage] = LatencyHistogram()
+            self.histograms[stage].add(max(0, timestamp - previous))
+        trace['stamps'].append([stage, timestamp])
+        return trace
+
+
+    def finish(self, trace):
+        """
+        Record total latency from candle close and queue the trace to db
+        """
+        if (trace is None) or not self.enabled or len(trace['stamps']) == 0:
+            return
+        with self.lock:
+            if not('total' in self.histograms):
+                self.histograms['total'] = LatencyHistogram()
+            self.histograms['total'].add(max(0, trace['stamps'][-1][1] - trace['close']))
+            if self.db is None:
+                return
+            self.buffer.append(dict(trace, service=self.service))
+            if len(self.buffer) < self.batch_size and\
+                time.monotonic() - self.last_flush < self.flush_interval:
+                return
+        self.flush()
+
+
+    def flush(self):
+        with self.lock:
+            buffer, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+        if len(buffer) > 0 and not(self.db is None):
+            self.db.write_traces(buffer)
+
+
+    def summary(self):
+        """
+        Latency percentiles per stage, ms
+        """
+        with self.lock:
+            return {
+                stage: histogram.summary() for stage, histogram in self.histograms.items()
+                }
+
+
+    @staticmethod
+    def copy(trace):
+        return None if trace is None else dict(trace, stamps=[list(item) for item in trace['stamps']])
+
+
+    @staticmethod
+    def to_header(trace):
+        if trace is None:
+            return {}
+        return {trace_header: json.dumps(trace, separators=(',', ':'))}
+
+
+    @staticmethod
+    def from_header(headers):
+        """
+        Trace from request or response headers, None if absent or broken
+        """
+        value = headers.get(trace_header)
+        if not value:
+            return None
+        try:
+            trace = json.loads(value)
+            return trace if isinstance(trace, dict) and 'close' in trace and 'stamps' in trace else None
+        except ValueError:
+            return None
+
+
+# one tracer per process, services configure it with their name and db
+tracer = Tracer(
+    enabled=(os.environ.get("TRACING") or "1") == "1",
+    batch_size=os.environ.get("TRACE_BATCH_SIZE") or 50
+    )
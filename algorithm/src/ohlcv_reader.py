@@ -2,11 +2,11 @@ import os
 import json
 import pandas as pd
 import numpy as np
-from flask import Flask, jsonify, make_response
+from flask import Flask, jsonify, make_response, request
 from flask.wrappers import Response
 from flask_httpauth import HTTPBasicAuth
 from flask_apscheduler import APScheduler
-from libs import *
+from libs import Logger, MongoDB, Exchange, Tracer, tracer
 
 class Flask_App_Config:
     """
@@ -16,20 +16,37 @@ class Flask_App_Config:
     SCHEDULER_API_ENABLED = True
 
 
-def df_to_json(df):
+def df_to_json(df, trace=None):
     """
     Convert pandas dataframe to API response
+
+    :param trace: latency trace of the last candle, sent in header
     """
     return Response(
         df.to_json(orient="records"),
-        mimetype='application/json'
+        mimetype='application/json',
+        headers=Tracer.to_header(trace)
         )
 
 
+def traced_df_to_json(exchange, pair, period, df):
+    """
+    Response with trace of the last candle if it is the last fetched one
+    """
+    trace = None
+    if df.shape[0] > 0:
+        trace = tracer.stamp(
+            exchange.get_trace(pair, period, df['timestamp'].iloc[-1]),
+            'reader'
+            )
+    return df_to_json(df, trace)
+
+
 auth = HTTPBasicAuth()
 app = Flask(__name__)
 
 logger = Logger("/logs/logs.log")
+tracer.configure('ohlcv_reader', logger=logger)
 
 db = MongoDB(
     os.environ.get("MONGO_USERNAME"),
@@ -109,13 +126,19 @@ def get_ohlcv(exchange_name, symbol_1, symbol_2, period, from_timestamp):
     :param symbol_2: second symbol in a pair
     :param period: timeframe - 1m, 1h, 1d...
     :param from_timestamp: timestamp of the first ohlcv to return
+    :query limit: max number of ohlcvs to return
     """
     if exchange_name in exchanges.keys():
-        return df_to_json(
+        pair = Exchange.concat_pair(symbol_1, symbol_2)
+        return traced_df_to_json(
+            exchanges[exchange_name],
+            pair,
+            period,
             exchanges[exchange_name].get_ohlcv_from_timestamp(
-                Exchange.concat_pair(symbol_1, symbol_2),
+                pair,
                 period,
-                from_timestamp
+                from_timestamp,
+                request.args.get('limit', type=int)
                 ))
     else:
         return df_to_json(pd.DataFrame([]))
@@ -137,9 +160,13 @@ def get_close(exchange_name, symbol_1, symbol_2, period, from_timestamp):
     :param from_timestamp: timestamp of the first close to return
     """
     if exchange_name in exchanges.keys():
-        return df_to_json(
+        pair = Exchange.concat_pair(symbol_1, symbol_2)
+        return traced_df_to_json(
+            exchanges[exchange_name],
+            pair,
+            period,
             exchanges[exchange_name].get_close_from_timestamp(
-                Exchange.concat_pair(symbol_1, symbol_2),
+                pair,
                 period,
                 from_timestamp
                 ))
@@ -171,6 +198,18 @@ def get_current_close(exchange_name, symbol_1, symbol_2, period):
         return df_to_json(pd.DataFrame([]))
 
 
+@app.route(
+    '/latency',
+    methods=['GET']
+    )
+@auth.login_required
+def get_latency():
+    """
+    Latency percentiles per pipeline stage, ms
+    """
+    return jsonify(tracer.summary())
+
+
 def update_exchanges(period):
     """
     Update OHLCVs for all exchanges
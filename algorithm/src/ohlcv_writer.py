@@ -1,9 +1,11 @@
 import os
 import json
 import time
-import schedule
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
-from libs import *
+from libs import Logger, MongoDB, Exchange, DataServiceAPI, DataServiceAPIError, log_exception, CandleScheduler
+from libs.async_data_service_api import AsyncDataServiceAPI
 
 logger = Logger("/logs/logs.log")
     
@@ -20,58 +22,215 @@ db = MongoDB(
     "mongodb:27017"
     )
 
+async_mode = os.environ.get("WRITER_ASYNC", "0") == "1"
+async_concurrency = int(os.environ.get("WRITER_CONCURRENCY") or 10)
+catchup_batch_size = int(os.environ.get("CATCHUP_BATCH_SIZE") or 5000)
+
+# seconds after candle close, the exchange has to publish the candle first
+scheduler = CandleScheduler(
+    logger,
+    float(os.environ.get("SCHEDULER_SETTLE_DELAY") or 2.0)
+    )
+
 exchanges = {
     exchange_i["name"]: Exchange(db, exchange_i['id'], logger)\
         for exchange_i in db.get_active_exchanges()
     }
 
+# high-water marks: (exchange_id, pair, period) -> last written timestamp
+last_timestamps = {}
+
+
+def last_timestamp_key(exchange, pair, period):
+    return (str(exchange.exchange_id), pair, period)
+
+
+def get_last_timestamp(exchange, pair, period):
+    """
+    High-water mark kept in memory, Mongo is consulted only when it was
+    dropped after an error
+    """
+    key = last_timestamp_key(exchange, pair, period)
+    if not(key in last_timestamps):
+        last_timestamps[key] = db.get_last_timestamp(
+            exchange.exchange_id,
+            pair,
+            period
+            )
+    return last_timestamps[key]
+
+
+def advance_last_timestamp(exchange, pair, period, tohlcv_list, written):
+    """
+    Move high-water mark after a successful write, drop it after a failed one
+    """
+    key = last_timestamp_key(exchange, pair, period)
+    if not written:
+        last_timestamps.pop(key, None)
+    elif len(tohlcv_list) > 0:
+        last_timestamps[key] = max(
+            last_timestamps.get(key, 0),
+            max(tohlcv['timestamp'] for tohlcv in tohlcv_list)
+            )
+
+
+def is_behind(exchange, pair, period):
+    lag = int(time.time() * 1000) - get_last_timestamp(exchange, pair, period)
+    return lag > exchange.periods[period] * catchup_batch_size
+
+
+def fetch(exchange, pair, period, limit=None):
+    try:
+        return data_service_api.get_ohlcv(
+            exchange.exchange_name,
+            pair,
+            period,
+            get_last_timestamp(exchange, pair, period),
+            limit
+            )
+    except DataServiceAPIError as e:
+        log_exception(
+            f"ohlcv_writer {exchange.exchange_name} {pair} {period}",
+            e,
+            logger
+            )
+    return None
+
+
+def catch_up(exchange, pair, period):
+    """
+    Page missing history in batches of catchup_batch_size OHLCVs
+    """
+    while True:
+        tohlcv_list = fetch(exchange, pair, period, catchup_batch_size)
+        if tohlcv_list is None:
+            return
+        written = db.write_ohlcv(
+            exchange.exchange_id,
+            pair,
+            period,
+            tohlcv_list
+            )
+        advance_last_timestamp(exchange, pair, period, tohlcv_list, written)
+        if not(written) or (len(tohlcv_list) < catchup_batch_size):
+            return
+
+
 def update(exchange, pair, period):
-    last_timestamp_from_db = db.get_last_timestamp(
+    if is_behind(exchange, pair, period):
+        catch_up(exchange, pair, period)
+        return
+    tohlcv_list = fetch(exchange, pair, period)
+    if tohlcv_list is None:
+        return
+    written = db.write_ohlcv(
         exchange.exchange_id,
         pair,
-        period
-        )
-    tohlcv_list = data_service_api.get_ohlcv(
-        exchange.exchange_name,
-        pair,
         period,
-        last_timestamp_from_db
+        tohlcv_list
         )
-    db.write_ohlcv(
+    advance_last_timestamp(exchange, pair, period, tohlcv_list, written)
+
+
+async def update_async(api, write_executor, exchange, pair, period):
+    """
+    Fetch new OHLCVs concurrently with other pairs, the write is queued
+    to a single writer thread, so it overlaps with the remaining fetches
+    """
+    loop = asyncio.get_running_loop()
+    if is_behind(exchange, pair, period):
+        await loop.run_in_executor(
+            write_executor,
+            catch_up,
+            exchange,
+            pair,
+            period
+            )
+        return
+    try:
+        tohlcv_list = await api.get_ohlcv(
+            exchange.exchange_name,
+            pair,
+            period,
+            get_last_timestamp(exchange, pair, period)
+            )
+    except DataServiceAPIError as e:
+        log_exception(
+            f"ohlcv_writer {exchange.exchange_name} {pair} {period}",
+            e,
+            logger
+            )
+        return
+    written = await loop.run_in_executor(
+        write_executor,
+        db.write_ohlcv,
         exchange.exchange_id,
         pair,
         period,
         tohlcv_list
         )
+    advance_last_timestamp(exchange, pair, period, tohlcv_list, written)
+
+
+async def update_jobs_async(jobs):
+    """
+    Run updates for (exchange, pair, period) jobs concurrently
+
+    :param jobs: list of (exchange, pair, period)
+    """
+    with ThreadPoolExecutor(max_workers=1) as write_executor:
+        async with AsyncDataServiceAPI(
+            data_service_api.base_url,
+            os.environ.get("REST_API_USER"),
+            os.environ.get("REST_API_PASSWORD"),
+            logger,
+            concurrency=async_concurrency
+            ) as api:
+            await asyncio.gather(*[
+                update_async(api, write_executor, *job) for job in jobs
+                ])
+
+
+def update_jobs(jobs):
+    if async_mode:
+        asyncio.run(update_jobs_async(jobs))
+    else:
+        for job in jobs:
+            update(*job)
 
 
 def update_all_exchanges_pairs(period):
-        for exchange_i in exchanges.values():
-            for pair in exchange_i.pairs:
-                update(exchange_i, pair, period)
+    update_jobs([
+        (exchange_i, pair, period)\
+            for exchange_i in exchanges.values()\
+                for pair in exchange_i.pairs
+        ])
 
 
 def initialize_exchanges():
-    for exchange_i in exchanges.values():
-        for pair in exchange_i.pairs:
-            for period in exchange_i.periods.keys():
-                update(exchange_i, pair, period)
+    last_timestamps.update(db.get_last_timestamps())
+    update_jobs([
+        (exchange_i, pair, period)\
+            for exchange_i in exchanges.values()\
+                for pair in exchange_i.pairs\
+                    for period in exchange_i.periods.keys()
+        ])
 
 
 def initialize_scheduler():
-    schedule.every().minute.at(":15").do(update_all_exchanges_pairs, period='1m')
-    schedule.every().hour.at(":01").do(update_all_exchanges_pairs, period='1h')
-    schedule.every().day.at("00:01").do(update_all_exchanges_pairs, period='1d')
+    for period in Exchange.periods.keys():
+        scheduler.every(
+            period,
+            update_all_exchanges_pairs,
+            period=period
+            )
 
 
 def main():
 
     initialize_exchanges()
     initialize_scheduler()
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    scheduler.run_forever()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,14 @@
+import importlib
+from numba import cuda
+
+
+def load_backend(backend):
+    """
+    Module with simulate() of the backend, cuda if a GPU is available
+    and backend is auto. Kernels are compiled when the module is imported.
+    """
+    if backend == "auto":
+        backend = "cuda" if cuda.is_available() else "cpu"
+    if not(backend in ["cuda", "cpu"]):
+        raise ValueError("Unknown backend: " + str(backend))
+    return importlib.import_module(backend + "_backend")
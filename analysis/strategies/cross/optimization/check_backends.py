@@ -0,0 +1,326 @@
+"""
+CPU and CUDA backends against each other and against the direct moving
+averages, and throughput of the CPU backend.
+
+The kernels run in the CUDA simulator (NUMBA_ENABLE_CUDASIM=1 is set
+here) on a random walk of candles. The simulator runs threads one by one
+in Python, so the check uses a short history: MAX_WINDOW_SIZE and STEP
+of constants.py are scaled down before the backends are imported. The
+reference moving averages are calculated directly, a loop over the
+window per cell as the kernels did before prefix sums and scans, and
+the reference result is cross_sim as it was before tiles on them. The
+backends run once in one tile and once with max_memory for about
+--tiles tiles. Moving averages are compared on the rows cross_sim reads
+and the result matrices on the columns cross_sim writes. Moving averages differ in rounding only, a crossing
+decided by a difference within rounding could go either way; the random
+walk has none.
+
+Precision of averages from compensated prefix sums is shown on a long
+history at BTC prices.
+
+Throughput is measured with the production constants on a synthetic
+history, in parameter-candles per second: pairs of windows times candles
+simulated, moving averages included, once in one tile and once within
+--bench-memory MB. GPU memory of the grid of main.py on 4 years of
+candles is estimated before tiles and with them, within --gpu-memory MB.
+
+The CPU backend simulates --event-block candles at a time in the check,
+so that blocks of its event loop end inside tiles and between results.
+--mod-n sets the crossing filter of the check.
+
+Usage: python check_backends.py [--candles 800] [--windows 8] [--tiles 7]
+    [--event-block 37] [--mod-n 3]
+    [--bench-candles 600000] [--bench-windows 40] [--bench-memory 64]
+    [--gpu-memory 1024] [--precision-candles 3000000] [--seed 3]
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import numpy as np
+
+os.environ.setdefault("NUMBA_ENABLE_CUDASIM", "1")
+
+from numba import njit
+import constants
+import prefix_sums
+
+PRODUCTION = (constants.MAX_WINDOW_SIZE, constants.STEP)
+RESYNC_INTERVAL = prefix_sums.RESYNC_INTERVAL
+MOD_N = constants.MOD_N
+
+
+def random_candles(count, seed):
+    """
+    timestamp, open, high, low, close, volume rows of a random walk
+    """
+    rng = np.random.default_rng(seed)
+    closes = 100.0 + np.cumsum(rng.normal(0, 0.5, count))
+    opens = np.concatenate(([100.0], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.exponential(0.3, count)
+    lows = np.minimum(opens, closes) - rng.exponential(0.3, count)
+    volumes = 0.1 + rng.exponential(10.0, count)
+    return np.stack(
+        (np.arange(count, dtype=np.float64) * 60000, opens, highs, lows, closes, volumes),
+        axis=1
+        )
+
+
+def make_params(windows):
+    return np.array(
+        [[i, j] for i in range(windows.shape[0]) for j in range(i + 1, windows.shape[0])],
+        dtype=np.int64
+        )
+
+
+def import_backends(max_window_size, step, resync_interval=RESYNC_INTERVAL, mod_n=MOD_N):
+    """
+    Backends compiled with the given constants
+    """
+    constants.MAX_WINDOW_SIZE = max_window_size
+    constants.STEP = step
+    constants.MOD_N = mod_n
+    prefix_sums.RESYNC_INTERVAL = resync_interval
+    for name in ['tiling', 'cuda_backend', 'cpu_backend']:
+        sys.modules.pop(name, None)
+    import tiling
+    import cuda_backend
+    import cpu_backend
+    return tiling, cuda_backend, cpu_backend
+
+
+@njit
+def reference_moving_averages(ohlcv, window_size, exponential):
+    """
+    Moving average of every cell with a loop over its window
+    """
+    out = np.full((ohlcv.shape[0], window_size.shape[0]), np.nan)
+    for x in range(ohlcv.shape[0]):
+        for y in range(window_size.shape[0]):
+            n = min(window_size[y], x)
+            if n > 0:
+                if exponential:
+                    k = 2.0 / (n + 1.0)
+                    res = ohlcv[x - n, constants.OHLCV_CLOSE]
+                    for i in range(1 - n, 1):
+                        res = ohlcv[x + i, constants.OHLCV_CLOSE] * k + res * (1.0 - k)
+                else:
+                    res = 0.0
+                    for i in range(1 - n, 1):
+                        res += ohlcv[x + i, constants.OHLCV_CLOSE]
+                    res /= n
+                out[x, y] = res
+    return out
+
+
+@njit
+def reference_cross_sim(ohlcv, ma, algo_params, result, max_window_size, step):
+    """
+    cross_sim kernel before tiles, a pair of windows per iteration
+    """
+    for pos in range(algo_params.shape[0]):
+        balance_btc = 1.0
+        balance_usdt = 0.0
+        base_t = max_window_size
+        mod_n = constants.MOD_N
+        prev_t = base_t
+
+        result[pos, 0] = balance_btc * ohlcv[base_t, constants.OHLCV_CLOSE] + balance_usdt
+        res_t = 1
+
+        window_short = algo_params[pos, 0]
+        window_long = algo_params[pos, 1]
+
+        prev_cross_temp = 0
+        for i in range(0, mod_n):
+            temp_1 = ma[base_t - i, window_short] - ma[base_t - i, window_long]
+            if temp_1 > 0:
+                prev_cross_temp += 1
+            elif temp_1 < 0:
+                prev_cross_temp -= 1
+
+        for t in range(base_t + mod_n + 1, ohlcv.shape[0] - 1):
+            cross_temp = 0
+            for i in range(0, mod_n):
+                temp_1 = ma[t - i, window_short] - ma[t - i, window_long]
+                if temp_1 > 0:
+                    cross_temp += 1
+                elif temp_1 < 0:
+                    cross_temp -= 1
+
+            if (prev_cross_temp > 0) and (cross_temp < 0) and (balance_btc > 0.0):
+                balance_usdt = balance_btc * ohlcv[t + 1, constants.OHLCV_OPEN] * (1.0 - constants.FEE)
+                balance_btc = 0.0
+
+            if (prev_cross_temp < 0) and (cross_temp > 0) and (balance_usdt > 0.0):
+                balance_btc = balance_usdt / ohlcv[t + 1, constants.OHLCV_OPEN] * (1.0 - constants.FEE)
+                balance_usdt = 0.0
+
+            prev_cross_temp = cross_temp
+
+            if t - prev_t == step:
+                result[pos, res_t] = balance_btc * ohlcv[t, constants.OHLCV_CLOSE] + balance_usdt
+                res_t += 1
+                prev_t = t
+
+
+def kernel_moving_averages(cuda_backend, timeseries, windows, moving_average_type):
+    from numba import cuda
+    out = cuda.to_device(np.full((timeseries.shape[0], windows.shape[0]), np.nan))
+    cuda_backend.moving_averages(
+        timeseries,
+        cuda.to_device(timeseries),
+        cuda.to_device(windows),
+        moving_average_type,
+        out
+        )
+    return out.copy_to_host()
+
+
+def relative_error(expected, values):
+    return float(np.max(np.abs(expected - values) / np.maximum(1.0, np.abs(expected))))
+
+
+def check(args):
+    max_window_size = args.candles // 2
+    step = max(4, args.candles // 40)
+    # scanned sums are resynced a few times
+    tiling, cuda_backend, cpu_backend = import_backends(max_window_size, step, max_window_size // 3, args.mod_n)
+    # kernels are compiled at the first call, with this value
+    cpu_backend.EVENT_BLOCK = args.event_block
+    timeseries = random_candles(args.candles, args.seed)
+    windows = np.unique(np.concatenate((
+        [2, 3, 5, 8],
+        np.linspace(step, max_window_size, args.windows - 4, dtype=np.int64)
+        ))).astype(np.int64)
+    params = make_params(windows)
+    # cross_sim reads these rows and writes these columns
+    first = max_window_size - constants.MOD_N + 1
+    written = (args.candles - 2 - max_window_size) // step + 1
+
+    ok = True
+    print(f"check: {args.candles} candles, MAX_WINDOW_SIZE {max_window_size}, STEP {step}, {params.shape[0]} params")
+    print(f"{'':<12} {'ma cuda':>9} {'ma cpu':>9} {'res cuda':>9} {'res cpu':>9} {'tl cuda':>9} {'tl cpu':>9}")
+    for moving_average_type in ['simple', 'exponential']:
+        reference = reference_moving_averages(timeseries, windows, moving_average_type != 'simple')
+        reference_result = np.zeros((params.shape[0], (args.candles - max_window_size) // step + 1))
+        reference_cross_sim(timeseries, reference, params, reference_result, max_window_size, step)
+        # memory for about args.tiles tiles, not aligned to STEP
+        rows = (args.candles - tiling.first_step()) // args.tiles + 1
+        max_memory = [
+            tiling.working_memory(args.candles, windows.shape[0], params.shape[0], moving_average_type, rows, result_tiles) / tiling.MB\
+                for result_tiles in [True, False]
+            ]
+        errors = [
+            relative_error(reference[first:], kernel_moving_averages(cuda_backend, timeseries, windows, moving_average_type)[first:]),
+            relative_error(reference[first:], cpu_backend.moving_averages(timeseries, windows, moving_average_type)[first:]),
+            relative_error(reference_result[:, :written], cuda_backend.simulate(timeseries, windows, params, moving_average_type)[:, :written]),
+            relative_error(reference_result[:, :written], cpu_backend.simulate(timeseries, windows, params, moving_average_type)[:, :written]),
+            relative_error(reference_result[:, :written], cuda_backend.simulate(timeseries, windows, params, moving_average_type, max_memory[0])[:, :written]),
+            relative_error(reference_result[:, :written], cpu_backend.simulate(timeseries, windows, params, moving_average_type, max_memory[1])[:, :written])
+            ]
+        status = 'ok' if max(errors[:2]) < 1e-9 and max(errors[2:]) == 0.0 else 'FAIL'
+        ok = ok and status == 'ok'
+        print(f"{moving_average_type:<12} " + " ".join(f"{error:>9.1e}" for error in errors) + f" {status}")
+    return ok
+
+
+def precision(args):
+    """
+    Error of moving averages from prefix sums on a long history at BTC
+    prices, compensated and plain cumsum, against math.fsum
+    """
+    rng = np.random.default_rng(args.seed)
+    timeseries = random_candles(args.precision_candles, args.seed)
+    timeseries[:, constants.OHLCV_CLOSE] = 30000.0 + np.cumsum(rng.normal(0, 20.0, args.precision_candles))
+    closes = timeseries[:, constants.OHLCV_CLOSE]
+    prefix, compensation = prefix_sums.compensated_prefix_sums(timeseries)
+    plain = np.concatenate(([0.0], np.cumsum(closes)))
+    print(f"\nprecision: {args.precision_candles} candles, max relative error of averages")
+    print(f"{'window':>8} {'compensated':>12} {'cumsum':>12}")
+    for window in [5, 1440, PRODUCTION[0]]:
+        rows = rng.integers(args.precision_candles // 2, args.precision_candles, 200)
+        exact = np.array([math.fsum(closes[x - window + 1:x + 1]) / window for x in rows])
+        compensated = ((prefix[rows + 1] - prefix[rows + 1 - window]) +\
+            (compensation[rows + 1] - compensation[rows + 1 - window])) / window
+        errors = [relative_error(exact, compensated), relative_error(exact, (plain[rows + 1] - plain[rows + 1 - window]) / window)]
+        print(f"{window:>8} {errors[0]:>12.1e} {errors[1]:>12.1e}")
+
+
+def bench(args):
+    from numba import config
+    tiling, cuda_backend, cpu_backend = import_backends(*PRODUCTION)
+    max_window_size, step = PRODUCTION
+    candles = max_window_size + args.bench_candles
+    timeseries = random_candles(candles, args.seed)
+    windows = np.linspace(5, max_window_size, args.bench_windows, dtype=np.int64)
+    params = make_params(windows)
+    simulated = candles - max_window_size
+    print(f"\nthroughput: {config.NUMBA_NUM_THREADS} threads, {simulated} candles after MAX_WINDOW_SIZE, {params.shape[0]} params")
+    print(f"{'':<12} {'max_memory':>10} {'tiles':>6} {'memory, MB':>11} {'time, s':>8} {'parameter-candles/s':>20}")
+    for moving_average_type in ['simple', 'exponential']:
+        # compile
+        cpu_backend.simulate(timeseries[:max_window_size + 2 * step], windows, params[:1], moving_average_type)
+        for max_memory in [None, args.bench_memory]:
+            rows = tiling.tile_rows(candles, windows.shape[0], params.shape[0], moving_average_type, max_memory)
+            memory = tiling.working_memory(candles, windows.shape[0], params.shape[0], moving_average_type, rows, False)
+            start = time.perf_counter()
+            cpu_backend.simulate(timeseries, windows, params, moving_average_type, max_memory)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{moving_average_type:<12} {str(max_memory):>10} {len(tiling.tiles(candles, rows)):>6} "
+                f"{memory / tiling.MB:>11.0f} {elapsed:>8.2f} {params.shape[0] * simulated / elapsed:>20.3e}"
+                )
+
+    # the windows of main.py
+    windows = np.concatenate((
+        [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+        np.linspace(step, max_window_size, 200, endpoint=True)
+        )).astype(np.int64)
+    params = make_params(windows)
+    candles = 4 * 365 * 24 * 60
+    print(f"\nGPU memory, MB, {windows.shape[0]} windows of main.py, {params.shape[0]} params, {candles} candles")
+    print(f"{'':<12} {'before':>8} {'1 tile':>8} {'tiles':>8}  (max_memory {args.gpu_memory})")
+    for moving_average_type in ['simple', 'exponential']:
+        before = (candles * 6 + candles * windows.shape[0] + params.shape[0] * tiling.result_columns(candles)) * 8
+        print(
+            f"{moving_average_type:<12} {before / tiling.MB:>8.0f} " + " ".join(
+                f"{tiling.working_memory(candles, windows.shape[0], params.shape[0], moving_average_type, rows, True) / tiling.MB:>8.0f}"\
+                    for rows in [
+                        tiling.tile_rows(candles, windows.shape[0], params.shape[0], moving_average_type),
+                        tiling.tile_rows(candles, windows.shape[0], params.shape[0], moving_average_type, args.gpu_memory, True)
+                        ]
+                )
+            )
+
+    print(f"\nmoving averages of {windows.shape[0]} windows, {max_window_size + args.bench_candles} candles")
+    for moving_average_type in ['simple', 'exponential']:
+        start = time.perf_counter()
+        cpu_backend.moving_averages(timeseries, windows, moving_average_type)
+        print(f"{moving_average_type:<12} {time.perf_counter() - start:>8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candles', type=int, default=800)
+    parser.add_argument('--windows', type=int, default=8)
+    parser.add_argument('--tiles', type=int, default=7)
+    parser.add_argument('--event-block', type=int, default=37)
+    parser.add_argument('--mod-n', type=int, default=3)
+    parser.add_argument('--bench-candles', type=int, default=600000)
+    parser.add_argument('--bench-windows', type=int, default=40)
+    parser.add_argument('--bench-memory', type=int, default=64)
+    parser.add_argument('--gpu-memory', type=int, default=1024)
+    parser.add_argument('--precision-candles', type=int, default=3000000)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    ok = check(args)
+    precision(args)
+    bench(args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
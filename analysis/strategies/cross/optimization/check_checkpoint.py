@@ -0,0 +1,109 @@
+"""
+Checkpointed runs against runs in one piece.
+
+The CPU backend simulates a grid of windows on a synthetic history (see
+check_search.py) once in one piece and once through Checkpoint, for
+both moving average types: results must be the same and the time shows
+what chunks cost. Then a run dies after --die chunks and is started
+again: the restarted run must simulate only the other chunks and give
+the same result. Successive halving is resumed the same way.
+
+Usage: python check_checkpoint.py [--days 180] [--long 40]
+    [--chunk-pairs 256] [--die 3] [--seed 3]
+"""
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from constants import *
+import cpu_backend
+from search import pairs, successive_halving
+from checkpoint import Checkpoint
+from check_search import trending_candles
+
+
+class Died(Exception):
+    pass
+
+
+def dying(simulate, chunks, calls):
+    """
+    simulate raising Died after chunks calls, every call counted in calls
+    """
+    def res(*args):
+        if len(calls) == chunks:
+            raise Died()
+        calls.append(args[2].shape[0])
+        return simulate(*args)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--long', type=int, default=40)
+    parser.add_argument('--chunk-pairs', type=int, default=256)
+    parser.add_argument('--die', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    timeseries = trending_candles(MAX_WINDOW_SIZE + args.days * 24 * 60, args.seed)
+    windows = np.unique(np.concatenate((
+        [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+        np.linspace(STEP, MAX_WINDOW_SIZE, args.long, endpoint=True)
+        )).astype(np.int64))
+    params = pairs(windows)
+    ok = True
+    expected = {}
+    print(f"{params.shape[0]} pairs, {args.days} days, chunks of {args.chunk_pairs} pairs")
+
+    for moving_average_type in ['simple', 'exponential']:
+        # compile
+        cpu_backend.simulate(timeseries[:MAX_WINDOW_SIZE + 2 * STEP], windows, params[:1], moving_average_type)
+        start = time.perf_counter()
+        expected[moving_average_type] = cpu_backend.simulate(timeseries, windows, params, moving_average_type)
+        whole_time = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            result = Checkpoint(cpu_backend.simulate, directory, args.chunk_pairs)(timeseries, windows, params, moving_average_type)
+            chunked_time = time.perf_counter() - start
+        same = np.array_equal(result, expected[moving_average_type])
+        ok = ok and same
+        print(f"{moving_average_type}: one piece {whole_time:.2f} s, chunks {chunked_time:.2f} s, same: {same}\n")
+
+    chunks = (params.shape[0] + args.chunk_pairs - 1) // args.chunk_pairs
+    with tempfile.TemporaryDirectory() as directory:
+        calls = []
+        try:
+            Checkpoint(dying(cpu_backend.simulate, args.die, calls), directory, args.chunk_pairs)(timeseries, windows, params, 'simple')
+        except Died:
+            print(f"died after {len(calls)} chunks")
+        calls = []
+        checkpoint = Checkpoint(dying(cpu_backend.simulate, -1, calls), directory, args.chunk_pairs)
+        result = checkpoint(timeseries, windows, params, 'simple')
+        resumed = np.array_equal(result, expected['simple']) and len(calls) == chunks - args.die
+        ok = ok and resumed
+        print(f"restarted run simulated {len(calls)} of {chunks} chunks, same: {resumed}\n")
+        checkpoint.clear()
+
+    halving, halving_result, _ = successive_halving(cpu_backend.simulate, timeseries, windows, params, 'simple')
+    with tempfile.TemporaryDirectory() as directory:
+        calls = []
+        try:
+            successive_halving(Checkpoint(dying(cpu_backend.simulate, args.die + 2, calls), directory, args.chunk_pairs), timeseries, windows, params, 'simple')
+        except Died:
+            print(f"halving died after {len(calls)} chunks")
+        calls = []
+        found, result, _ = successive_halving(Checkpoint(dying(cpu_backend.simulate, -1, calls), directory, args.chunk_pairs), timeseries, windows, params, 'simple')
+        resumed = np.array_equal(found, halving) and np.array_equal(result, halving_result)
+        ok = ok and resumed
+        print(f"restarted halving simulated {len(calls)} chunks, same: {resumed}")
+
+    print(f"\ncheckpointed as one piece, resumed runs as whole ones: {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Results store against the per-row calculations of cross.ipynb.
+
+The CPU backend simulates a grid of windows on a synthetic history (see
+check_search.py). Metrics of the artifact are compared with the metrics
+of the notebook calculated row by row in Python, rows read back by
+load_rows with the result matrix. Prints the time and size of writing the
+artifact against the documents write_results_to_db built before, one dict
+with a list of the result per pair, and the time of loading metrics only.
+
+Usage: python check_results_store.py [--days 730] [--long 40] [--seed 3]
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import statistics
+import numpy as np
+
+from constants import *
+import cpu_backend
+from search import pairs
+from tiling import written_columns
+from check_search import trending_candles
+from results_store import MONTH_DAYS, write_results, load_metrics, load_rows
+
+
+def reference(x):
+    """
+    Metrics of one row as the notebook calculated them, drawdown and
+    Sharpe ratio in the same loop style
+    """
+    change = [(x[i] - x[i - MONTH_DAYS]) / x[i - MONTH_DAYS] for i in range(MONTH_DAYS, len(x), MONTH_DAYS)]
+    peak = x[0]
+    drawdown = 0.0
+    for value in x:
+        peak = max(peak, value)
+        drawdown = max(drawdown, 1.0 - value / peak)
+    daily = [x[i] / x[i - 1] - 1.0 for i in range(1, len(x))]
+    return {
+        "total": (x[-1] - x[0]) / x[0],
+        "min": min(change),
+        "max": max(change),
+        "average": statistics.mean(change),
+        "std": statistics.stdev(change),
+        "max_drawdown": drawdown,
+        "sharpe": statistics.mean(daily) / statistics.stdev(daily) * 365 ** 0.5
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--long', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    timeseries = trending_candles(MAX_WINDOW_SIZE + args.days * 24 * 60, args.seed)
+    windows = np.unique(np.concatenate((
+        [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+        np.linspace(STEP, MAX_WINDOW_SIZE, args.long, endpoint=True)
+        )).astype(np.int64))
+    params = pairs(windows)
+    columns = written_columns(timeseries.shape[0])
+    result = cpu_backend.simulate(timeseries, windows, params, 'simple')[:, :columns]
+    windows_out = np.array([[windows[i[0]], windows[i[1]]] for i in params], dtype=np.float64)
+    timestamps = timeseries[MAX_WINDOW_SIZE::STEP, OHLCV_TIMESTAMP][:columns]
+
+    start = time.perf_counter()
+    documents = [{
+        "window_1": windows_out[i, 0],
+        "window_2": windows_out[i, 1],
+        "result": list(result[i,:])
+        } for i in range(result.shape[0])]
+    documents_size = len(pickle.dumps(documents))
+    documents_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.npz")
+        start = time.perf_counter()
+        values = write_results(path, windows_out, result, timestamps)
+        write_time = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        loaded = load_metrics(path, ["total"])
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [reference(row) for row in result]
+        reference_time = time.perf_counter() - start
+
+        rows = np.array([0, result.shape[0] // 2, result.shape[0] - 1])
+        ok = np.array_equal(load_rows(path, rows), result[rows]) and\
+            np.array_equal(loaded["total"], values["total"])
+
+    print(f"{result.shape[0]} pairs, {columns} columns")
+    print(f"{'metric':<14} {'max error':>10}")
+    for name in values:
+        error = np.max(np.abs(values[name] - np.array([row[name] for row in expected])))
+        print(f"{name:<14} {error:>10.2e}")
+        ok = ok and error < 1e-9
+    print(
+        f"\nartifact: {write_time:.2f} s with metrics, {size / 1e6:.1f} MB; "
+        f"documents: {documents_time:.2f} s, {documents_size / 1e6:.1f} MB pickled, metrics per row {reference_time:.2f} s"
+        )
+    print(f"metrics loaded without results: {load_time * 1000:.1f} ms")
+    print(f"rows read back, metrics as the notebook: {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Successive halving and TPE search against the exhaustive run.
+
+The CPU backend simulates a grid of windows on a synthetic history with
+trends: a random walk whose drift changes sign at random, so that
+crossing windows have something to find. The exhaustive run gives the
+top k pairs by total return. Every search reports the pairs it
+simulated, parameter-candles and time against the exhaustive run and
+how many of the exhaustive top k are in its own top k. TPE runs if
+optuna is installed.
+
+Usage: python check_search.py [--days 730] [--long 40] [--top-k 10]
+    [--trials 600] [--seed 3]
+"""
+import time
+import argparse
+import numpy as np
+
+from constants import *
+import cpu_backend
+from search import pairs, score, top, exhaustive, successive_halving, tpe
+
+
+def trending_candles(count, seed):
+    """
+    timestamp, open, high, low, close, volume rows of a random walk with
+    drift changing sign every 3 days on average
+    """
+    rng = np.random.default_rng(seed)
+    switches = rng.random(count) < 1.0 / (3 * 24 * 60)
+    drift = 0.004 * np.where(np.cumsum(switches) % 2 == 0, 1.0, -1.0)
+    closes = 30000.0 * np.exp(np.cumsum(rng.normal(drift, 1.0, count) * 0.0005))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    return np.stack(
+        (np.arange(count, dtype=np.float64) * 60000, opens, np.maximum(opens, closes), np.minimum(opens, closes), closes, np.ones(count)),
+        axis=1
+        )
+
+
+def run(name, method, args, timeseries, windows, params, **kwargs):
+    start = time.perf_counter()
+    found, result, evaluated = method(cpu_backend.simulate, timeseries, windows, params, 'simple', **kwargs)
+    elapsed = time.perf_counter() - start
+    return name, found[top(score(result, timeseries.shape[0]), args.top_k)], found.shape[0], evaluated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--long', type=int, default=40)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--trials', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    timeseries = trending_candles(MAX_WINDOW_SIZE + args.days * 24 * 60, args.seed)
+    windows = np.unique(np.concatenate((
+        [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+        np.linspace(STEP, MAX_WINDOW_SIZE, args.long, endpoint=True)
+        )).astype(np.int64))
+    params = pairs(windows)
+    # compile
+    cpu_backend.simulate(timeseries[:MAX_WINDOW_SIZE + 2 * STEP], windows, params[:1], 'simple')
+
+    runs = [run('exhaustive', exhaustive, args, timeseries, windows, params)]
+    for keep, first_steps in [(1.0 / 3.0, 90), (0.5, 30), (0.5, 90)]:
+        runs.append(run(
+            f"halving {keep:.2f}, {first_steps}",
+            successive_halving,
+            args,
+            timeseries,
+            windows,
+            params,
+            keep=keep,
+            first_steps=first_steps,
+            top_k=args.top_k
+            ))
+    try:
+        import optuna
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        runs.append(run(f"tpe {args.trials}", tpe, args, timeseries, windows, params, trials=args.trials, batch=64, seed=args.seed))
+    except ImportError:
+        print("optuna is not installed, tpe skipped")
+
+    expected = set(map(tuple, runs[0][1]))
+    print(f"{params.shape[0]} pairs of {windows.shape[0]} windows, {args.days} days, top {args.top_k}")
+    print(f"{'search':<20} {'pairs':>7} {'param-candles':>14} {'time, s':>8} {'speedup':>8} {'top k found':>12}")
+    for name, found, count, evaluated, elapsed in runs:
+        print(
+            f"{name:<20} {count:>7} {evaluated:>14.3e} {elapsed:>8.2f} "
+            f"{runs[0][4] / elapsed:>8.2f} {len(expected & set(map(tuple, found))):>9}/{args.top_k}"
+            )
+
+
+if __name__ == '__main__':
+    main()
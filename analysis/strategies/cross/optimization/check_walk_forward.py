@@ -0,0 +1,93 @@
+"""
+Walk-forward harness on a synthetic history.
+
+Folds of a trending random walk (see check_search.py) run once in this
+process and once in a pool of processes mapping the shared candles:
+chosen windows and test equity must be the same. Then candles after the
+test part of the first fold are replaced by another walk: its result
+must not change, a fold does not look ahead. Prints every fold, the
+stitched out-of-sample return against the in-sample return of the
+windows optimized on the whole history, and times.
+
+Usage: python check_walk_forward.py [--days 1095] [--long 20]
+    [--train 365] [--test 90] [--processes 2] [--seed 3]
+"""
+import sys
+import time
+import argparse
+import numpy as np
+
+from constants import *
+import cpu_backend
+from search import pairs, score, top
+from check_search import trending_candles
+from walk_forward import folds, walk_forward
+
+
+def same(a, b):
+    return all(
+        x["window_1"] == y["window_1"] and x["window_2"] == y["window_2"] and\
+            np.array_equal(x["test_equity"], y["test_equity"])
+        for x, y in zip(a, b)
+        ) and len(a) == len(b)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=1095)
+    parser.add_argument('--long', type=int, default=20)
+    parser.add_argument('--train', type=int, default=365)
+    parser.add_argument('--test', type=int, default=90)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    timeseries = trending_candles(MAX_WINDOW_SIZE + args.days * 24 * 60, args.seed)
+    windows = np.unique(np.concatenate((
+        [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+        np.linspace(STEP, MAX_WINDOW_SIZE, args.long, endpoint=True)
+        )).astype(np.int64))
+    options = {
+        "search_config": {"method": "exhaustive"},
+        "train_steps": args.train,
+        "test_steps": args.test
+        }
+
+    start = time.perf_counter()
+    serial, timestamps, equity = walk_forward(timeseries, windows, 'simple', processes=1, **options)
+    serial_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pooled, pooled_timestamps, pooled_equity = walk_forward(timeseries, windows, 'simple', processes=args.processes, **options)
+    pooled_time = time.perf_counter() - start
+
+    # another future after the first test part
+    fold = folds(timeseries.shape[0], args.train, args.test)[0]
+    changed = timeseries.copy()
+    changed[fold[2] + 2:] = trending_candles(timeseries.shape[0], args.seed + 1)[fold[2] + 2:]
+    first, _, _ = walk_forward(changed[:fold[2] + 2 + STEP * 2], windows, 'simple', processes=1, **options)
+
+    params = pairs(windows)
+    result = cpu_backend.simulate(timeseries, windows, params, 'simple')
+    in_sample = score(result, timeseries.shape[0])
+    best = top(in_sample, 1)[0]
+
+    print(f"{len(serial)} folds, train {args.train} days, test {args.test} days, {params.shape[0]} pairs")
+    print(f"{'test from':>10} {'windows':>14} {'train':>8} {'test':>8}")
+    for res in serial:
+        print(
+            f"{(res['test_start'] - MAX_WINDOW_SIZE) // STEP:>10} {res['window_1']:>6} {res['window_2']:>7} "
+            f"{res['train_return']:>8.3f} {res['test_equity'][-1] / res['test_equity'][0] - 1.0:>8.3f}"
+            )
+    print(f"\nout-of-sample return, stitched: {equity[-1] - 1.0:.3f} over {(timestamps[-1] - timestamps[0]) / 86400000:.0f} days")
+    print(
+        f"in-sample best on the whole history: {windows[params[best, 0]]} {windows[params[best, 1]]}, "
+        f"{in_sample[best] - 1.0:.3f} over {args.days} days"
+        )
+    ok = same(serial, pooled) and np.array_equal(equity, pooled_equity) and same(first[:1], serial[:1])
+    print(f"\n1 process {serial_time:.1f} s, {args.processes} processes {pooled_time:.1f} s")
+    print(f"pool same as 1 process, no look ahead: {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
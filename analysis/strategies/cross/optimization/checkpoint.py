@@ -0,0 +1,104 @@
+"""
+Checkpoints of optimizer runs
+
+Checkpoint wraps simulate of a backend: pairs of windows are simulated in
+chunks and the result of every chunk is saved to a file as soon as it is
+done. A file is named by a hash of everything its result depends on:
+candles, windows, pairs of the chunk, moving average type and simulation
+constants. A restarted run with the same config finds the files of chunks
+already done and simulates only the others. Searches call simulate with
+the same pairs when they run again, so halving rounds and TPE batches
+with a seed are resumed too.
+
+A chunk is simulated with the windows its pairs use only: the grid is
+ordered by short window, so a chunk has a few short windows and moving
+averages of the others are not calculated again for every chunk.
+
+Progress of every call and its ETA are printed after every chunk.
+"""
+import os
+import time
+import hashlib
+import numpy as np
+from constants import *
+
+
+class Checkpoint:
+
+    def __init__(self, simulate, directory, chunk_pairs=4096):
+        """
+        :param simulate: simulate of a backend
+        :param directory: directory of chunk files
+        :param chunk_pairs: pairs of windows of a chunk
+        """
+        self.simulate = simulate
+        self.directory = directory
+        self.chunk_pairs = chunk_pairs
+        self.files = []
+        os.makedirs(directory, exist_ok=True)
+
+    def chunk_path(self, history, windows, params, moving_average_type):
+        """
+        File of the result of params, history is a hash of the candles
+        """
+        key = history.copy()
+        key.update(np.ascontiguousarray(windows, dtype=np.int64).tobytes())
+        key.update(np.ascontiguousarray(params, dtype=np.int64).tobytes())
+        key.update(repr((moving_average_type, MAX_WINDOW_SIZE, STEP, MOD_N, FEE)).encode())
+        return os.path.join(self.directory, key.hexdigest() + ".npy")
+
+    def __call__(self, timeseries, windows, params, moving_average_type, max_memory=None):
+        """
+        simulate of the backend, chunk by chunk
+        """
+        timeseries = np.ascontiguousarray(timeseries, dtype=np.float64)
+        history = hashlib.sha1(timeseries.tobytes())
+        chunks = range(0, params.shape[0], self.chunk_pairs)
+        result = None
+        done = 0
+        simulated = 0
+        start = time.perf_counter()
+        for i, first in enumerate(chunks):
+            chunk = params[first:first + self.chunk_pairs]
+            path = self.chunk_path(history, windows, chunk, moving_average_type)
+            self.files.append(path)
+            if os.path.exists(path):
+                chunk_result = np.load(path)
+            else:
+                # moving averages of windows the chunk does not use are
+                # not calculated
+                used = np.unique(chunk)
+                chunk_result = self.simulate(timeseries, windows[used], np.searchsorted(used, chunk), moving_average_type, max_memory)
+                # a chunk file is there only once it is complete
+                with open(path + ".tmp", 'wb') as chunk_file:
+                    np.save(chunk_file, chunk_result)
+                os.replace(path + ".tmp", path)
+                simulated += chunk.shape[0]
+            if result is None:
+                result = np.zeros((params.shape[0], chunk_result.shape[1]), dtype=np.float64)
+            result[first:first + chunk.shape[0]] = chunk_result
+            done += chunk.shape[0]
+            self.report(i + 1, len(chunks), done, params.shape[0], simulated, timeseries.shape[0], time.perf_counter() - start)
+        if result is None:
+            return self.simulate(timeseries, windows, params, moving_average_type, max_memory)
+        return result
+
+    def report(self, chunk, chunks, done, pairs, simulated, candles, elapsed):
+        """
+        Print progress of a call, ETA from the pairs simulated by this process
+        """
+        message = "chunk " + str(chunk) + "/" + str(chunks) + ", " + str(done) + "/" + str(pairs) + " pairs"
+        if simulated > 0:
+            rate = simulated / elapsed
+            message += ", " + "{:.3e}".format(rate * (candles - MAX_WINDOW_SIZE)) + " parameter-candles/s" +\
+                ", ETA " + str(int(round((pairs - done) / rate))) + " s"
+        print(message, flush=True)
+
+    def clear(self):
+        """
+        Remove chunk files of this run once its results are written
+        """
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.files = []
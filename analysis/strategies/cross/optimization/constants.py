@@ -0,0 +1,44 @@
+import os
+import json
+
+OHLCV_TIMESTAMP = 0
+OHLCV_OPEN = 1
+OHLCV_HIGH = 2
+OHLCV_LOW = 3
+OHLCV_CLOSE = 4
+OHLCV_VOLUME = 5
+
+# simulation constants, kernels are compiled with them, config.json
+# overrides them before any backend is imported
+MAX_WINDOW_SIZE = 200 * 24 * 60
+STEP = 24 * 60
+# candles of the crossing filter
+MOD_N = 3
+FEE = 0.002
+
+
+def load_simulation_config(path='config.json'):
+    """
+    max_window_size, step, mod_n and fee of the config file, defaults
+    above for missing ones or without the file
+    """
+    if not(os.path.exists(path)):
+        return MAX_WINDOW_SIZE, STEP, MOD_N, FEE
+    with open(path) as json_file:
+        json_data = json.load(json_file)
+        max_window_size = int(json_data.get("max_window_size") or MAX_WINDOW_SIZE) # candles, history before the first step
+        step = int(json_data.get("step") or STEP) # candles between result columns
+        mod_n = int(json_data.get("mod_n") or MOD_N) # candles a crossing has to last
+        fee = float(json_data.get("fee", FEE)) # fraction of every operation
+
+        # the simulation saves a result once per STEP candles only if the
+        # crossing filter is shorter
+        if step <= mod_n or mod_n < 1 or max_window_size < step:
+            raise ValueError(
+                "Invalid simulation constants: step " + str(step) + " must be greater than mod_n " +\
+                str(mod_n) + " >= 1 and at most max_window_size " + str(max_window_size)
+                )
+        return max_window_size, step, mod_n, fee
+
+
+MAX_WINDOW_SIZE, STEP, MOD_N, FEE = load_simulation_config()
@@ -0,0 +1,354 @@
+import numpy as np
+from numba import njit, prange
+from constants import *
+from prefix_sums import compensated_prefix_sums, RESYNC_INTERVAL
+from tiling import *
+
+
+@njit(parallel=True)
+def moving_average_2d(prefix, compensation, window_size, out):
+    """
+    Moving averages as moving_average_kernel_2d calculates them, from
+    compensated prefix sums of closes: for x < window the average of
+    closes 1..x, row 0 is left as is. O(1) per cell.
+
+    :param prefix: prefix sums of closes, see compensated_prefix_sums
+    :param compensation: compensations of prefix sums
+    :param window_size: window sizes
+    :param out: result, rows of ohlcv, column per window
+    """
+    for x in prange(1, out.shape[0]):
+        for y in range(window_size.shape[0]):
+            n = min(window_size[y], x)
+            out[x, y] = ((prefix[x + 1] - prefix[x + 1 - n]) +\
+                (compensation[x + 1] - compensation[x + 1 - n])) / n
+
+
+@njit
+def exponential_moving_average_at(ohlcv, x, n):
+    """
+    exponential_moving_average_kernel at row x for n = min(window, x)
+    """
+    k = 2.0 / (n + 1.0)
+    res = ohlcv[x - n, OHLCV_CLOSE]
+    for i in range(1 - n, 1):
+        res = ohlcv[x + i, OHLCV_CLOSE] * k + res * (1.0 - k)
+    return res
+
+
+@njit(parallel=True)
+def exponential_moving_average_2d(ohlcv, window_size, out, out_first, first, count, scan, since_resync):
+    """
+    Exponential moving averages as exponential_moving_average_kernel
+    calculates them, rows first..first + count - 1 to rows out_first.. of out.
+
+    The average at x is seeded with close[x - w] and takes w steps, so
+    for x >= w it is a^w * close[x - w] + k * S[x] with a = 1 - k and
+    S[x] = sum of a^j * close[x - j], j < w, updated in O(1):
+    S[x] = close[x] + a * S[x - 1] - a^w * close[x - w]. S is recomputed
+    every RESYNC_INTERVAL rows. Rows x < w are calculated directly.
+    S and rows since resync are carried in scan and since_resync from
+    call to call, first has to be the row after the last one calculated;
+    since_resync of RESYNC_INTERVAL starts a new scan.
+
+    :param ohlcv: array of timestamp, Open, High, Low, Close, Volume
+    :param window_size: window sizes
+    :param out: result, column per window
+    :param out_first: row of out for row first
+    :param first: first row to calculate
+    :param count: rows to calculate
+    :param scan: S of every window
+    :param since_resync: rows since S was recomputed, of every window
+    """
+    for y in prange(window_size.shape[0]):
+        w = window_size[y]
+        k = 2.0 / (w + 1.0)
+        a = 1.0 - k
+        a_w = a ** w
+        s = scan[y]
+        rows = since_resync[y]
+        for j in range(count):
+            x = first + j
+            if x < w:
+                if x > 0:
+                    out[out_first + j, y] = exponential_moving_average_at(ohlcv, x, x)
+                continue
+            if rows >= RESYNC_INTERVAL:
+                s = 0.0
+                for i in range(1 - w, 1):
+                    s = ohlcv[x + i, OHLCV_CLOSE] + s * a
+                rows = 0
+            else:
+                s = ohlcv[x, OHLCV_CLOSE] + s * a - a_w * ohlcv[x - w, OHLCV_CLOSE]
+            rows += 1
+            out[out_first + j, y] = a_w * ohlcv[x - w, OHLCV_CLOSE] + k * s
+        scan[y] = s
+        since_resync[y] = rows
+
+
+@njit
+def moving_average_at(prefix, compensation, window_size, ma, ma_first, x, y):
+    """
+    Moving average of window y at row x: from prefix sums if ma has no
+    columns, row x - ma_first of ma otherwise
+    """
+    if ma.shape[1] == 0:
+        n = min(window_size[y], x)
+        return ((prefix[x + 1] - prefix[x + 1 - n]) +\
+            (compensation[x + 1] - compensation[x + 1 - n])) / n
+    return ma[x - ma_first, y]
+
+
+# rows of candles a pair of windows is simulated on at a time
+EVENT_BLOCK = 4096
+
+
+@njit
+def difference_sign(prefix, compensation, window_size, ma, ma_first, x, window_short, window_long):
+    """
+    Sign of the short minus the long moving average at row x
+    """
+    temp_1 = moving_average_at(prefix, compensation, window_size, ma, ma_first, x, window_short) -\
+        moving_average_at(prefix, compensation, window_size, ma, ma_first, x, window_long)
+    if temp_1 > 0:
+        return 1
+    elif temp_1 < 0:
+        return -1
+    return 0
+
+
+@njit
+def difference_signs(prefix, compensation, window_size, ma, ma_first, first, count, window_short, window_long, signs):
+    """
+    difference_sign of rows first..first + count - 1 to signs, moving
+    averages as moving_average_at calculates them. The source of averages
+    and window sizes are looked up once, the loop over rows is branch free.
+    """
+    if ma.shape[1] == 0:
+        size_short = window_size[window_short]
+        size_long = window_size[window_long]
+        for j in range(count):
+            x = first + j
+            n_short = min(size_short, x)
+            n_long = min(size_long, x)
+            temp_1 = ((prefix[x + 1] - prefix[x + 1 - n_short]) +\
+                (compensation[x + 1] - compensation[x + 1 - n_short])) / n_short -\
+                ((prefix[x + 1] - prefix[x + 1 - n_long]) +\
+                (compensation[x + 1] - compensation[x + 1 - n_long])) / n_long
+            signs[j] = (temp_1 > 0) - (temp_1 < 0)
+    else:
+        for j in range(count):
+            temp_1 = ma[first + j - ma_first, window_short] - ma[first + j - ma_first, window_long]
+            signs[j] = (temp_1 > 0) - (temp_1 < 0)
+
+
+@njit(parallel=True)
+def cross_sim(
+    ohlcv,
+    prefix,
+    compensation,
+    window_size,
+    ma,
+    ma_first,
+    algo_params,
+    t_start,
+    t_end,
+    balances,
+    crosses,
+    result,
+    result_first
+):
+    """
+    cross_sim kernel on candles t_start..t_end - 1, a pair of windows per
+    iteration. The tile starting on the first step initializes balances
+    and crosses, the next tiles go on from them. Results are saved every
+    STEP candles from MAX_WINDOW_SIZE, as the kernel saves them for
+    STEP > MOD_N, column c to column c - result_first of result.
+
+    Candles are taken EVENT_BLOCK at a time. Signs of the moving average
+    difference of the block are calculated once per row into an int8
+    array, the filtered cross of a candle is a rolling sum of MOD_N of
+    them. Balances change only where the filtered cross changes sign, so
+    the candles where it does are collected as events and the simulation
+    goes from event to event; results of STEP candles between events are
+    gathered from the balances of the last one. Operations and results are
+    those of the loop over every candle.
+
+    :param prefix: prefix sums of closes for simple moving averages
+    :param compensation: compensations of prefix sums
+    :param window_size: window sizes
+    :param ma: moving averages of rows ma_first.., no columns for simple
+        moving averages from prefix sums
+    :param balances: btc and usdt balance of every pair of windows
+    :param crosses: filtered cross of the last candle of every pair of windows
+    """
+    for pos in prange(algo_params.shape[0]):
+        base_t = MAX_WINDOW_SIZE
+        mod_n = MOD_N
+
+        window_short = algo_params[pos, 0]
+        window_long = algo_params[pos, 1]
+
+        if t_start == base_t + mod_n + 1:
+            balances[pos, 0] = 1.0
+            balances[pos, 1] = 0.0
+            result[pos, 0 - result_first] = balances[pos, 0] * ohlcv[base_t, OHLCV_CLOSE] + balances[pos, 1]
+
+            prev_cross_temp = 0
+            for i in range(0, mod_n):
+                prev_cross_temp += difference_sign(prefix, compensation, window_size, ma, ma_first, base_t - i, window_short, window_long)
+            crosses[pos] = prev_cross_temp
+
+        balance_btc = balances[pos, 0]
+        balance_usdt = balances[pos, 1]
+        prev_cross_temp = crosses[pos]
+
+        # signs of rows block_start - mod_n + 1..block_end - 1, events as
+        # candles from block_start and the sign of the cross after them
+        signs = np.empty(EVENT_BLOCK + mod_n - 1, dtype=np.int8)
+        events = np.empty(EVENT_BLOCK, dtype=np.int64)
+        directions = np.empty(EVENT_BLOCK, dtype=np.int8)
+
+        for block_start in range(t_start, t_end, EVENT_BLOCK):
+            block_end = min(block_start + EVENT_BLOCK, t_end)
+            count = block_end - block_start
+            difference_signs(
+                prefix,
+                compensation,
+                window_size,
+                ma,
+                ma_first,
+                block_start - mod_n + 1,
+                count + mod_n - 1,
+                window_short,
+                window_long,
+                signs
+                )
+
+            # crossing events, the filtered cross changes sign
+            event_count = 0
+            cross_temp = 0
+            for j in range(mod_n - 1):
+                cross_temp += signs[j]
+            for j in range(count):
+                cross_temp += signs[j + mod_n - 1]
+                if prev_cross_temp * cross_temp < 0:
+                    events[event_count] = j
+                    directions[event_count] = 1 if cross_temp > 0 else -1
+                    event_count += 1
+                prev_cross_temp = cross_temp
+                cross_temp -= signs[j]
+
+            # from event to event, results of the candles to save between them
+            e = 0
+            t_save = base_t + (block_start - base_t + STEP - 1) // STEP * STEP
+            while True:
+                t_next = block_end
+                if e < event_count:
+                    t_next = block_start + events[e]
+                while t_save < block_end and t_save < t_next:
+                    result[pos, (t_save - base_t) // STEP - result_first] = balance_btc * ohlcv[t_save, OHLCV_CLOSE] + balance_usdt
+                    t_save += STEP
+                if e == event_count:
+                    break
+
+                if (directions[e] < 0) and (balance_btc > 0.0):
+                    # sell
+                    balance_usdt = balance_btc * ohlcv[t_next + 1, OHLCV_OPEN] * (1.0 - FEE)
+                    balance_btc = 0.0
+
+                if (directions[e] > 0) and (balance_usdt > 0.0):
+                    # buy
+                    balance_btc = balance_usdt / ohlcv[t_next + 1, OHLCV_OPEN] * (1.0 - FEE)
+                    balance_usdt = 0.0
+                e += 1
+
+        balances[pos, 0] = balance_btc
+        balances[pos, 1] = balance_usdt
+        crosses[pos] = prev_cross_temp
+
+
+def moving_averages(timeseries, windows, moving_average_type):
+    """
+    Matrix of moving averages of every window, rows cross_sim reads are
+    calculated
+    """
+    out = np.zeros((timeseries.shape[0], windows.shape[0]), dtype=np.float64)
+    if moving_average_type == 'simple':
+        prefix, compensation = compensated_prefix_sums(timeseries)
+        moving_average_2d(prefix, compensation, windows, out)
+    else:
+        first = first_moving_average_row()
+        exponential_moving_average_2d(
+            timeseries,
+            windows,
+            out,
+            first,
+            first,
+            timeseries.shape[0] - first,
+            np.zeros(windows.shape[0]),
+            np.full(windows.shape[0], RESYNC_INTERVAL, dtype=np.int64)
+            )
+    return out
+
+
+def simulate(timeseries, windows, params, moving_average_type, max_memory=None):
+    """
+    Balances of cross_sim for every pair of windows, every STEP candles
+
+    Simple moving averages are calculated from prefix sums where cross_sim
+    reads them, exponential ones a tile of candles at a time. Tiles are as
+    long as working memory within max_memory allows, the result is not
+    counted.
+
+    :param timeseries: array of timestamp, open, high, low, close, volume rows
+    :param windows: window sizes
+    :param params: pairs of indices in windows, short and long
+    :param moving_average_type: simple or exponential
+    :param max_memory: MB, no limit if None
+    """
+    timeseries = np.ascontiguousarray(timeseries, dtype=np.float64)
+    windows = np.ascontiguousarray(windows, dtype=np.int64)
+    params = np.ascontiguousarray(params, dtype=np.int64)
+    candles = timeseries.shape[0]
+    rows = tile_rows(candles, windows.shape[0], params.shape[0], moving_average_type, max_memory)
+
+    result = np.zeros((params.shape[0], result_columns(candles)), dtype=np.float64)
+    balances = np.zeros((params.shape[0], 2), dtype=np.float64)
+    crosses = np.zeros(params.shape[0], dtype=np.int64)
+    if moving_average_type == 'simple':
+        prefix, compensation = compensated_prefix_sums(timeseries)
+        ma = np.zeros((0, 0), dtype=np.float64)
+    else:
+        prefix = compensation = np.zeros(0, dtype=np.float64)
+        ma = np.zeros((rows + 2 * MOD_N, windows.shape[0]), dtype=np.float64)
+        scan = np.zeros(windows.shape[0], dtype=np.float64)
+        since_resync = np.full(windows.shape[0], RESYNC_INTERVAL, dtype=np.int64)
+    # moving averages are calculated up to row computed, rows
+    # computed_first..computed - 1 are in ma
+    computed = computed_first = first_moving_average_row()
+
+    for t_start, t_end, ma_first in tiles(candles, rows):
+        if moving_average_type != 'simple':
+            # rows of the last tile this one reads go to the front
+            keep = computed - ma_first
+            ma[:keep] = ma[computed - computed_first - keep:computed - computed_first].copy()
+            exponential_moving_average_2d(timeseries, windows, ma, keep, computed, t_end - computed, scan, since_resync)
+            computed_first = ma_first
+            computed = t_end
+        cross_sim(
+            timeseries,
+            prefix,
+            compensation,
+            windows,
+            ma,
+            ma_first,
+            params,
+            t_start,
+            t_end,
+            balances,
+            crosses,
+            result,
+            0
+            )
+    return result
@@ -0,0 +1,366 @@
+import math
+import numpy as np
+from numba import cuda, int8
+from constants import *
+from prefix_sums import compensated_prefix_sums, RESYNC_INTERVAL
+from tiling import *
+
+
+def cuda_blocks_per_grid(length, threads_per_block):
+    return math.ceil(length / threads_per_block)
+
+
+def cuda_blocks_per_grid_2d(shape, threads_per_block_2d):
+    return (int(math.ceil(shape[0] / threads_per_block_2d[0])),
+            int(math.ceil(shape[1] / threads_per_block_2d[1])))
+
+
+@cuda.jit('void(float64[:], float64[:], int64[:], float64[:,:])')
+def moving_average_kernel_2d(prefix, compensation, window_size, out):
+    """
+    Calculate the moving average for the given data.
+    https://en.wikipedia.org/wiki/Moving_average
+
+    A difference of compensated prefix sums of closes, O(1) per cell; for
+    x < window the average of closes 1..x, row 0 is not written.
+
+    :param prefix: link to GPU memory with prefix sums of closes, see compensated_prefix_sums
+    :param compensation: link to GPU memory with compensations of prefix sums
+    :param window_size: window size
+    :param out: link to GPU memory for result
+    """
+    thread_x, thread_y = cuda.grid(2)
+
+    if (thread_x < out.shape[0]) and (thread_y < window_size.shape[0]):
+        n = min(window_size[thread_y], thread_x)
+        if n > 0:
+            res = (prefix[thread_x + 1] - prefix[thread_x + 1 - n]) +\
+                (compensation[thread_x + 1] - compensation[thread_x + 1 - n])
+            out[thread_x, thread_y] = res / n
+
+
+@cuda.jit('void(float64[:,:], int64[:], float64[:,:], int64, int64, int64, float64[:], int64[:])')
+def exponential_moving_average_kernel(ohlcv, window_size, out, out_first, first, count, scan, since_resync):
+    """
+    Calculate the exponential moving average for the given data.
+    https://en.wikipedia.org/wiki/Moving_average
+
+    A thread per window scans rows first..first + count - 1 to rows
+    out_first.. of out. The average at x is seeded with close[x - n],
+    n = min(window, x), and takes n steps, so for x >= w it is
+    a^w * close[x - w] + k * S[x] with a = 1 - k and S[x] = sum of
+    a^j * close[x - j], j < w, scanned as
+    S[x] = close[x] + a * S[x - 1] - a^w * close[x - w]. S is recomputed
+    every RESYNC_INTERVAL rows. Rows x < w are calculated directly.
+    S and rows since resync are carried in scan and since_resync from
+    launch to launch, first has to be the row after the last one
+    calculated; since_resync of RESYNC_INTERVAL starts a new scan.
+
+    :param ohlcv: link to GPU memory with array of timestamp, Open, High, Low, Close, Volume
+    :param window_size: window size
+    :param out: link to GPU memory for result
+    :param out_first: row of out for row first
+    :param first: first row to calculate
+    :param count: rows to calculate
+    :param scan: link to GPU memory with S of every window
+    :param since_resync: link to GPU memory with rows since S was recomputed
+    """
+    thread_y = cuda.grid(1)
+
+    if thread_y < window_size.shape[0]:
+        w = window_size[thread_y]
+        k = 2.0 / (w + 1.0)
+        a = 1.0 - k
+        a_w = a ** w
+        s = scan[thread_y]
+        rows = since_resync[thread_y]
+        for j in range(count):
+            x = first + j
+            if x < w:
+                if x > 0:
+                    k_x = 2.0 / (x + 1.0)
+                    res = ohlcv[0, OHLCV_CLOSE]
+                    for i in range(1 - x, 1):
+                        res = ohlcv[x + i, OHLCV_CLOSE] * k_x + res * (1.0 - k_x)
+                    out[out_first + j, thread_y] = res
+                continue
+            if rows >= RESYNC_INTERVAL:
+                s = 0.0
+                for i in range(1 - w, 1):
+                    s = ohlcv[x + i, OHLCV_CLOSE] + s * a
+                rows = 0
+            else:
+                s = ohlcv[x, OHLCV_CLOSE] + s * a - a_w * ohlcv[x - w, OHLCV_CLOSE]
+            rows += 1
+            out[out_first + j, thread_y] = a_w * ohlcv[x - w, OHLCV_CLOSE] + k * s
+        scan[thread_y] = s
+        since_resync[thread_y] = rows
+
+
+@cuda.jit(device=True)
+def moving_average_at(prefix, compensation, window_size, ma, ma_first, x, y):
+    """
+    Moving average of window y at row x: from prefix sums if ma has no
+    columns, row x - ma_first of ma otherwise
+    """
+    if ma.shape[1] == 0:
+        n = min(window_size[y], x)
+        return ((prefix[x + 1] - prefix[x + 1 - n]) +\
+            (compensation[x + 1] - compensation[x + 1 - n])) / n
+    return ma[x - ma_first, y]
+
+
+@cuda.jit(device=True)
+def difference_sign(prefix, compensation, window_size, ma, ma_first, x, window_short, window_long):
+    """
+    Sign of the short minus the long moving average at row x
+    """
+    temp_1 = moving_average_at(prefix, compensation, window_size, ma, ma_first, x, window_short) -\
+        moving_average_at(prefix, compensation, window_size, ma, ma_first, x, window_long)
+    if temp_1 > 0:
+        return 1
+    elif temp_1 < 0:
+        return -1
+    return 0
+
+
+@cuda.jit(
+    'void(float64[:,:], float64[:], float64[:], int64[:], float64[:,:], int64, int64[:,:], '
+    'int64, int64, float64[:,:], int64[:], float64[:,:], int64)'
+    )
+def cross_sim(
+    ohlcv,
+    prefix,
+    compensation,
+    window_size,
+    ma,
+    ma_first,
+    algo_params,
+    t_start,
+    t_end,
+    balances,
+    crosses,
+    result,
+    result_first
+):
+    """
+    Simulate the cross algorithm on candles t_start..t_end - 1, a thread per
+    pair of windows. The tile starting on the first step initializes
+    balances and crosses, the next tiles go on from them. Results are saved
+    every STEP candles from MAX_WINDOW_SIZE (STEP > MOD_N), column c to
+    column c - result_first of result.
+
+    The filtered cross of a candle is a rolling sum of signs of the moving
+    average difference of MOD_N rows, signs are kept in a ring of int8 and
+    the difference is calculated once per row.
+
+    :param prefix: link to GPU memory with prefix sums of closes for simple moving averages
+    :param compensation: link to GPU memory with compensations of prefix sums
+    :param window_size: window sizes
+    :param ma: moving averages of rows ma_first.., no columns for simple
+        moving averages from prefix sums
+    :param balances: btc and usdt balance of every pair of windows
+    :param crosses: filtered cross of the last candle of every pair of windows
+    """
+    # params initialization
+    pos = cuda.grid(1)
+    base_t = MAX_WINDOW_SIZE
+    mod_n = MOD_N
+
+    if pos < algo_params.shape[0]:
+        window_short = algo_params[pos, 0]
+        window_long = algo_params[pos, 1]
+
+        if t_start == base_t + mod_n + 1:
+            balances[pos, 0] = 1.0
+            balances[pos, 1] = 0.0
+            result[pos, 0 - result_first] = balances[pos, 0] * ohlcv[base_t, OHLCV_CLOSE] + balances[pos, 1]
+
+            prev_cross_temp = 0
+            for i in range(0, mod_n):
+                prev_cross_temp += difference_sign(prefix, compensation, window_size, ma, ma_first, base_t - i, window_short, window_long)
+            crosses[pos] = prev_cross_temp
+
+        balance_btc = balances[pos, 0]
+        balance_usdt = balances[pos, 1]
+        prev_cross_temp = crosses[pos]
+
+        # signs of rows t - mod_n + 1..t at index row % mod_n
+        signs = cuda.local.array(MOD_N, dtype=int8)
+        cross_temp = 0
+        for x in range(t_start - mod_n + 1, t_start):
+            signs[x % mod_n] = difference_sign(prefix, compensation, window_size, ma, ma_first, x, window_short, window_long)
+            cross_temp += signs[x % mod_n]
+
+        for t in range(t_start, t_end):
+            #algorithm logic
+            #filter
+            signs[t % mod_n] = difference_sign(prefix, compensation, window_size, ma, ma_first, t, window_short, window_long)
+            cross_temp += signs[t % mod_n]
+
+            if (prev_cross_temp > 0) and (cross_temp < 0) and (balance_btc > 0.0):
+                # sell
+                balance_usdt = balance_btc * ohlcv[t + 1, OHLCV_OPEN] * (1.0 - FEE)
+                balance_btc = 0.0
+
+            if (prev_cross_temp < 0) and (cross_temp > 0) and (balance_usdt > 0.0):
+                # buy
+                balance_btc = balance_usdt / ohlcv[t + 1, OHLCV_OPEN] * (1.0 - FEE)
+                balance_usdt = 0.0
+
+            prev_cross_temp = cross_temp
+            cross_temp -= signs[(t + 1) % mod_n]
+
+            # save results
+            if (t - base_t) % STEP == 0:
+                result[pos, (t - base_t) // STEP - result_first] = balance_btc * ohlcv[t, OHLCV_CLOSE] + balance_usdt
+
+        balances[pos, 0] = balance_btc
+        balances[pos, 1] = balance_usdt
+        crosses[pos] = prev_cross_temp
+
+
+def moving_averages(timeseries, ohlcv_gpu, windows_gpu, moving_average_type, out):
+    """
+    Matrix of moving averages of every window to out, rows cross_sim reads
+    are calculated. Prefix sums are a sequential scan and are calculated on
+    the host, where the candles are loaded.
+    """
+    if moving_average_type == 'simple':
+        prefix, compensation = compensated_prefix_sums(timeseries)
+        threads_per_block = (8, 8)
+        blocks_per_grid = cuda_blocks_per_grid_2d(out.shape, threads_per_block)
+        moving_average_kernel_2d[blocks_per_grid, threads_per_block](
+            cuda.to_device(prefix),
+            cuda.to_device(compensation),
+            windows_gpu,
+            out
+            )
+    else:
+        first = first_moving_average_row()
+        threads_per_block = 32
+        blocks_per_grid = cuda_blocks_per_grid(out.shape[1], threads_per_block)
+        exponential_moving_average_kernel[blocks_per_grid, threads_per_block](
+            ohlcv_gpu,
+            windows_gpu,
+            out,
+            first,
+            first,
+            timeseries.shape[0] - first,
+            cuda.to_device(np.zeros(out.shape[1])),
+            cuda.to_device(np.full(out.shape[1], RESYNC_INTERVAL, dtype=np.int64))
+            )
+
+
+def free_memory():
+    """
+    90% of free GPU memory, MB, None if unknown
+    """
+    free = cuda.current_context().get_memory_info()[0]
+    return free * 0.9 / MB if math.isfinite(free) else None
+
+
+def simulate(timeseries, windows, params, moving_average_type, max_memory=None):
+    """
+    Balances of cross_sim for every pair of windows, every STEP candles
+
+    Simple moving averages are calculated from prefix sums where cross_sim
+    reads them, exponential ones a tile of candles at a time. Results of a
+    tile are copied to the host after it. Tiles are as long as GPU memory
+    within max_memory allows.
+
+    :param timeseries: array of timestamp, open, high, low, close, volume rows
+    :param windows: window sizes
+    :param params: pairs of indices in windows, short and long
+    :param moving_average_type: simple or exponential
+    :param max_memory: MB of GPU memory, 90% of free memory if None
+    """
+    timeseries = np.ascontiguousarray(timeseries, dtype=np.float64)
+    windows = np.ascontiguousarray(windows, dtype=np.int64)
+    params = np.ascontiguousarray(params, dtype=np.int64)
+    candles = timeseries.shape[0]
+    rows = tile_rows(
+        candles,
+        windows.shape[0],
+        params.shape[0],
+        moving_average_type,
+        free_memory() if max_memory is None else max_memory,
+        True
+        )
+
+    # copy data to GPU memmory
+    ohlcv_gpu = cuda.to_device(timeseries)
+    windows_gpu = cuda.to_device(windows)
+    params_gpu = cuda.to_device(params)
+    # define space in GPU memmory for calculations and results
+    balances_gpu = cuda.device_array(shape=(params.shape[0], 2), dtype=np.float64)
+    crosses_gpu = cuda.device_array(shape=params.shape[0], dtype=np.int64)
+    result_gpu = cuda.device_array(shape=(params.shape[0], rows // STEP + 2), dtype=np.float64)
+    result_tile = np.zeros(result_gpu.shape, dtype=np.float64)
+    result = np.zeros((params.shape[0], result_columns(candles)), dtype=np.float64)
+    if moving_average_type == 'simple':
+        prefix, compensation = compensated_prefix_sums(timeseries)
+        prefix_gpu = cuda.to_device(prefix)
+        compensation_gpu = cuda.to_device(compensation)
+        moving_averages_gpu = cuda.device_array(shape=(0, 0), dtype=np.float64)
+    else:
+        prefix_gpu = compensation_gpu = cuda.device_array(shape=0, dtype=np.float64)
+        moving_averages_gpu = cuda.device_array(shape=(rows + 2 * MOD_N, windows.shape[0]), dtype=np.float64)
+        scan_gpu = cuda.to_device(np.zeros(windows.shape[0]))
+        since_resync_gpu = cuda.to_device(np.full(windows.shape[0], RESYNC_INTERVAL, dtype=np.int64))
+    # moving averages are calculated up to row computed, rows
+    # computed_first..computed - 1 are in moving_averages_gpu
+    computed = computed_first = first_moving_average_row()
+
+    threads_per_block_1 = 32
+    blocks_per_grid_1 = cuda_blocks_per_grid(windows.shape[0], threads_per_block_1)
+
+    threads_per_block_2 = 64
+    blocks_per_grid_2 = cuda_blocks_per_grid(params.shape[0], threads_per_block_2)
+
+    for t_start, t_end, ma_first in tiles(candles, rows):
+        if moving_average_type != 'simple':
+            # rows of the last tile this one reads go to the front
+            keep = computed - ma_first
+            if keep > 0:
+                moving_averages_gpu[:keep].copy_to_device(
+                    moving_averages_gpu[computed - computed_first - keep:computed - computed_first].copy_to_host()
+                    )
+            # calc moving averages of the tile
+            exponential_moving_average_kernel[blocks_per_grid_1, threads_per_block_1](
+                ohlcv_gpu,
+                windows_gpu,
+                moving_averages_gpu,
+                keep,
+                computed,
+                t_end - computed,
+                scan_gpu,
+                since_resync_gpu
+                )
+            computed_first = ma_first
+            computed = t_end
+
+        columns_first, columns_end = tile_columns(candles, t_start, t_end)
+
+        # simulate algorithm
+        cross_sim[blocks_per_grid_2, threads_per_block_2](
+            ohlcv_gpu,
+            prefix_gpu,
+            compensation_gpu,
+            windows_gpu,
+            moving_averages_gpu,
+            ma_first,
+            params_gpu,
+            t_start,
+            t_end,
+            balances_gpu,
+            crosses_gpu,
+            result_gpu,
+            columns_first
+            )
+
+        # get results from GPU memmory
+        result_gpu.copy_to_host(result_tile)
+        result[:, columns_first:columns_end] = result_tile[:, :columns_end - columns_first]
+
+    return result
@@ -1,23 +1,19 @@
 import os
 import json
+import multiprocessing
 import numpy as np
 import pandas as pd
 import pymongo
 
-import math
-from numba import cuda, float32, int32, jit
+from constants import *
+from backends import load_backend
+from checkpoint import Checkpoint
+from search import search
+from tiling import written_columns
+from results_store import METRICS, write_results
+from walk_forward import walk_forward
 
 
-OHLCV_TIMESTAMP = 0
-OHLCV_OPEN = 1
-OHLCV_HIGH = 2
-OHLCV_LOW = 3
-OHLCV_CLOSE = 4
-OHLCV_VOLUME = 5
-
-MAX_WINDOW_SIZE = 200 * 24 * 60
-STEP = 24 * 60
-
 mongo_username = os.environ.get("MONGO_USERNAME")
 mongo_password = os.environ.get("MONGO_PASSWORD")
 
@@ -26,116 +22,6 @@ mongo_client = pymongo.MongoClient(
 mongo_db = mongo_client["trading"]
 
 
-def cuda_blocks_per_grid(length, threads_per_block):
-    return math.ceil(length / threads_per_block)
-
-
-def cuda_blocks_per_grid_2d(shape, threads_per_block_2d):
-    return (int(math.ceil(shape[0] / threads_per_block_2d[0])),
-            int(math.ceil(shape[1] / threads_per_block_2d[1])))
-
-
-@cuda.jit('void(float64[:,:], int64[:], float64[:,:])')
-def moving_average_kernel_2d(ohlcv, window_size, out):
-    """
-    Calculate the moving average for the given data.
-    https://en.wikipedia.org/wiki/Moving_average
-
-    :param ohlcv: link to GPU memory with array of timestamp, Open, High, Low, Close, Volume
-    :param window_size: window size
-    :param out: link to GPU memory for result
-    """
-    thread_x, thread_y = cuda.grid(2)
-
-    n = min(window_size[thread_y], thread_x)
-    res = 0.0
-    
-    if (thread_x < ohlcv.shape[0]) and (thread_y < window_size.shape[0]) and (n > 0):
-        for i in range(1 - n, 1):
-            res += ohlcv[thread_x + i, OHLCV_CLOSE]
-        out[thread_x, thread_y] = res / n
-
-
-@cuda.jit('void(float64[:,:], int64[:], float64[:,:])')
-def exponential_moving_average_kernel_2d(ohlcv, window_size, out):
-    """
-    Calculate the exponential moving average for the given data.
-    https://en.wikipedia.org/wiki/Moving_average
-
-    :param ohlcv: link to GPU memory with array of timestamp, Open, High, Low, Close, Volume
-    :param window_size: window size
-    :param out: link to GPU memory for result
-    """
-    thread_x, thread_y = cuda.grid(2)
-    
-    n = min(window_size[thread_y], thread_x)
-    k = 2.0 / (n + 1.0)
-    res = 0.0
-
-    if (thread_x < ohlcv.shape[0]) and (thread_y < window_size.shape[0]) and (n > 0):
-        res = ohlcv[thread_x - n, OHLCV_CLOSE]
-
-        for i in range(1 - n, 1):
-            res = ohlcv[thread_x + i, OHLCV_CLOSE] * k + res * (1.0 - k)
-    
-        out[thread_x, thread_y] = res
-
-
-@cuda.jit('void(float64[:,:], float64[:,:], int64[:,:], float64[:,:])')
-def cross_sim(ohlcv, ma, algo_params, result):
-    # params initialization
-    pos = cuda.grid(1)
-    balance_btc = 1.0
-    balance_usdt = 0.0
-    base_t = MAX_WINDOW_SIZE
-    mod_n = 3
-    prev_t = base_t
-    
-    if pos < algo_params.shape[0]:
-        result[pos, 0] = balance_btc * ohlcv[base_t, OHLCV_CLOSE] + balance_usdt
-        res_t = 1
-
-        window_short = algo_params[pos, 0]
-        window_long = algo_params[pos, 1]
-
-        prev_cross_temp = 0
-        for i in range(0, mod_n):
-            temp_1 = ma[base_t - i, window_short] - ma[base_t - i, window_long]
-            if temp_1 > 0:
-                prev_cross_temp += 1
-            elif temp_1 < 0:
-                prev_cross_temp -= 1
-
-        for t in range(base_t + mod_n + 1, ohlcv.shape[0] - 1):
-            #algorithm logic
-            cross_temp = 0
-            for i in range(0, mod_n):
-                #filter
-                temp_1 = ma[t - i, window_short] - ma[t - i, window_long]
-                if temp_1 > 0:
-                    cross_temp += 1
-                elif temp_1 < 0:
-                    cross_temp -= 1
-            
-            if (prev_cross_temp > 0) and (cross_temp < 0) and (balance_btc > 0.0):
-                # sell
-                balance_usdt = balance_btc * ohlcv[t + 1, OHLCV_OPEN] * (1.0 - 0.002)
-                balance_btc = 0.0
-                
-            if (prev_cross_temp < 0) and (cross_temp > 0) and (balance_usdt > 0.0):
-                # buy
-                balance_btc = balance_usdt / ohlcv[t + 1, OHLCV_OPEN] * (1.0 - 0.002)
-                balance_usdt = 0.0
-
-            prev_cross_temp = cross_temp
-
-            # save results
-            if t - prev_t == STEP:
-                result[pos, res_t] = balance_btc * ohlcv[t, OHLCV_CLOSE] + balance_usdt
-                res_t += 1
-                prev_t = t
-
-
 def load_timeseries(exchange_name, symbol, period):
     """
     Load timeseries from mongodb
@@ -155,84 +41,171 @@ def load_config():
     with open('config.json') as json_file:
         json_data = json.load(json_file)
         exchange_name = json_data.get("exchange") # name from ccxt library
-        symbol = json_data.get("symbol") # format - BTC/USDT
+        symbols = json_data.get("symbols") or [json_data.get("symbol")] # format - BTC/USDT, each one is optimized
         period = json_data.get("period") # format - 1m, 1d,...  
         
         moving_average_type = json_data.get("moving_average_type")
         db_result_name = json_data.get("db_result_name")
+        backend = json_data.get("backend") or "auto" # auto, cuda or cpu
+        max_memory = json_data.get("max_memory") # MB, free GPU memory or no limit on CPU if null
+        results_dir = json_data.get("results_dir") or "results" # directory of npz result artifacts
+        checkpoint_pairs = json_data.get("checkpoint_pairs") # pairs of a checkpointed chunk, no checkpoints if null
 
-        return exchange_name, symbol, period, moving_average_type, db_result_name
+        return exchange_name, symbols, period, moving_average_type, db_result_name, backend, max_memory, results_dir, checkpoint_pairs
         
 
-def write_results_to_db(db_result_name, params, result):
+def load_search_config():
+    """
+    Load window grid and search params from config file
+    """
+    with open('config.json') as json_file:
+        json_data = json.load(json_file)
+        window_short = np.array(
+            json_data.get("windows_short") or [5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980],
+            dtype=np.int64
+            )
+        # start, stop and count of linspace
+        windows_long = json_data.get("windows_long") or {"start": STEP, "stop": MAX_WINDOW_SIZE, "count": 200}
+        windows_long = np.linspace(windows_long["start"], windows_long["stop"], windows_long["count"], endpoint=True, dtype=np.int64)
+        windows = np.unique(np.concatenate((window_short, windows_long), axis=0))
+        if windows[-1] > MAX_WINDOW_SIZE:
+            raise ValueError("Window " + str(windows[-1]) + " is longer than max_window_size " + str(MAX_WINDOW_SIZE))
+
+        # method (exhaustive, halving or tpe) and its params
+        search_config = json_data.get("search") or {"method": "exhaustive"}
+        # train_steps, test_steps and processes, no walk-forward if null
+        walk_forward_config = json_data.get("walk_forward")
+
+        return windows, search_config, walk_forward_config
+
+
+def write_walk_forward_to_db(db_result_name, symbol, timeseries, results, timestamps, equity):
     """
-    write results to mongodb
+    write folds and stitched out-of-sample equity of symbol to mongodb
     """
     db_res = [{
-        "window_1": params[i, 0],
-        "window_2": params[i, 1],
-        "result": list(result[i,:])
-        } for i in range(result.shape[0])]
-    mongo_db[db_result_name].insert_many(db_res)
-
+        "symbol": symbol,
+        "fold": i,
+        "train_start": timeseries[res["train_start"], OHLCV_TIMESTAMP],
+        "test_start": timeseries[res["test_start"], OHLCV_TIMESTAMP],
+        "test_end": timeseries[res["test_end"], OHLCV_TIMESTAMP],
+        "window_1": res["window_1"],
+        "window_2": res["window_2"],
+        "train_return": res["train_return"],
+        "test_timestamps": list(res["test_timestamps"]),
+        "test_equity": list(res["test_equity"])
+        } for i, res in enumerate(results)]
+    db_res += [{
+        "symbol": symbol,
+        "fold": "stitched",
+        "timestamps": list(timestamps),
+        "equity": list(equity)
+        }]
+    mongo_db[db_result_name + "_walk_forward"].insert_many(db_res)
+
+
+def write_results_to_db(db_result_name, results_dir, run, timeseries, windows_out, result):
+    """
+    write results to an npz artifact and its index document to mongodb
+    """
+    columns = written_columns(timeseries.shape[0])
+    timestamps = timeseries[MAX_WINDOW_SIZE::STEP, OHLCV_TIMESTAMP][:columns]
+    artifact = db_result_name + "_" + run["symbol"].replace("/", "-") + "_" + str(int(timestamps[-1])) + ".npz"
+    values = write_results(os.path.join(results_dir, artifact), windows_out, result[:, :columns], timestamps)
+
+    index = dict(run)
+    index.update({
+        "artifact": artifact,
+        "pairs": result.shape[0],
+        "columns": columns,
+        "first_timestamp": timestamps[0],
+        "last_timestamp": timestamps[-1],
+        "metrics": METRICS
+        })
+    # best pair of every metric, lowest drawdown
+    index["best"] = {}
+    for name in METRICS:
+        value = -values[name] if name == "max_drawdown" else values[name]
+        i = int(np.nanargmax(value))
+        index["best"][name] = {
+            "window_1": int(windows_out[i, 0]),
+            "window_2": int(windows_out[i, 1]),
+            "value": float(values[name][i])
+            }
+    mongo_db[db_result_name].insert_one(index)
+
+
+def optimize(run, simulate, timeseries, windows, search_config, max_memory, db_result_name, results_dir):
+    """
+    Search windows of one symbol and write its results
+    """
+    np_params, result, evaluated = search(
+        search_config,
+        simulate,
+        timeseries,
+        windows,
+        run["moving_average_type"],
+        max_memory
+        )
+    print(run["symbol"] + ", parameter-candles simulated: " + str(evaluated))
 
-def main():
-    
-    window_short = np.array([5, 10, 15, 30, 45, 60, 90, 120, 150, 180, 210, 240, 300, 330, 360, 390, 420, 480, 540, 600, 720, 980], dtype=np.int64)
-    windows_long = np.linspace(STEP, MAX_WINDOW_SIZE, 200, endpoint=True, dtype=np.int64)
-    #window_short = np.linspace(360, 540, 18, endpoint=True, dtype=np.int64)
-    #windows_long = np.linspace(55000, 57000, 100, endpoint=True, dtype=np.int64)
-    windows = np.concatenate((window_short, windows_long), axis=0)
-
-    # prepare params
-    params = []
-    for i in range(windows.shape[0]):
-        for j in range(i + 1, windows.shape[0]):
-            params += [[i, j]]
-    np_params = np.array(params, dtype=np.int64)
-    
-    #print(windows)
-    #print(np_params.shape[0])
-
-    exchange_name, symbol, period, moving_average_type, db_result_name = load_config()
-    #ts = load_timeseries(exchange_name, symbol, period)
-    timeseries = load_timeseries(exchange_name, symbol, period)#ts[ts[:, 0].argsort()]
-    #print(timeseries)
-    #print(timeseries[MAX_WINDOW_SIZE,:])
-
-    # copy data to GPU memmory
-    ohlcv_gpu = cuda.to_device(timeseries)
-    windows_gpu = cuda.to_device(windows)
-    params_gpu = cuda.to_device(params)
-    # define space in GPU memmory for calculations and results
-    
-    moving_averages_gpu = cuda.device_array(shape=(timeseries.shape[0], windows.shape[0]), dtype=np.float64)
-    #result_gpu = cuda.device_array(shape=np_params.shape[0], dtype=np.float64)
-    result_gpu = cuda.device_array(shape=(np_params.shape[0], (timeseries.shape[0] - MAX_WINDOW_SIZE) // STEP + 1), dtype=np.float64)
-    
-    threads_per_block_1 = (8, 8)
-    blocks_per_grid_1 = cuda_blocks_per_grid_2d((timeseries.shape[0], windows.shape[0]), threads_per_block_1)
+    windows_out = np.array([[windows[i[0]], windows[i[1]]] for i in np_params], dtype=np.float64)
+    write_results_to_db(db_result_name, results_dir, dict(run, evaluated=int(evaluated)), timeseries, windows_out, result)
 
-    threads_per_block_2 = 64
-    blocks_per_grid_2 = cuda_blocks_per_grid(np_params.shape[0], threads_per_block_2)
 
-    # calc all moving averages
-    
-    if moving_average_type == 'simple':
-        moving_average_kernel_2d[blocks_per_grid_1, threads_per_block_1](ohlcv_gpu, windows_gpu, moving_averages_gpu)
-    else:
-        exponential_moving_average_kernel_2d[blocks_per_grid_1, threads_per_block_1](ohlcv_gpu, windows_gpu, moving_averages_gpu)
-    
-    # simulate algorithm
-    cross_sim[blocks_per_grid_2, threads_per_block_2](ohlcv_gpu, moving_averages_gpu, params_gpu, result_gpu)
+def main():
     
-    # get results from GPU memmory
-    result = np.array(result_gpu.copy_to_host())
-    #print(result)
-    #print(result.shape)
+    windows, search_config, walk_forward_config = load_search_config()
     
-    windows_out = np.array([[windows[i[0]], windows[i[1]]] for i in np_params], dtype=np.float64)
-    write_results_to_db(db_result_name, windows_out, result)
+    exchange_name, symbols, period, moving_average_type, db_result_name, backend, max_memory, results_dir, checkpoint_pairs = load_config()
+    run = {
+        "exchange": exchange_name,
+        "period": period,
+        "moving_average_type": moving_average_type,
+        "search": search_config,
+        "max_window_size": MAX_WINDOW_SIZE,
+        "step": STEP,
+        "mod_n": MOD_N,
+        "fee": FEE
+        }
+
+    if not(walk_forward_config is None):
+        walk_forward_config = dict(walk_forward_config)
+        processes = walk_forward_config.pop("processes", None) or multiprocessing.cpu_count()
+        # one pool for every symbol, its processes compile kernels once
+        pool = None if processes == 1 else multiprocessing.get_context('spawn').Pool(processes)
+        try:
+            for symbol in symbols:
+                timeseries = load_timeseries(exchange_name, symbol, period)
+                results, timestamps, equity = walk_forward(
+                    timeseries,
+                    windows,
+                    moving_average_type,
+                    search_config,
+                    backend,
+                    max_memory,
+                    processes=processes,
+                    pool=pool,
+                    **walk_forward_config
+                    )
+                write_walk_forward_to_db(db_result_name, symbol, timeseries, results, timestamps, equity)
+        finally:
+            if not(pool is None):
+                pool.close()
+                pool.join()
+        return
+
+    # kernels are compiled once for every symbol
+    simulate = load_backend(backend).simulate
+    for symbol in symbols:
+        timeseries = load_timeseries(exchange_name, symbol, period)
+        if checkpoint_pairs is None:
+            optimize(dict(run, symbol=symbol), simulate, timeseries, windows, search_config, max_memory, db_result_name, results_dir)
+            continue
+        # chunks done by a run that died are not simulated again
+        checkpoint = Checkpoint(simulate, os.path.join(results_dir, "checkpoints"), checkpoint_pairs)
+        optimize(dict(run, symbol=symbol), checkpoint, timeseries, windows, search_config, max_memory, db_result_name, results_dir)
+        checkpoint.clear()
     
 
 if __name__ == '__main__':
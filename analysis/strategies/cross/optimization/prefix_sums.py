@@ -0,0 +1,37 @@
+import numpy as np
+from numba import njit
+from constants import *
+
+
+# scanned sums are recomputed from the closes after this many candles
+RESYNC_INTERVAL = 65536
+
+
+@njit
+def compensated_prefix_sums(ohlcv):
+    """
+    Prefix sums of closes in one pass with Neumaier summation
+
+    prefix[i] + compensation[i] is the sum of closes 0..i-1, so the sum of
+    closes x - n + 1..x is (prefix[x + 1] - prefix[x + 1 - n]) +
+    (compensation[x + 1] - compensation[x + 1 - n]): the two totals are
+    close and subtract almost exactly, the compensations keep the bits the
+    totals lose over millions of candles.
+
+    :param ohlcv: array of timestamp, Open, High, Low, Close, Volume
+    """
+    prefix = np.zeros(ohlcv.shape[0] + 1)
+    compensation = np.zeros(ohlcv.shape[0] + 1)
+    total = 0.0
+    comp = 0.0
+    for i in range(ohlcv.shape[0]):
+        value = ohlcv[i, OHLCV_CLOSE]
+        res = total + value
+        if abs(total) >= abs(value):
+            comp += (total - res) + value
+        else:
+            comp += (value - res) + total
+        total = res
+        prefix[i + 1] = total
+        compensation[i + 1] = comp
+    return prefix, compensation
@@ -0,0 +1,125 @@
+"""
+Columnar store of optimizer results
+
+Results of a run are written to one compressed npz artifact: windows of
+every pair, timestamps of result columns, summary metrics of every pair
+and the result matrix in blocks of BLOCK_ROWS pairs. Members of an npz
+are read on demand, so a reader loads metrics without the matrix and
+only the blocks of the pairs it plots.
+
+Metrics are computed on result blocks at write time:
+total return, min, max, average and standard deviation of the monthly
+rate of change, max drawdown and Sharpe ratio of returns between result
+columns, annualized. Months and years are counted in result columns from
+their timestamps, STEP and the period of candles are set in config.
+"""
+import os
+import numpy as np
+
+
+BLOCK_ROWS = 1024
+MONTH_DAYS = 30
+YEAR_DAYS = 365
+DAY = 24 * 60 * 60 * 1000
+
+METRICS = ["total", "min", "max", "average", "std", "max_drawdown", "sharpe"]
+
+
+def day_columns(timestamps):
+    """
+    Result columns per day, 1 if there is only one column
+    """
+    if timestamps.shape[0] < 2:
+        return 1.0
+    return DAY / (timestamps[1] - timestamps[0])
+
+
+def metrics(result, columns_per_day=1.0):
+    """
+    Summary metrics of every row of result
+
+    :param columns_per_day: result columns per day, see day_columns
+    :returns: dict of metric name and its values per row
+    """
+    res = {"total": result[:, -1] / result[:, 0] - 1.0}
+
+    # rate of change of every month
+    month = max(1, int(round(MONTH_DAYS * columns_per_day)))
+    change = result[:, month::month] / result[:, :-month:month] - 1.0
+    if change.shape[1] > 0:
+        res["min"] = change.min(axis=1)
+        res["max"] = change.max(axis=1)
+        res["average"] = change.mean(axis=1)
+    else:
+        res["min"] = res["max"] = res["average"] = np.full(result.shape[0], np.nan)
+    res["std"] = change.std(axis=1, ddof=1) if change.shape[1] > 1 else np.full(result.shape[0], np.nan)
+
+    peak = np.maximum.accumulate(result, axis=1)
+    res["max_drawdown"] = (1.0 - result / peak).max(axis=1)
+
+    # returns of a column, annualized
+    returns = result[:, 1:] / result[:, :-1] - 1.0
+    if returns.shape[1] > 1:
+        deviation = returns.std(axis=1, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res["sharpe"] = np.where(
+                deviation > 0,
+                returns.mean(axis=1) / deviation * np.sqrt(YEAR_DAYS * columns_per_day),
+                np.nan
+                )
+    else:
+        res["sharpe"] = np.full(result.shape[0], np.nan)
+    return res
+
+
+def write_results(path, windows_out, result, timestamps):
+    """
+    Write results and their metrics to a compressed npz artifact
+
+    :param windows_out: short and long window of every row of result
+    :param timestamps: timestamp of every column of result
+    :returns: metrics of every row
+    """
+    values = {name: np.zeros(result.shape[0], dtype=np.float64) for name in METRICS}
+    columns_per_day = day_columns(np.asarray(timestamps, dtype=np.float64))
+    blocks = {}
+    for i, start in enumerate(range(0, result.shape[0], BLOCK_ROWS)):
+        block = np.ascontiguousarray(result[start:start + BLOCK_ROWS])
+        for name, value in metrics(block, columns_per_day).items():
+            values[name][start:start + block.shape[0]] = value
+        blocks["result_" + str(i)] = block
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(
+        path,
+        window_1=np.asarray(windows_out[:, 0], dtype=np.int64),
+        window_2=np.asarray(windows_out[:, 1], dtype=np.int64),
+        timestamps=np.asarray(timestamps, dtype=np.float64),
+        **values,
+        **blocks
+        )
+    return values
+
+
+def load_metrics(path, names=None):
+    """
+    Windows and metrics of every pair, without the result matrix
+
+    :param names: metrics to load, all if None
+    """
+    with np.load(path) as artifact:
+        return {name: artifact[name] for name in ["window_1", "window_2"] + list(names or METRICS)}
+
+
+def load_rows(path, rows):
+    """
+    Result rows of an artifact, reading only blocks with them
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    with np.load(path) as artifact:
+        res = np.zeros((rows.shape[0], artifact["timestamps"].shape[0]), dtype=np.float64)
+        for block in np.unique(rows // BLOCK_ROWS):
+            selected = np.nonzero(rows // BLOCK_ROWS == block)[0]
+            res[selected] = artifact["result_" + str(block)][rows[selected] - block * BLOCK_ROWS]
+    return res
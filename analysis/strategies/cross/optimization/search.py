@@ -0,0 +1,159 @@
+import math
+import numpy as np
+from constants import *
+from tiling import written_columns
+
+
+def pairs(windows):
+    """
+    Every pair of windows, indices of the short and the long one
+    """
+    params = []
+    for i in range(windows.shape[0]):
+        for j in range(i + 1, windows.shape[0]):
+            params += [[i, j]]
+    return np.array(params, dtype=np.int64).reshape(-1, 2)
+
+
+def score(result, candles):
+    """
+    Total return of every pair of windows on candles candles
+    """
+    return result[:, written_columns(candles) - 1] / result[:, 0]
+
+
+def top(scores, k):
+    """
+    Indices of the k best scores, best first
+    """
+    return np.argsort(-scores, kind='stable')[:k]
+
+
+def exhaustive(simulate, timeseries, windows, params, moving_average_type, max_memory=None):
+    """
+    Every pair of windows on the whole history
+
+    :returns: params, their result and parameter-candles simulated
+    """
+    result = simulate(timeseries, windows, params, moving_average_type, max_memory)
+    return params, result, params.shape[0] * (timeseries.shape[0] - MAX_WINDOW_SIZE)
+
+
+def successive_halving(
+    simulate,
+    timeseries,
+    windows,
+    params,
+    moving_average_type,
+    max_memory=None,
+    keep=0.5,
+    first_steps=90,
+    top_k=10
+):
+    """
+    Pairs of windows are simulated on growing prefixes of the history,
+    the best keep fraction of each round, at least top_k, goes on to the
+    next one. The first prefix has first_steps STEP candles after
+    MAX_WINDOW_SIZE, every next one 1 / keep times more, the last one is
+    the whole history. A prefix of the history gives the same balances
+    as the whole one up to its end, so results of the last round are
+    those of the exhaustive run.
+
+    :returns: params of the last round, their result and parameter-candles
+        simulated
+    """
+    candles = timeseries.shape[0]
+    length = min(MAX_WINDOW_SIZE + first_steps * STEP, candles)
+    evaluated = 0
+    while True:
+        result = simulate(timeseries[:length], windows, params, moving_average_type, max_memory)
+        evaluated += params.shape[0] * (length - MAX_WINDOW_SIZE)
+        if length >= candles:
+            return params, result, evaluated
+        count = max(top_k, int(math.ceil(params.shape[0] * keep)))
+        params = params[np.sort(top(score(result, length), count))]
+        length = min(MAX_WINDOW_SIZE + int((length - MAX_WINDOW_SIZE) / keep), candles)
+
+
+def tpe(
+    simulate,
+    timeseries,
+    windows,
+    params,
+    moving_average_type,
+    max_memory=None,
+    trials=2000,
+    batch=256,
+    seed=0
+):
+    """
+    Tree-structured Parzen Estimator sampler of optuna over short and long
+    window. Trials are asked in batches and the pairs of a batch are
+    simulated at once on the whole history, a pair is simulated once.
+    Trials with equal windows fail.
+
+    :param params: pairs of windows the sampler may pick from
+    :returns: params simulated, their result and parameter-candles
+        simulated
+    """
+    try:
+        import optuna
+    except ImportError:
+        raise ImportError("tpe search needs optuna, pip install optuna")
+
+    candles = timeseries.shape[0]
+    allowed = set((int(i), int(j)) for i, j in params)
+    study = optuna.create_study(
+        direction='maximize',
+        sampler=optuna.samplers.TPESampler(seed=seed, multivariate=True)
+        )
+    scores = {}
+    results = {}
+    asked = 0
+    while asked < trials and len(results) < len(allowed):
+        batch_trials = [study.ask() for i in range(min(batch, trials - asked))]
+        asked += len(batch_trials)
+        batch_pairs = []
+        for trial in batch_trials:
+            i = trial.suggest_int('short', 0, windows.shape[0] - 1)
+            j = trial.suggest_int('long', 0, windows.shape[0] - 1)
+            pair = (min(i, j), max(i, j))
+            batch_pairs.append(pair)
+            if pair in allowed and not(pair in results):
+                results[pair] = None
+        new = [pair for pair in results if results[pair] is None]
+        if len(new) > 0:
+            result = simulate(timeseries, windows, np.array(new, dtype=np.int64), moving_average_type, max_memory)
+            for pair, row, value in zip(new, result, score(result, candles)):
+                results[pair] = row
+                scores[pair] = value
+        for trial, pair in zip(batch_trials, batch_pairs):
+            if pair in scores:
+                study.tell(trial, scores[pair])
+            else:
+                study.tell(trial, state=optuna.trial.TrialState.FAIL)
+    evaluated = list(results)
+    return np.array(evaluated, dtype=np.int64).reshape(-1, 2),\
+        np.array([results[pair] for pair in evaluated]),\
+        len(evaluated) * (candles - MAX_WINDOW_SIZE)
+
+
+searches = {
+    'exhaustive': exhaustive,
+    'halving': successive_halving,
+    'tpe': tpe
+    }
+
+
+def search(config, simulate, timeseries, windows, moving_average_type, max_memory=None):
+    """
+    Search of config over pairs of windows
+
+    :param config: search part of the config, method and its params
+    :returns: params simulated, their result and parameter-candles simulated
+    """
+    config = dict(config or {})
+    method = config.pop("method", "exhaustive")
+    if not(method in searches):
+        raise ValueError("Unknown search method: " + str(method))
+    return searches[method](simulate, timeseries, windows, pairs(windows), moving_average_type, max_memory, **config)
@@ -0,0 +1,108 @@
+import numpy as np
+from constants import *
+
+
+MB = 1024 * 1024
+
+
+def first_step():
+    """
+    First candle cross_sim steps on
+    """
+    return MAX_WINDOW_SIZE + MOD_N + 1
+
+
+def first_moving_average_row():
+    """
+    First row of moving averages cross_sim reads
+    """
+    return MAX_WINDOW_SIZE - MOD_N + 1
+
+
+def result_columns(candles):
+    return (candles - MAX_WINDOW_SIZE) // STEP + 1
+
+
+def written_columns(candles):
+    """
+    Result columns cross_sim saves, the last ones of result_columns may
+    stay unwritten
+    """
+    return tile_columns(candles, first_step(), max(first_step(), candles - 1))[1]
+
+
+def tile_columns(candles, t_start, t_end):
+    """
+    Result columns cross_sim saves on a tile, first and end
+    """
+    first = 0 if t_start == first_step() else (t_start - MAX_WINDOW_SIZE + STEP - 1) // STEP
+    end = min((t_end - 1 - MAX_WINDOW_SIZE) // STEP + 1, result_columns(candles))
+    return first, max(first, end)
+
+
+def working_memory(candles, windows, params, moving_average_type, rows, result_tiles):
+    """
+    Bytes taken by a simulation with tiles of rows candles
+
+    :param result_tiles: True if results of a tile are kept in a buffer of
+        the tile (GPU), False if they are written to the result (CPU)
+    """
+    res = candles * 6 * 8 + windows * 8 + params * 2 * 8
+    # balances and crosses
+    res += params * 3 * 8
+    if moving_average_type == 'simple':
+        # prefix sums and compensations
+        res += 2 * (candles + 1) * 8
+    else:
+        # scan state and a tile of moving averages
+        res += windows * 2 * 8 + (rows + 2 * MOD_N) * windows * 8
+    if result_tiles:
+        res += params * (rows // STEP + 2) * 8
+    return res
+
+
+def tile_rows(candles, windows, params, moving_average_type, max_memory=None, result_tiles=False):
+    """
+    Candles per tile for working memory within max_memory MB, all candles
+    in one tile if max_memory is None
+    """
+    steps = max(1, candles - 1 - first_step())
+    if max_memory is None:
+        return steps
+    budget = max_memory * MB
+    low = MOD_N
+    if working_memory(candles, windows, params, moving_average_type, low, result_tiles) > budget:
+        raise ValueError(
+            "max_memory " + str(max_memory) + " MB is too small, at least " +\
+            str(int(np.ceil(working_memory(candles, windows, params, moving_average_type, low, result_tiles) / MB))) +\
+            " MB are needed"
+            )
+    high = steps
+    while low < high:
+        middle = (low + high + 1) // 2
+        if working_memory(candles, windows, params, moving_average_type, middle, result_tiles) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def tiles(candles, rows):
+    """
+    (t_start, t_end, ma_first) of every tile: cross_sim steps on candles
+    t_start..t_end - 1 and reads moving averages of rows ma_first..t_end - 1.
+    The first tile initializes the simulation and is there even if there is
+    nothing to step on.
+    """
+    res = []
+    t_start = first_step()
+    ma_first = first_moving_average_row()
+    while True:
+        t_end = min(t_start + rows, candles - 1)
+        if t_end < t_start:
+            t_end = min(t_start, candles)
+        res.append((t_start, t_end, ma_first))
+        if t_end >= candles - 1:
+            return res
+        t_start = t_end
+        ma_first = t_start - MOD_N + 1
@@ -0,0 +1,155 @@
+"""
+Walk-forward validation of the cross MA optimizer
+
+The history is split into rolling folds: windows are optimized on a
+train part and the best pair is simulated on the test part right after
+it. Test parts follow each other, so their equity curves stitched
+together are the out-of-sample performance of optimizing as time goes.
+
+Folds run in processes of a pool. The candles are put once into shared
+memory and every process maps them, nothing is copied per fold.
+
+A simulation starts with 1 BTC at its first candle, as cross_sim does:
+every train and test part starts in the market, the position of the
+last test part is not carried over. The stitched curve chains returns
+of the test parts.
+"""
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from constants import *
+from tiling import written_columns
+from backends import load_backend
+from search import search, score, top
+
+
+def folds(candles, train_steps, test_steps):
+    """
+    (train_start, test_start, test_end) of rolling folds: windows are
+    optimized on candles train_start..test_start - 1 and the best pair is
+    simulated on test_start..test_end, both after MAX_WINDOW_SIZE candles
+    of history for moving averages. The last test part may be shorter.
+    """
+    res = []
+    test_start = MAX_WINDOW_SIZE + train_steps * STEP
+    # a test part saves its first result after STEP candles
+    while candles - 2 - test_start >= STEP:
+        test_end = min(test_start + test_steps * STEP, candles - 2)
+        res.append((test_start - train_steps * STEP, test_start, test_end))
+        test_start = test_end
+    return res
+
+
+def share(timeseries):
+    """
+    Shared memory with a copy of timeseries, its name, shape and dtype
+    """
+    memory = shared_memory.SharedMemory(create=True, size=timeseries.nbytes)
+    np.ndarray(timeseries.shape, dtype=timeseries.dtype, buffer=memory.buf)[:] = timeseries
+    return memory, (memory.name, timeseries.shape, timeseries.dtype.str)
+
+
+def run_fold(shared, fold, windows, moving_average_type, search_config, backend, max_memory):
+    """
+    Optimize windows on the train part of the fold, simulate the best
+    pair on its test part
+    """
+    name, shape, dtype = shared
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        timeseries = np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+        simulate = load_backend(backend).simulate
+        train_start, test_start, test_end = fold
+
+        train = timeseries[train_start - MAX_WINDOW_SIZE:test_start]
+        params, result, evaluated = search(search_config, simulate, train, windows, moving_average_type, max_memory)
+        scores = score(result, train.shape[0])
+        best = top(scores, 1)[0]
+
+        # the test part ends with the candle after test_end, where
+        # operations decided on test_end are filled
+        test = timeseries[test_start - MAX_WINDOW_SIZE:test_end + 2]
+        test_result = simulate(test, windows, params[best:best + 1], moving_average_type, max_memory)
+        columns = written_columns(test.shape[0])
+        res = {
+            "train_start": train_start,
+            "test_start": test_start,
+            "test_end": test_end,
+            "window_1": int(windows[params[best, 0]]),
+            "window_2": int(windows[params[best, 1]]),
+            "train_return": float(scores[best] - 1.0),
+            "test_timestamps": timeseries[test_start:test_end + 1:STEP, OHLCV_TIMESTAMP][:columns].copy(),
+            "test_equity": test_result[0, :columns],
+            "evaluated": evaluated
+            }
+        del timeseries, train, test
+        return res
+    finally:
+        memory.close()
+
+
+def stitch(results):
+    """
+    Out-of-sample equity of the test parts chained, 1.0 at the first one
+    """
+    timestamps = [results[0]["test_timestamps"][:1]]
+    equity = [np.ones(1)]
+    for res in results:
+        values = res["test_equity"] / res["test_equity"][0] * equity[-1][-1]
+        timestamps.append(res["test_timestamps"][1:])
+        equity.append(values[1:])
+    return np.concatenate(timestamps), np.concatenate(equity)
+
+
+def walk_forward(
+    timeseries,
+    windows,
+    moving_average_type,
+    search_config=None,
+    backend="cpu",
+    max_memory=None,
+    train_steps=365,
+    test_steps=90,
+    processes=None,
+    pool=None
+):
+    """
+    Walk-forward validation over the history
+
+    :param train_steps: STEP candles of a train part
+    :param test_steps: STEP candles of a test part
+    :param max_memory: MB per process, on the GPU free memory is split
+        between processes if None
+    :param processes: processes of the pool, cores if None, folds run in
+        this process if 1
+    :param pool: spawn pool of processes to run folds in, a new one if
+        None, its processes keep compiled kernels between calls
+    :returns: results of folds, timestamps and stitched out-of-sample equity
+    """
+    timeseries = np.ascontiguousarray(timeseries, dtype=np.float64)
+    processes = processes or multiprocessing.cpu_count()
+    backend_module = load_backend(backend)
+    if max_memory is None and processes > 1 and backend_module.__name__ == "cuda_backend":
+        max_memory = backend_module.free_memory()
+        max_memory = None if max_memory is None else max_memory / processes
+    fold_list = folds(timeseries.shape[0], train_steps, test_steps)
+    if len(fold_list) == 0:
+        raise ValueError("History is too short for a fold of " + str(train_steps) + " train steps")
+    memory, shared = share(timeseries)
+    try:
+        tasks = [
+            (shared, fold, windows, moving_average_type, search_config, backend, max_memory)\
+                for fold in fold_list
+            ]
+        if not(pool is None):
+            results = pool.starmap(run_fold, tasks)
+        elif processes == 1:
+            results = [run_fold(*task) for task in tasks]
+        else:
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                results = pool.starmap(run_fold, tasks)
+    finally:
+        memory.close()
+        memory.unlink()
+    timestamps, equity = stitch(results)
+    return results, timestamps, equity